@@ -0,0 +1,52 @@
+"""Compares the memory used per node and the type checking time of the
+dataclass AST and the arena AST. The tree is type checked twice: the
+arena's views are made in the first check and kept for the second.
+
+Run with `poetry run python benchmarks/arena_benchmark.py [size]`.
+"""
+import sys
+import time
+import tracemalloc
+from typing import Callable
+from programs import generate_program, format_size
+from compiler.tokenizer import tokenize_buffer
+from compiler.parser import parse
+from compiler.arena import parse_arena
+from compiler.type_checker import typecheck
+import compiler.ast as ast
+
+def measure(name: str, parser: Callable[[], tuple[ast.Expression, int]]) -> None:
+    tracemalloc.start()
+    start = time.perf_counter()
+    root, nodes = parser()
+    parse_time = time.perf_counter() - start
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    times = []
+    for _ in range(2):
+        start = time.perf_counter()
+        typecheck(root)
+        times.append(time.perf_counter() - start)
+    print(f"{name:>10} {nodes:>10} {size / nodes:>11.1f} {parse_time:>10.3f} {times[0]:>10.3f} {times[1]:>10.3f}")
+
+def main() -> None:
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    sys.setrecursionlimit(100_000)
+    source_code = generate_program(size)
+    tokens = tokenize_buffer(source_code)
+    arena, root = parse_arena(tokens)
+    print(f"source: {format_size(size)}")
+    print(f"{'':>10} {'nodes':>10} {'bytes/node':>11} {'parse s':>10} {'check s':>10} {'recheck s':>10}")
+
+    def dataclasses() -> tuple[ast.Expression, int]:
+        return parse(tokens), len(arena)
+
+    def arena_nodes() -> tuple[ast.Expression, int]:
+        arena, root = parse_arena(tokens)
+        return arena.view(root), len(arena)
+
+    measure("dataclass", dataclasses)
+    measure("arena", arena_nodes)
+
+if __name__ == '__main__':
+    main()
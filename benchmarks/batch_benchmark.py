@@ -0,0 +1,79 @@
+"""Compares running one program for many rows of input in a batch with
+compiler.batch, with running it for each row on the bytecode VM, as a
+native executable and as machine code in this process with
+compiler.native.
+
+Run with `poetry run python benchmarks/batch_benchmark.py [rows]`. It
+needs NumPy, and the native runs need the assembler and linker.
+"""
+import io
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from compiler.__main__ import call_compiler, call_native_compiler
+from compiler.batch import run_batch
+from compiler.parser import parse
+from compiler.tokenizer import tokenize
+from compiler.type_checker import typecheck
+from compiler import vm
+
+source = """
+var n = read_int();
+var steps = 0;
+while n > 1 do {
+    if n % 2 == 0 then n = n / 2 else n = 3 * n + 1;
+    steps = steps + 1
+};
+steps
+"""
+
+def main() -> None:
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    random.seed(0)
+    inputs = [[random.randint(1, 10_000)] for _ in range(rows)]
+    tree = parse(tokenize(source))
+    typecheck(tree)
+
+    start = time.perf_counter()
+    outputs = [lane.output for lane in run_batch(tree, inputs)]
+    batch_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    program = vm.compile_program(tree)
+    for row, expected in zip(inputs, outputs):
+        output = io.StringIO()
+        vm.run(program, io.StringIO(f"{row[0]}\n"), output)
+        assert output.getvalue() == expected
+    vm_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "program")
+        with open(path, 'wb') as f:
+            f.write(call_compiler(source, "program"))
+        os.chmod(path, 0o755)
+        for row, expected in zip(inputs, outputs):
+            result = subprocess.run([path], input=f"{row[0]}\n", capture_output=True, text=True)
+            assert result.stdout == expected
+    native_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    native_program = call_native_compiler(source, "program")
+    for row, expected in zip(inputs, outputs):
+        output = io.StringIO()
+        native_program.run(io.StringIO(f"{row[0]}\n"), output)
+        assert output.getvalue() == expected
+    native_program.close()
+    in_process_time = time.perf_counter() - start
+
+    print(f"{rows} rows")
+    print(f"{'batch':>10} {batch_time:>7.3f} s")
+    print(f"{'vm':>10} {vm_time:>7.3f} s")
+    print(f"{'native':>10} {native_time:>7.3f} s")
+    print(f"{'in process':>10} {in_process_time:>7.3f} s")
+
+if __name__ == '__main__':
+    main()
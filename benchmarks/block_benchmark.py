@@ -0,0 +1,24 @@
+"""Measures parsing time of blocks with a growing number of statements.
+
+Run with `poetry run python benchmarks/block_benchmark.py [count ...]`.
+If block parsing is linear, the time per statement stays flat.
+"""
+import sys
+import time
+from compiler.tokenizer import tokenize
+from compiler.parser import parse
+
+default_counts = [1_000, 10_000, 100_000]
+
+def main() -> None:
+    counts = [int(arg) for arg in sys.argv[1:]] or default_counts
+    print(f"{'statements':>10} {'seconds':>10} {'us/statement':>13}")
+    for count in counts:
+        tokens = tokenize("{ var x = 0; " + "x = f(x, 1, x); " * count + "x }")
+        start = time.perf_counter()
+        parse(tokens)
+        elapsed = time.perf_counter() - start
+        print(f"{count:>10} {elapsed:>10.3f} {elapsed / count * 1e6:>13.2f}")
+
+if __name__ == '__main__':
+    main()
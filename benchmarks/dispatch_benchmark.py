@@ -0,0 +1,76 @@
+"""Measures the cost of dispatching on the class of an AST node with a
+`match` statement, which tests the cases in order, and with an
+`ast.Dispatch` table, which is one dict lookup.
+
+Run with `poetry run python benchmarks/dispatch_benchmark.py [count]`.
+The cases are in the order the type checker used to test them, so the
+time of `match` grows down the table while the table's stays flat.
+"""
+import sys
+import time
+from typing import Callable
+from compiler.tokenizer import L
+import compiler.ast as ast
+
+nodes: list[ast.Expression] = [
+    ast.Literal(L, 1),
+    ast.Continue(L),
+    ast.Break(L),
+    ast.Identifier(L, "x"),
+    ast.VariableDeclaration(L, ast.Identifier(L, "x")),
+    ast.BinaryOp(L, ast.Literal(L, 1), "+", ast.Literal(L, 2)),
+    ast.UnaryOp(L, "-", ast.Literal(L, 1)),
+    ast.FunctionCall(L, ast.Identifier(L, "f"), []),
+    ast.Block(L, [], ast.Literal(L, 1)),
+    ast.Conditional(L, "if", ast.Literal(L, True), ast.Literal(L, 1)),
+]
+
+def by_match(node: ast.Expression) -> int:
+    match node:
+        case ast.Literal():
+            return 0
+        case ast.Continue():
+            return 1
+        case ast.Break():
+            return 2
+        case ast.Identifier():
+            return 3
+        case ast.VariableDeclaration():
+            return 4
+        case ast.BinaryOp():
+            return 5
+        case ast.UnaryOp():
+            return 6
+        case ast.FunctionCall():
+            return 7
+        case ast.Block():
+            return 8
+        case ast.Conditional():
+            return 9
+        case _:
+            return -1
+
+def handler(i: int) -> Callable[[ast.Expression], int]:
+    return lambda node: i
+
+handlers = ast.Dispatch({type(node): handler(i) for i, node in enumerate(nodes)}, handler(-1))
+
+def by_table(node: ast.Expression) -> int:
+    return handlers[type(node)](node)
+
+def time_per_call(dispatch: Callable[[ast.Expression], int], node: ast.Expression, count: int) -> float:
+    start = time.perf_counter()
+    for _ in range(count):
+        dispatch(node)
+    return (time.perf_counter() - start) / count
+
+def main() -> None:
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    print(f"{'node':>20} {'match ns':>9} {'table ns':>9}")
+    for node in nodes:
+        match_time = time_per_call(by_match, node, count)
+        table_time = time_per_call(by_table, node, count)
+        print(f"{type(node).__name__:>20} {match_time * 1e9:>9.1f} {table_time * 1e9:>9.1f}")
+
+if __name__ == '__main__':
+    main()
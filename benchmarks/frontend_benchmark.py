@@ -0,0 +1,52 @@
+"""Compares the front end time of the two-pass pipeline, which type checks
+the tree before generating IR, with the fused pass that does both in one
+traversal.
+
+Run with `poetry run python benchmarks/frontend_benchmark.py [size ...]`.
+Times include tokenizing and parsing, the best of a few runs is shown.
+"""
+import sys
+import time
+from typing import Callable
+from programs import generate_program, format_size
+from compiler.tokenizer import tokenize_buffer
+from compiler.parser import parse
+from compiler.type_checker import typecheck
+from compiler.ir_generator import generate_ir
+from compiler.ir import IRVar
+from compiler.types import Bool, Int, Type, Unit
+import compiler.ast as ast
+
+default_sizes = [10_000, 100_000, 1_000_000]
+repeats = 3
+
+root_types: dict[IRVar, Type] = {IRVar(name): Int for name in ['+', '-', '*', '/', '%', 'unary_-', 'read_int']}
+root_types |= {IRVar(name): Bool for name in ['and', 'or', '==', '!=', '<', '<=', '>', '>=', 'unary_not']}
+root_types |= {IRVar('print_int'): Unit, IRVar('print_bool'): Unit}
+
+def two_pass(tree: ast.Expression) -> None:
+    typecheck(tree)
+    generate_ir(root_types, tree)
+
+def fused(tree: ast.Expression) -> None:
+    generate_ir(root_types, tree, typecheck=True)
+
+def best_time(source: str, back_end: Callable[[ast.Expression], None]) -> float:
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        back_end(parse(tokenize_buffer(source)))
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def main() -> None:
+    sizes = [int(arg) for arg in sys.argv[1:]] or default_sizes
+    print(f"{'source':>10} {'two-pass':>10} {'fused':>10} {'speedup':>8}")
+    for size in sizes:
+        source = generate_program(size)
+        two_pass_time = best_time(source, two_pass)
+        fused_time = best_time(source, fused)
+        print(f"{format_size(size):>10} {two_pass_time:>10.3f} {fused_time:>10.3f} {two_pass_time / fused_time:>8.2f}")
+
+if __name__ == '__main__':
+    main()
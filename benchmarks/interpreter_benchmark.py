@@ -0,0 +1,41 @@
+"""Compares the engines of the interpreter on loop-heavy programs:
+visiting the nodes with `evaluate`, running the closures made by
+`compile_closures` and running the Python code made by
+compiler.transpiler.
+
+Run with `poetry run python benchmarks/interpreter_benchmark.py [iterations]`.
+"""
+import sys
+import time
+from compiler.tokenizer import tokenize
+from compiler.parser import parse
+from compiler.interpreter import interpret, Value
+from compiler.type_checker import typecheck
+import compiler.ast as ast
+
+programs = {
+    "sum": "var i = 0; var s = 0; while i < {n} do {{ s = s + i; i = i + 1 }}; s",
+    "nested blocks": "var i = 0; var s = 0; while i < {n} do {{ var j = i % 7; {{ var k = j * 2; if k > 6 then s = s + k else s = s - 1 }}; i = i + 1 }}; s",
+    "collatz": "var i = 1; var steps = 0; while i < {n} / 50 do {{ var x = i; while x != 1 do {{ if x % 2 == 0 then x = x / 2 else x = 3 * x + 1; steps = steps + 1 }}; i = i + 1 }}; steps",
+}
+
+def timed(tree: ast.Expression, closures: bool, transpile: bool = False) -> tuple[Value, float]:
+    start = time.perf_counter()
+    value = interpret(tree, closures=closures, transpile=transpile)
+    return value, time.perf_counter() - start
+
+def main() -> None:
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    print(f"{'program':>14} {'visits s':>9} {'closures s':>11} {'speedup':>8} {'python s':>9} {'speedup':>8}")
+    for name, source in programs.items():
+        tree = parse(tokenize(source.format(n=n)))
+        typecheck(tree)
+        visited, visit_time = timed(tree, False)
+        compiled, closure_time = timed(tree, True)
+        transpiled, python_time = timed(tree, True, True)
+        assert visited == compiled == transpiled
+        print(f"{name:>14} {visit_time:>9.3f} {closure_time:>11.3f} {visit_time / closure_time:>8.1f}"
+              f" {python_time:>9.3f} {visit_time / python_time:>8.1f}")
+
+if __name__ == '__main__':
+    main()
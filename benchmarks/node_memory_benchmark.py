@@ -0,0 +1,72 @@
+"""Measures the memory used per AST node and IR instruction, and the time
+to type check and generate IR, on a large generated program.
+
+Run with `poetry run python benchmarks/node_memory_benchmark.py [size]`.
+"""
+import sys
+from dataclasses import fields
+import time
+import tracemalloc
+from typing import Callable, TypeVar
+from programs import generate_program, format_size
+from compiler.tokenizer import tokenize_buffer
+from compiler.parser import parse
+from compiler.type_checker import typecheck
+from compiler.ir_generator import generate_ir
+from compiler.ir import IRVar
+from compiler.types import Bool, Int, Type, Unit
+import compiler.ast as ast
+
+T = TypeVar("T")
+
+root_types: dict[IRVar, Type] = {IRVar(name): Int for name in ['+', '-', '*', '/', '%', 'unary_-', 'read_int']}
+root_types |= {IRVar(name): Bool for name in ['and', 'or', '==', '!=', '<', '<=', '>', '>=', 'unary_not']}
+root_types |= {IRVar('print_int'): Unit, IRVar('print_bool'): Unit}
+
+def count_nodes(root: ast.Expression) -> int:
+    count = 0
+    stack = [root]
+    while stack:
+        expr = stack.pop()
+        count += 1
+        for field in fields(expr):
+            value = getattr(expr, field.name)
+            if isinstance(value, ast.Expression):
+                stack.append(value)
+            elif isinstance(value, list):
+                stack.extend(item for item in value if isinstance(item, ast.Expression))
+    return count
+
+def traced(build: Callable[[], T]) -> tuple[T, int, float]:
+    """Returns the result of `build`, the bytes it kept allocated and the seconds it took."""
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = build()
+    elapsed = time.perf_counter() - start
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, size, elapsed
+
+def main() -> None:
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    sys.setrecursionlimit(100_000)
+    tokens = tokenize_buffer(generate_program(size))
+    print(f"source: {format_size(size)}")
+
+    tree, tree_size, _ = traced(lambda: parse(tokens))
+    nodes = count_nodes(tree)
+    start = time.perf_counter()
+    parse(tokens)
+    parse_time = time.perf_counter() - start
+    start = time.perf_counter()
+    typecheck(tree)
+    typecheck_time = time.perf_counter() - start
+    instructions, ir_size, ir_time = traced(lambda: generate_ir(root_types, tree))
+
+    print(f"{'':>14} {'count':>10} {'bytes each':>11} {'seconds':>10}")
+    print(f"{'ast nodes':>14} {nodes:>10} {tree_size / nodes:>11.1f} {parse_time:>10.3f}")
+    print(f"{'type check':>14} {nodes:>10} {'':>11} {typecheck_time:>10.3f}")
+    print(f"{'ir':>14} {len(instructions):>10} {ir_size / len(instructions):>11.1f} {ir_time:>10.3f}")
+
+if __name__ == '__main__':
+    main()
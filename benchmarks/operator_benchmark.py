@@ -0,0 +1,25 @@
+"""Sums 1..n in a while loop with both engines of the interpreter, to
+measure what the operators cost. Each iteration does four binary
+operations.
+
+Run with `poetry run python benchmarks/operator_benchmark.py [n]`.
+"""
+import sys
+import time
+from compiler.tokenizer import tokenize
+from compiler.parser import parse
+from compiler.interpreter import interpret
+
+def main() -> None:
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    tree = parse(tokenize(f"var i = 1; var s = 0; while i <= {n} do {{ s = s + i; i = i + 1 }}; s"))
+    print(f"{'engine':>9} {'s':>7} {'ns/iteration':>13}")
+    for name, closures in (("visits", False), ("closures", True)):
+        start = time.perf_counter()
+        value = interpret(tree, closures=closures)
+        elapsed = time.perf_counter() - start
+        assert value == n * (n + 1) // 2
+        print(f"{name:>9} {elapsed:>7.3f} {elapsed / n * 1e9:>13.0f}")
+
+if __name__ == '__main__':
+    main()
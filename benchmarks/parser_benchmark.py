@@ -0,0 +1,20 @@
+"""Measures parser throughput on a generated program.
+
+Run with `poetry run python benchmarks/parser_benchmark.py [size]`.
+"""
+import sys
+import time
+from programs import generate_program, format_size
+from compiler.tokenizer import tokenize
+from compiler.parser import parse
+
+def main() -> None:
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    tokens = tokenize(generate_program(size))
+    start = time.perf_counter()
+    parse(tokens)
+    elapsed = time.perf_counter() - start
+    print(f"{format_size(size)}: {len(tokens)} tokens in {elapsed:.3f} s, {len(tokens) / elapsed:,.0f} tokens/s")
+
+if __name__ == '__main__':
+    main()
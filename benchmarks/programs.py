@@ -0,0 +1,39 @@
+"""Synthetic source programs used by the benchmarks."""
+
+statement_template = """
+var a{n} : Int = {n} + 2 * 3;
+/* comment number {n}
+   spanning two lines */
+if a{n} > 10 and not (a{n} == 12) then {{
+    a{n} = a{n} - 1; # trailing comment
+}} else {{
+    print_int(a{n} % 7)
+}};
+"""
+
+def generate_program(size: int) -> str:
+    """Returns a valid program of roughly `size` characters."""
+    statements = []
+    length = 0
+    n = 0
+    while length < size:
+        statement = statement_template.format(n=n)
+        statements.append(statement)
+        length += len(statement)
+        n += 1
+    return "{" + "".join(statements) + "}"
+
+def format_size(size: int) -> str:
+    for unit in ["B", "KB", "MB"]:
+        if size < 1000 or unit == "MB":
+            return f"{size:g} {unit}"
+        size //= 1000
+    return f"{size} MB"
+
+def generate_nested_program(depth: int, reads: int) -> str:
+    """Returns a program of `depth` nested blocks that each declare a
+    variable, with `reads` statements in the innermost block reading the
+    outermost and the innermost variable."""
+    opening = "".join(f"{{ var v{n} = {n}; " for n in range(depth))
+    body = f"v0 = v0 + v{depth - 1}; " * reads
+    return opening + body + "v0 " + "}" * depth
@@ -0,0 +1,47 @@
+"""Compares incremental reparsing of typing in the middle of a program
+with parsing the whole program again, for growing program sizes.
+
+Run with `poetry run python benchmarks/reparse_benchmark.py [size ...]`.
+"""
+import sys
+import time
+from compiler.tokenizer import tokenize_buffer
+from compiler.parser import parse
+from compiler.incremental import Edit, reparse
+from programs import generate_program, format_size
+
+default_sizes = [10_000, 100_000, 1_000_000]
+keystrokes = 100
+
+def main() -> None:
+    sizes = [int(arg) for arg in sys.argv[1:]] or default_sizes
+    print(f"{'size':>8} {'full ms':>10} {'reparse ms':>11}")
+    per_edit = []
+    for size in sizes:
+        source_code = generate_program(size)
+        tokens = tokenize_buffer(source_code)
+        tree = parse(tokens)
+        # Type digits in the middle of the program, after "+ 2", one
+        # character at a time, and delete them again.
+        offset = source_code.index("+ 2", len(source_code) // 2) + 3
+        edits = [Edit(offset + n, offset + n, "1") for n in range(keystrokes)]
+        edits += [Edit(offset + n - 1, offset + n, "") for n in range(keystrokes, 0, -1)]
+
+        start = time.perf_counter()
+        parse(tokenize_buffer(source_code))
+        full = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for edit in edits:
+            tree, tokens = reparse(tree, tokens, edit)
+        incremental = (time.perf_counter() - start) / len(edits)
+        per_edit.append(incremental)
+
+        print(f"{format_size(len(source_code)):>8} {full * 1e3:>10.1f} {incremental * 1e3:>11.2f}")
+
+    # An edit only touches the statement around it, so its time must not
+    # grow with the size of the program.
+    assert max(per_edit) < 4 * min(per_edit) + 1e-3, "reparse time grows with the program size"
+
+if __name__ == '__main__':
+    main()
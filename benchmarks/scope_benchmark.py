@@ -0,0 +1,63 @@
+"""Compares looking names up in the scoped symbol table with the parent
+chained symbol tables it replaced, on deeply nested blocks.
+
+Run with `poetry run python benchmarks/scope_benchmark.py [reads]`.
+"""
+import sys
+import time
+from typing import Optional, Self
+from programs import generate_nested_program
+from compiler.tokenizer import tokenize_buffer
+from compiler.parser import parse
+from compiler.resolver import resolve
+from compiler.symtab import SymTab
+from compiler.interpreter import interpret
+
+class ChainedSymTab:
+    """A dict per scope, looked up through the parents."""
+    def __init__(self, parent: Optional[Self] = None):
+        self.parent = parent
+        self.locals: dict[str, int] = {}
+
+    def read(self, variable: str) -> int:
+        if variable in self.locals:
+            return self.locals[variable]
+        elif self.parent is not None:
+            return self.parent.read(variable)
+        raise Exception(f"Variable '{variable}' is not declared.")
+
+def lookups(depth: int, reads: int) -> tuple[float, float]:
+    scoped = SymTab[int]()
+    chained = ChainedSymTab()
+    for n in range(depth):
+        scoped.enter_scope()
+        scoped.define(f"v{n}", n)
+        chained = ChainedSymTab(chained)
+        chained.locals[f"v{n}"] = n
+
+    start = time.perf_counter()
+    for _ in range(reads):
+        scoped.read("v0")
+    scoped_time = time.perf_counter() - start
+    start = time.perf_counter()
+    for _ in range(reads):
+        chained.read("v0")
+    return scoped_time, time.perf_counter() - start
+
+def main() -> None:
+    reads = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    sys.setrecursionlimit(100_000)
+    print(f"{'depth':>6} {'scoped s':>10} {'chained s':>10} {'resolve s':>10} {'interpret s':>12}")
+    for depth in [1, 10, 100, 1000]:
+        scoped_time, chained_time = lookups(depth, reads)
+        tree = parse(tokenize_buffer(generate_nested_program(depth, reads // 10)))
+        start = time.perf_counter()
+        resolve(tree)
+        resolve_time = time.perf_counter() - start
+        start = time.perf_counter()
+        interpret(tree)
+        interpret_time = time.perf_counter() - start
+        print(f"{depth:>6} {scoped_time:>10.4f} {chained_time:>10.4f} {resolve_time:>10.4f} {interpret_time:>12.4f}")
+
+if __name__ == '__main__':
+    main()
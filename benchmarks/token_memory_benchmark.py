@@ -0,0 +1,30 @@
+"""Compares memory used per token by a list of `Token`s and a `TokenBuffer`.
+
+Run with `poetry run python benchmarks/token_memory_benchmark.py [size]`.
+"""
+import sys
+import time
+import tracemalloc
+from typing import Callable
+from programs import generate_program, format_size
+from compiler.tokenizer import TokenBuffer, Token, tokenize, tokenize_buffer
+
+def measure(name: str, tokenizer: Callable[[str], list[Token] | TokenBuffer], source_code: str) -> None:
+    tracemalloc.start()
+    start = time.perf_counter()
+    tokens = tokenizer(source_code)
+    elapsed = time.perf_counter() - start
+    size, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{name:>12} {len(tokens):>10} {size / len(tokens):>12.1f} {peak / len(tokens):>12.1f} {elapsed:>10.3f}")
+
+def main() -> None:
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 5_000_000
+    source_code = generate_program(size)
+    print(f"source: {format_size(size)}")
+    print(f"{'':>12} {'tokens':>10} {'bytes/token':>12} {'peak/token':>12} {'seconds':>10}")
+    measure("list[Token]", tokenize, source_code)
+    measure("TokenBuffer", tokenize_buffer, source_code)
+
+if __name__ == '__main__':
+    main()
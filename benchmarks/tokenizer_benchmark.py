@@ -0,0 +1,24 @@
+"""Measures tokenizer throughput over growing inputs.
+
+Run with `poetry run python benchmarks/tokenizer_benchmark.py [size ...]`.
+Sizes are in bytes. If lexing is linear, the time per byte stays flat.
+"""
+import sys
+import time
+from programs import generate_program, format_size
+from compiler.tokenizer import tokenize
+
+default_sizes = [1_000, 10_000, 100_000, 1_000_000, 10_000_000, 50_000_000]
+
+def main() -> None:
+    sizes = [int(arg) for arg in sys.argv[1:]] or default_sizes
+    print(f"{'size':>10} {'tokens':>10} {'seconds':>10} {'ns/byte':>10}")
+    for size in sizes:
+        source_code = generate_program(size)
+        start = time.perf_counter()
+        tokens = tokenize(source_code)
+        elapsed = time.perf_counter() - start
+        print(f"{format_size(size):>10} {len(tokens):>10} {elapsed:>10.3f} {elapsed / len(source_code) * 1e9:>10.1f}")
+
+if __name__ == '__main__':
+    main()
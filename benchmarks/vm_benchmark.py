@@ -0,0 +1,36 @@
+"""Compares running the loop programs of interpreter_benchmark.py on the
+bytecode VM with the closure engine of the interpreter, and shows the
+size of their serialized bytecode.
+
+Run with `poetry run python benchmarks/vm_benchmark.py [iterations]`.
+"""
+import io
+import sys
+import time
+from interpreter_benchmark import programs
+from compiler.tokenizer import tokenize
+from compiler.parser import parse
+from compiler.type_checker import typecheck
+from compiler.interpreter import interpret
+from compiler import vm
+
+def main() -> None:
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    print(f"{'program':>14} {'closures s':>11} {'vm s':>8} {'speedup':>8} {'bytes':>6}")
+    for name, source in programs.items():
+        tree = parse(tokenize(source.format(n=n)))
+        typecheck(tree)
+        start = time.perf_counter()
+        value = interpret(tree)
+        closure_time = time.perf_counter() - start
+
+        program = vm.Program.from_bytes(vm.compile_program(tree).to_bytes())
+        output = io.StringIO()
+        start = time.perf_counter()
+        vm.run(program, stdout=output)
+        vm_time = time.perf_counter() - start
+        assert output.getvalue() == f"{value}\n"
+        print(f"{name:>14} {closure_time:>11.3f} {vm_time:>8.3f} {closure_time / vm_time:>8.2f} {len(program.to_bytes()):>6}")
+
+if __name__ == '__main__':
+    main()
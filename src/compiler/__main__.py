@@ -4,18 +4,63 @@ import re
 import sys
 from socketserver import ForkingTCPServer, StreamRequestHandler
 from traceback import format_exception
-from typing import Any
-from compiler.tokenizer import tokenize
+from typing import Any, TextIO
+from compiler.tokenizer import tokenize_buffer
 from compiler.parser import parse
-from compiler.type_checker import typecheck
+from compiler.resolver import Resolution, resolve
+from compiler.type_checker import Diagnostic, Diagnostics, TypeCheckError, typecheck
 from compiler.ir_generator import generate_ir
 from compiler.assembly_generator import generate_assembly
 from compiler.assembler import assemble
 from compiler.ir import IRVar
 from compiler.types import Int, Bool, Unit, Type
+from compiler import ast
+from compiler import native, vm
 import tempfile
 
-def call_compiler(source_code: str, input_file_name: str) -> bytes:
+root_types: dict[IRVar, Type] = {
+    IRVar('+') : Int,
+    IRVar('-') : Int,
+    IRVar('*') : Int,
+    IRVar('/') : Int,
+    IRVar('%') : Int,
+    IRVar('and') : Bool,
+    IRVar('or') : Bool,
+    IRVar('==') : Bool,
+    IRVar('!=') : Bool,
+    IRVar('<') : Bool,
+    IRVar('<=') : Bool,
+    IRVar('>=') : Bool,
+    IRVar('>') : Bool,
+    IRVar('unary_-') : Int,
+    IRVar('unary_not') : Bool,
+    IRVar('print_int') : Unit,
+    IRVar('print_bool') : Unit,
+    IRVar('read_int') : Int,
+}
+
+
+def frontend(source_code: str | TextIO, input_file_name: str, check_types: bool = True) -> tuple[ast.Expression, Resolution]:
+    # Tokenizes, parses, resolves and, with 'check_types', type checks the source code.
+    # All type errors are raised together in 'Diagnostics'.
+    # A file is read whole: its tokens are kept in a TokenBuffer, which
+    # needs far less memory than a Token object for each token.
+    # The names are resolved once here, and the resolution is passed on to the later stages.
+    if not isinstance(source_code, str):
+        source_code = source_code.read()
+    expr = parse(tokenize_buffer(source_code, input_file_name))
+    resolution = resolve(expr)
+    if check_types:
+        raise_type_errors(expr, resolution)
+    return expr, resolution
+
+def raise_type_errors(expr: ast.Expression, resolution: Resolution) -> None:
+    diagnostics: list[Diagnostic] = []
+    typecheck(expr, diagnostics=diagnostics, resolution=resolution)
+    if diagnostics:
+        raise Diagnostics(diagnostics)
+
+def call_compiler(source_code: str | TextIO, input_file_name: str, fused: bool = False) -> bytes:
     # *** TODO ***
     # Call your compiler here and return the compiled executable.
     # Raise an exception on compilation error.
@@ -23,34 +68,34 @@ def call_compiler(source_code: str, input_file_name: str) -> bytes:
     # The input file name is informational only: you can optionally include in your source locations and error messages,
     # or you can ignore it.
     # *** TODO ***
-    root_types: dict[IRVar, Type] = {
-        IRVar('+') : Int,
-        IRVar('-') : Int,
-        IRVar('*') : Int,
-        IRVar('/') : Int,
-        IRVar('%') : Int,
-        IRVar('and') : Bool,
-        IRVar('or') : Bool,
-        IRVar('==') : Bool,
-        IRVar('!=') : Bool,
-        IRVar('<') : Bool,
-        IRVar('<=') : Bool,
-        IRVar('>=') : Bool,
-        IRVar('>') : Bool,
-        IRVar('unary_-') : Int,
-        IRVar('unary_not') : Bool,
-        IRVar('print_int') : Unit,
-        IRVar('print_bool') : Unit,
-        IRVar('read_int') : Int,
-    }
+    #
+    # With 'fused', type checking is done while generating IR, in one pass over the tree.
+    # It stops at the first type error, so the tree is then checked again to raise
+    # the same 'Diagnostics' as without 'fused'.
     temp_file = tempfile.NamedTemporaryFile()
-    expr = parse(tokenize(source_code, input_file_name))
-    typecheck(expr)
-    assemble(generate_assembly(generate_ir(root_types, expr)), temp_file.name)
+    expr, resolution = frontend(source_code, input_file_name, check_types=not fused)
+    try:
+        instructions = generate_ir(root_types, expr, typecheck=fused, resolution=resolution)
+    except TypeCheckError:
+        if not fused:
+            raise
+        raise_type_errors(expr, resolution)
+        raise
+    assemble(generate_assembly(instructions), temp_file.name)
     executable = open(temp_file.name, 'rb')
     return executable.read()
     #raise NotImplementedError("Compiler not implemented")
 
+def call_bytecode_compiler(source_code: str | TextIO, input_file_name: str) -> vm.Program:
+    # Compiles to bytecode for compiler.vm, which runs without an assembler.
+    expr, resolution = frontend(source_code, input_file_name)
+    return vm.compile_program(expr, resolution)
+
+def call_native_compiler(source_code: str | TextIO, input_file_name: str) -> native.Program:
+    # Compiles to machine code that runs in this process, without an assembler.
+    expr, resolution = frontend(source_code, input_file_name)
+    return native.Program(generate_assembly(generate_ir(root_types, expr, resolution=resolution)))
+
 
 def main() -> int:
     # === Option parsing ===
@@ -59,6 +104,9 @@ def main() -> int:
     output_file: str | None = None
     host = "127.0.0.1"
     port = 3000
+    fused = False
+    bytecode = False
+    in_process = False
     for arg in sys.argv[1:]:
         if (m := re.fullmatch(r'--output=(.+)', arg)) is not None:
             output_file = m[1]
@@ -66,6 +114,12 @@ def main() -> int:
             host = m[1]
         elif (m := re.fullmatch(r'--port=(.+)', arg)) is not None:
             port = int(m[1])
+        elif arg == '--fused':
+            fused = True
+        elif arg == '--bytecode':
+            bytecode = True
+        elif arg == '--native':
+            in_process = True
         elif arg.startswith('-'):
             raise Exception(f"Unknown argument: {arg}")
         elif command is None:
@@ -79,22 +133,45 @@ def main() -> int:
         print(f"Error: command argument missing", file=sys.stderr)
         return 1
 
-    def read_source_code() -> str:
-        if input_file is not None:
-            with open(input_file) as f:
-                return f.read()
-        else:
-            return sys.stdin.read()
-
     # === Command implementations ===
 
     if command == 'compile':
-        source_code = read_source_code()
         if output_file is None:
             raise Exception("Output file flag --output=... required")
-        executable = call_compiler(source_code, input_file or '(source code)')
+        if bytecode:
+            if input_file is not None:
+                with open(input_file) as f:
+                    executable = call_bytecode_compiler(f, input_file).to_bytes()
+            else:
+                executable = call_bytecode_compiler(sys.stdin, '(source code)').to_bytes()
+        elif input_file is not None:
+            with open(input_file) as f:
+                executable = call_compiler(f, input_file, fused)
+        else:
+            executable = call_compiler(sys.stdin, '(source code)', fused)
         with open(output_file, 'wb') as f:
             f.write(executable)
+    elif command == 'run':
+        # Runs a source file, or bytecode made with `compile --bytecode`,
+        # on the VM. With --native, a source file is compiled to machine
+        # code and run in this process. The program reads its input from
+        # stdin.
+        if input_file is None:
+            raise Exception("Input file required")
+        with open(input_file, 'rb') as f:
+            data = f.read()
+        if in_process:
+            native_program = call_native_compiler(data.decode(), input_file)
+            try:
+                native_program.run()
+            finally:
+                native_program.close()
+        else:
+            if data.startswith(vm.MAGIC):
+                program = vm.Program.from_bytes(data)
+            else:
+                program = call_bytecode_compiler(data.decode(), input_file)
+            vm.run(program)
     elif command == 'serve':
         try:
             run_server(host, port)
@@ -125,6 +202,18 @@ def run_server(host: str, port: int) -> None:
                     pass
                 else:
                     result["error"] = "Unknown command: " + input['command']
+            except Diagnostics as e:
+                result["error"] = "".join(format_exception(e))
+                result["diagnostics"] = [
+                    {
+                        "file": d.location.file,
+                        "line": d.location.row,
+                        "column": d.location.column,
+                        "message": d.message,
+                        "code": d.code,
+                    }
+                    for d in e.diagnostics
+                ]
             except Exception as e:
                 result["error"] = "".join(format_exception(e))
             result_str = json.dumps(result)
@@ -0,0 +1,456 @@
+from array import array
+from enum import IntEnum
+from typing import Any, Callable, Optional
+from compiler.tokenizer import Source, SourceFile, Token, TokenBuffer
+from compiler.types import Type, Unit
+from compiler.parser import parse_with
+import compiler.ast as ast
+
+class NodeKind(IntEnum):
+    LITERAL = 0
+    IDENTIFIER = 1
+    BINARY_OP = 2
+    UNARY_OP = 3
+    VARIABLE_DECLARATION = 4
+    CONDITIONAL = 5
+    BLOCK = 6
+    FUNCTION_CALL = 7
+    BREAK = 8
+    CONTINUE = 9
+
+class LiteralKind(IntEnum):
+    INT = 0
+    BOOL = 1
+    UNIT = 2
+    # An int that does not fit in 64 bits, stored in `Arena.large_ints`.
+    LARGE_INT = 3
+
+class Arena:
+    """The AST of a program stored in parallel arrays.
+
+    A node is an index into the arrays. What the fields hold depends on
+    the node kind:
+
+        kind                  op            value     first      second     third
+        LITERAL               LiteralKind   value
+        IDENTIFIER            name
+        BINARY_OP             operator                left       right
+        UNARY_OP              operator                right
+        VARIABLE_DECLARATION                var type  variable
+        CONDITIONAL           operator                condition  first      second or -1
+        BLOCK                                                    items      item count
+        FUNCTION_CALL                                 function   items      item count
+
+    `bindings` holds the binding `compiler.resolver` gives an identifier.
+    Names and operators are ids in `names`, types are ids in `type_table`
+    and the variable type of a declaration is -1 when not given. The
+    expressions and result of a block and the arguments of a call are
+    consecutive in `items`. Locations are offsets in `file`; other
+    locations are kept in `sources` and stored as `-1 - index`.
+
+    The arena implements the parser's `Builder` protocol, so the parser
+    can build it directly. The compiler stages read it through `view`."""
+    kinds: array[int]
+    ops: array[int]
+    values: array[int]
+    first: array[int]
+    second: array[int]
+    third: array[int]
+    locations: array[int]
+    types: array[int]
+    bindings: array[int]
+    items: array[int]
+    names: list[str]
+    type_table: list[Type]
+    sources: list[Source]
+    large_ints: list[int]
+    file: Optional[SourceFile]
+
+    def __init__(self, file: Optional[SourceFile] = None):
+        self.kinds = array('B')
+        self.ops = array('I')
+        self.values = array('q')
+        self.first = array('i')
+        self.second = array('i')
+        self.third = array('i')
+        self.locations = array('q')
+        self.types = array('H')
+        self.bindings = array('i')
+        self.items = array('i')
+        self.names = []
+        self.type_table = [Unit]
+        self.sources = []
+        self.large_ints = []
+        self.file = file
+        self._name_ids: dict[str, int] = {}
+        self._type_ids: dict[Type, int] = {Unit: 0}
+        # The view of each node, once `view` has made it.
+        self._views: dict[int, ast.Expression] = {}
+
+    def __len__(self) -> int:
+        return len(self.kinds)
+
+    def name_id(self, name: str) -> int:
+        name_id = self._name_ids.get(name)
+        if name_id is None:
+            name_id = self._name_ids[name] = len(self.names)
+            self.names.append(name)
+        return name_id
+
+    def type_id(self, type: Type) -> int:
+        type_id = self._type_ids.get(type)
+        if type_id is None:
+            type_id = self._type_ids[type] = len(self.type_table)
+            self.type_table.append(type)
+        return type_id
+
+    def location_id(self, location: Source) -> int:
+        offset = -1 if self.file is None else location.offset_in(self.file)
+        if offset < 0:
+            offset = -1 - len(self.sources)
+            self.sources.append(location)
+        return offset
+
+    def add(self, kind: NodeKind, location: Source | int, op: int = 0, value: int = 0, first: int = -1, second: int = -1, third: int = -1) -> int:
+        """Appends a node and returns its handle. `location` may also be a
+        location id taken from another node."""
+        self.kinds.append(kind)
+        self.ops.append(op)
+        self.values.append(value)
+        self.first.append(first)
+        self.second.append(second)
+        self.third.append(third)
+        self.locations.append(location if isinstance(location, int) else self.location_id(location))
+        self.types.append(0)
+        self.bindings.append(-1)
+        return len(self.kinds) - 1
+
+    def kind(self, node: int) -> NodeKind:
+        return NodeKind(self.kinds[node])
+
+    def location(self, node: int) -> Source:
+        offset = self.locations[node]
+        if offset < 0:
+            return self.sources[-1 - offset]
+        assert self.file is not None
+        return Source.at(self.file, offset)
+
+    def name(self, node: int) -> str:
+        """Name of an identifier, or the operator of an operation or conditional."""
+        return self.names[self.ops[node]]
+
+    def value(self, node: int) -> int | bool | None:
+        """Value of a literal."""
+        value = self.values[node]
+        match self.ops[node]:
+            case LiteralKind.INT:
+                return value
+            case LiteralKind.BOOL:
+                return value != 0
+            case LiteralKind.UNIT:
+                return None
+            case _:
+                return self.large_ints[value]
+
+    def var_type(self, node: int) -> Optional[Type]:
+        """Declared type of a variable declaration."""
+        type_id = self.values[node]
+        return None if type_id < 0 else self.type_table[type_id]
+
+    def node_items(self, node: int) -> array[int]:
+        """Expressions and result of a block, or arguments of a function call."""
+        if self.kinds[node] == NodeKind.FUNCTION_CALL:
+            start, count = self.second[node], self.third[node]
+        else:
+            start, count = self.first[node], self.second[node]
+        return self.items[start:start + count]
+
+    def type(self, node: int) -> Type:
+        return self.type_table[self.types[node]]
+
+    def set_type(self, node: int, type: Type) -> None:
+        self.types[node] = self.type_id(type)
+        view = self._views.get(node)
+        if view is not None:
+            view.__dict__["type"] = type
+
+    def binding(self, node: int) -> int:
+        return self.bindings[node]
+
+    def set_binding(self, node: int, binding: int) -> None:
+        self.bindings[node] = binding
+        view = self._views.get(node)
+        if view is not None:
+            view.__dict__["binding"] = binding
+
+    def view(self, node: int) -> ast.Expression:
+        """Returns a node as an instance of its `compiler.ast` class whose
+        fields are read from the arena. Setting `type` or `binding` writes to
+        the arena.
+
+        A node has one view, and the view keeps its fields once they are
+        read, so traversing a tree again reads it like dataclasses."""
+        view = self._views.get(node)
+        if view is None:
+            view = self._views[node] = view_classes[self.kinds[node]](self, node)
+        return view
+
+    # Builder protocol.
+
+    def literal(self, location: Source, value: int | bool | None) -> int:
+        if value is None:
+            return self.add(NodeKind.LITERAL, location, LiteralKind.UNIT)
+        if isinstance(value, bool):
+            return self.add(NodeKind.LITERAL, location, LiteralKind.BOOL, int(value))
+        if -2**63 <= value < 2**63:
+            return self.add(NodeKind.LITERAL, location, LiteralKind.INT, value)
+        self.large_ints.append(value)
+        return self.add(NodeKind.LITERAL, location, LiteralKind.LARGE_INT, len(self.large_ints) - 1)
+
+    def identifier(self, location: Source, name: str) -> int:
+        return self.add(NodeKind.IDENTIFIER, location, self.name_id(name))
+
+    def binary_op(self, location: Source, left: int, op: str, right: int) -> int:
+        return self.add(NodeKind.BINARY_OP, location, self.name_id(op), first=left, second=right)
+
+    def unary_op(self, location: Source, op: str, right: int) -> int:
+        return self.add(NodeKind.UNARY_OP, location, self.name_id(op), first=right)
+
+    def variable_declaration(self, location: Source, variable: int, var_type: Optional[Type]) -> int:
+        type_id = -1 if var_type is None else self.type_id(var_type)
+        return self.add(NodeKind.VARIABLE_DECLARATION, location, value=type_id, first=variable)
+
+    def conditional(self, location: Source, op: str, condition: int, first: int, second: Optional[int]) -> int:
+        return self.add(NodeKind.CONDITIONAL, location, self.name_id(op), first=condition, second=first, third=-1 if second is None else second)
+
+    def block(self, expressions: list[int], result: int, spans: list[tuple[int, int]]) -> int:
+        start = len(self.items)
+        self.items.extend(expressions)
+        self.items.append(result)
+        return self.add(NodeKind.BLOCK, self.locations[result], first=start, second=len(expressions) + 1)
+
+    def function_call(self, function: int, parameters: list[int]) -> int:
+        start = len(self.items)
+        self.items.extend(parameters)
+        return self.add(NodeKind.FUNCTION_CALL, self.locations[function], first=function, second=start, third=len(parameters))
+
+    def break_(self, location: Source) -> int:
+        return self.add(NodeKind.BREAK, location)
+
+    def continue_(self, location: Source) -> int:
+        return self.add(NodeKind.CONTINUE, location)
+
+    # Adapters.
+
+    def to_ast(self, root: int) -> ast.Expression:
+        """Returns the subtree at `root` as `compiler.ast` dataclasses."""
+        nodes: dict[int, ast.Expression] = {}
+        stack = [root]
+        while stack:
+            node = stack[-1]
+            if node in nodes:
+                stack.pop()
+                continue
+            children = self.children(node)
+            missing = [child for child in children if child not in nodes]
+            if missing:
+                stack.extend(missing)
+                continue
+            stack.pop()
+            nodes[node] = self.make_ast(node, [nodes[child] for child in children])
+        return nodes[root]
+
+    def children(self, node: int) -> list[int]:
+        """Child nodes in the order the dataclass fields hold them."""
+        match self.kinds[node]:
+            case NodeKind.BINARY_OP:
+                return [self.first[node], self.second[node]]
+            case NodeKind.UNARY_OP | NodeKind.VARIABLE_DECLARATION:
+                return [self.first[node]]
+            case NodeKind.CONDITIONAL:
+                third = self.third[node]
+                return [self.first[node], self.second[node]] + ([] if third < 0 else [third])
+            case NodeKind.BLOCK:
+                return list(self.node_items(node))
+            case NodeKind.FUNCTION_CALL:
+                return [self.first[node]] + list(self.node_items(node))
+            case _:
+                return []
+
+    def make_ast(self, node: int, children: list[ast.Expression]) -> ast.Expression:
+        location = self.location(node)
+        expr: ast.Expression
+        match self.kinds[node]:
+            case NodeKind.LITERAL:
+                expr = ast.Literal(location, self.value(node))
+            case NodeKind.IDENTIFIER:
+                expr = ast.Identifier(location, self.name(node), binding=self.binding(node))
+            case NodeKind.BINARY_OP:
+                expr = ast.BinaryOp(location, children[0], self.name(node), children[1])
+            case NodeKind.UNARY_OP:
+                expr = ast.UnaryOp(location, self.name(node), children[0])
+            case NodeKind.VARIABLE_DECLARATION:
+                assert isinstance(children[0], ast.Identifier)
+                expr = ast.VariableDeclaration(location, children[0], self.var_type(node))
+            case NodeKind.CONDITIONAL:
+                expr = ast.Conditional(location, self.name(node), children[0], children[1], children[2] if len(children) > 2 else None)
+            case NodeKind.BLOCK:
+                expr = ast.Block(location, children[:-1], children[-1])
+            case NodeKind.FUNCTION_CALL:
+                assert isinstance(children[0], ast.Identifier)
+                expr = ast.FunctionCall(location, children[0], children[1:])
+            case NodeKind.BREAK:
+                expr = ast.Break(location)
+            case _:
+                expr = ast.Continue(location)
+        expr.type = self.type(node)
+        return expr
+
+    @classmethod
+    def from_ast(cls, root: ast.Expression, file: Optional[SourceFile] = None) -> tuple["Arena", int]:
+        """Copies a tree of `compiler.ast` dataclasses into a new arena.
+        Returns the arena and the handle of the root."""
+        arena = cls(file)
+        handles: dict[int, int] = {}
+        stack = [root]
+        while stack:
+            expr = stack[-1]
+            if id(expr) in handles:
+                stack.pop()
+                continue
+            children = ast_children(expr)
+            missing = [child for child in children if id(child) not in handles]
+            if missing:
+                stack.extend(missing)
+                continue
+            stack.pop()
+            node = arena.add_ast(expr, [handles[id(child)] for child in children])
+            arena.set_type(node, expr.type)
+            handles[id(expr)] = node
+        return arena, handles[id(root)]
+
+    def add_ast(self, expr: ast.Expression, children: list[int]) -> int:
+        match expr:
+            case ast.Literal():
+                return self.literal(expr.location, expr.value)
+            case ast.Identifier():
+                return self.identifier(expr.location, expr.name)
+            case ast.BinaryOp():
+                return self.binary_op(expr.location, children[0], expr.op, children[1])
+            case ast.UnaryOp():
+                return self.unary_op(expr.location, expr.op, children[0])
+            case ast.VariableDeclaration():
+                return self.variable_declaration(expr.location, children[0], expr.var_type)
+            case ast.Conditional():
+                return self.conditional(expr.location, expr.op, children[0], children[1], children[2] if len(children) > 2 else None)
+            case ast.Block():
+                start = len(self.items)
+                self.items.extend(children)
+                return self.add(NodeKind.BLOCK, expr.location, first=start, second=len(children))
+            case ast.FunctionCall():
+                start = len(self.items)
+                self.items.extend(children[1:])
+                return self.add(NodeKind.FUNCTION_CALL, expr.location, first=children[0], second=start, third=len(children) - 1)
+            case ast.Break():
+                return self.break_(expr.location)
+            case ast.Continue():
+                return self.continue_(expr.location)
+            case _:
+                raise Exception(f"{expr.location}: unknown expression {expr}")
+
+def ast_children(expr: ast.Expression) -> list[ast.Expression]:
+    """Child nodes of a dataclass node, in the order `Arena.children` gives them."""
+    match expr:
+        case ast.BinaryOp():
+            return [expr.left, expr.right]
+        case ast.UnaryOp():
+            return [expr.right]
+        case ast.VariableDeclaration():
+            return [expr.variable]
+        case ast.Conditional():
+            return [expr.condition, expr.first] + ([] if expr.second is None else [expr.second])
+        case ast.Block():
+            return expr.expressions + [expr.result]
+        case ast.FunctionCall():
+            return [expr.function, *expr.parameters]
+        case _:
+            return []
+
+class NodeView:
+    """Base of the classes returned by `Arena.view`. Setting `type` or
+    `binding` goes through the arena's setters, which also update the
+    value the view keeps."""
+    arena: Arena
+    node: int
+
+    def __init__(self, arena: Arena, node: int):
+        self.__dict__.update(arena=arena, node=node)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        setter = view_setters.get(name)
+        if setter is None:
+            self.__dict__[name] = value
+        elif self.__dict__.get(name, self) is not value:
+            setter(self.arena, self.node, value)
+
+view_setters: dict[str, Callable[[Arena, int, Any], None]] = {"type": Arena.set_type, "binding": Arena.set_binding}
+
+class CachedField:
+    """A view field read from the arena once and then kept in the view's
+    `__dict__`, which is looked up before this descriptor. The arena only
+    appends nodes, and `type` and `binding` are updated by its setters, so
+    the kept value stays current."""
+    __slots__ = ("get", "name")
+
+    def __init__(self, get: Callable[[Arena, int], Any]):
+        self.get = get
+        self.name = ""
+
+    def __set_name__(self, owner: type, name: str) -> None:
+        self.name = name
+
+    def __get__(self, view: Optional[NodeView], owner: Optional[type] = None) -> Any:
+        if view is None:
+            return self
+        value = view.__dict__[self.name] = self.get(view.arena, view.node)
+        return value
+
+def view_class(base: type[ast.Expression], **fields: Callable[[Arena, int], Any]) -> Callable[[Arena, int], ast.Expression]:
+    """Makes a subclass of `base` with the given fields read from the arena."""
+    namespace: dict[str, Any] = {name: CachedField(get) for name, get in fields.items()}
+    namespace["location"] = CachedField(Arena.location)
+    namespace["type"] = CachedField(Arena.type)
+    return type(f"{base.__name__}View", (NodeView, base), namespace)
+
+def first_view(arena: Arena, node: int) -> ast.Expression:
+    return arena.view(arena.first[node])
+
+def second_view(arena: Arena, node: int) -> ast.Expression:
+    return arena.view(arena.second[node])
+
+def third_view(arena: Arena, node: int) -> Optional[ast.Expression]:
+    child = arena.third[node]
+    return None if child < 0 else arena.view(child)
+
+def item_views(arena: Arena, node: int) -> list[ast.Expression]:
+    return [arena.view(item) for item in arena.node_items(node)]
+
+view_classes: dict[int, Callable[[Arena, int], ast.Expression]] = {
+    NodeKind.LITERAL: view_class(ast.Literal, value=Arena.value),
+    NodeKind.IDENTIFIER: view_class(ast.Identifier, name=Arena.name, binding=Arena.binding),
+    NodeKind.BINARY_OP: view_class(ast.BinaryOp, left=first_view, op=Arena.name, right=second_view),
+    NodeKind.UNARY_OP: view_class(ast.UnaryOp, op=Arena.name, right=first_view),
+    NodeKind.VARIABLE_DECLARATION: view_class(ast.VariableDeclaration, variable=first_view, var_type=Arena.var_type),
+    NodeKind.CONDITIONAL: view_class(ast.Conditional, op=Arena.name, condition=first_view, first=second_view, second=third_view),
+    NodeKind.BLOCK: view_class(ast.Block, expressions=lambda arena, node: item_views(arena, node)[:-1], result=lambda arena, node: arena.view(arena.items[arena.first[node] + arena.second[node] - 1])),
+    NodeKind.FUNCTION_CALL: view_class(ast.FunctionCall, function=first_view, parameters=item_views),
+    NodeKind.BREAK: view_class(ast.Break),
+    NodeKind.CONTINUE: view_class(ast.Continue),
+}
+
+def parse_arena(tokens: list[Token] | TokenBuffer) -> tuple[Arena, int]:
+    """Parses a program straight into an arena. Returns the arena and the
+    handle of the root."""
+    arena = Arena(tokens.file if isinstance(tokens, TokenBuffer) else None)
+    root = parse_with(tokens, arena)
+    return arena, root
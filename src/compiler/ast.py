@@ -1,36 +1,40 @@
+from array import array
 from dataclasses import dataclass, field
-from typing import Optional
-from compiler.tokenizer import Source, L
+from typing import Iterable, Iterator, Optional
+from compiler.tokenizer import Source, L, bisect_gap_left, bisect_gap_right, move_gap
 from compiler.types import Type, Unit
-@dataclass
+@dataclass(slots=True)
 class Expression:
     """Base class for AST nodes representing expressions."""
     location: Source
     type: Type = field(kw_only=True, default=Unit)
 
-@dataclass
+@dataclass(slots=True)
 class Break(Expression):
     def __str__ (self) -> str:
         return "break"
 
-@dataclass
+@dataclass(slots=True)
 class Continue(Expression):
     def __str__ (self) -> str:
         return "continue"
 
-@dataclass
+@dataclass(slots=True)
 class Literal(Expression):
     value: int | bool | None
     def __str__ (self) -> str:
         return str(self.value)
 
-@dataclass
+@dataclass(slots=True)
 class Identifier(Expression):
     name: str
+    # Set by compiler.resolver: the block variable the name refers to, or
+    # -1 (resolver.FREE) when it is looked up by name in the symbol table.
+    binding: int = field(kw_only=True, default=-1, compare=False, repr=False)
     def __str__ (self) -> str:
         return self.name
 
-@dataclass
+@dataclass(slots=True)
 class BinaryOp(Expression):
     """AST node for a binary operation like `A + B`"""
     left: Expression
@@ -39,7 +43,7 @@ class BinaryOp(Expression):
     def __str__ (self) -> str:
         return f"{str(self.left)} {self.op} {self.right}"
 
-@dataclass
+@dataclass(slots=True)
 class UnaryOp(Expression):
     """AST node for a unary operation like `not A`"""
     op: str
@@ -47,7 +51,7 @@ class UnaryOp(Expression):
     def __str__ (self) -> str:
         return f"{self.op} {self.right}"
 
-@dataclass
+@dataclass(slots=True)
 class VariableDeclaration(Expression):
     """AST node for defining a variable"""
     variable: Identifier
@@ -55,7 +59,7 @@ class VariableDeclaration(Expression):
     def __str__ (self) -> str:
         return f"var {self.variable} : {self.var_type if self.var_type is not None else "Any"}"
 
-@dataclass
+@dataclass(slots=True)
 class Conditional(Expression):
     """AST node for a conditional statement like `if A then B"""
     op: str
@@ -65,18 +69,71 @@ class Conditional(Expression):
     def __str__ (self) -> str:
         return f"{self.op} {self.condition} {self.first} {self.second if self.second is not None else ""}"
 
-@dataclass
+class Spans:
+    """Token index ranges of the statements of a block, see `Block.spans`.
+    Like the offsets of a TokenBuffer, the ranges from index `gap` on are
+    stored without `shift`, so that an edit adding tokens to a statement
+    does not have to move the ranges of all the statements after it."""
+    __slots__ = ("starts", "ends", "gap", "shift")
+    starts: array[int]
+    ends: array[int]
+    gap: int
+    shift: int
+
+    def __init__(self, spans: Iterable[tuple[int, int]] = ()):
+        spans = list(spans)
+        self.starts = array('q', [span[0] for span in spans])
+        self.ends = array('q', [span[1] for span in spans])
+        self.gap = len(self.starts)
+        self.shift = 0
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def __getitem__(self, index: int) -> tuple[int, int]:
+        if index < 0:
+            index += len(self)
+        shift = self.shift if index >= self.gap else 0
+        return self.starts[index] + shift, self.ends[index] + shift
+
+    def __iter__(self) -> Iterator[tuple[int, int]]:
+        for index in range(len(self)):
+            yield self[index]
+
+    def first_ending_after(self, end: int) -> int:
+        """Returns the index of the first range ending after `end`."""
+        return bisect_gap_right(self.ends, self.gap, self.shift, end)
+
+    def first_starting_at(self, start: int) -> int:
+        """Returns the index of the first range starting at or after `start`."""
+        return bisect_gap_left(self.starts, self.gap, self.shift, start)
+
+    def replace(self, start: int, stop: int, spans: list[tuple[int, int]], shift: int) -> None:
+        """Replaces the ranges from index `start` to `stop` by `spans`,
+        and moves the ranges after them by `shift`."""
+        for values in (self.starts, self.ends):
+            move_gap(values, self.gap, self.shift, start)
+        self.starts[start:stop] = array('q', [span[0] for span in spans])
+        self.ends[start:stop] = array('q', [span[1] for span in spans])
+        self.gap = start + len(spans)
+        self.shift += shift
+
+@dataclass(slots=True)
 class Block(Expression):
     """AST node for a block like { f(a); x = y; f(x) }"""
     expressions: list[Expression]
     result: Expression
+    # Token index ranges of the expressions and the result, separators
+    # included, counted from the first token of the block. Used by
+    # compiler.incremental to find the statements an edit touches.
+    spans: Spans = field(kw_only=True, default_factory=Spans, compare=False, repr=False)
     def __str__ (self) -> str:
         block = ""
         for expression in self.expressions:
             block += str(expression) + "; "
         return f"{"{"} {block}{self.result} {"}"}"
 
-@dataclass
+@dataclass(slots=True)
 class FunctionCall(Expression):
     """AST node for a function call"""
     function: Identifier
@@ -86,4 +143,27 @@ class FunctionCall(Expression):
         params = []
         for param in self.parameters:
             params.append(str(param))
-        return f"{self.function} ({params})"
\ No newline at end of file
+        return f"{self.function} ({params})"
+
+class Dispatch[H](dict[type[Expression], H]):
+    """Handlers of the node classes, for visitors that dispatch on the class
+    of a node with `handlers[type(node)]`, a single dict lookup whatever the
+    class is.
+
+    A class without a handler of its own, such as the node views of
+    compiler.arena, uses the handler of its nearest base class, or
+    `default`. It is added to the table the first time it is looked up."""
+    default: H
+
+    def __init__(self, handlers: dict[type[Expression], H], default: H):
+        super().__init__(handlers)
+        self.default = default
+
+    def __missing__(self, cls: type[Expression]) -> H:
+        handler = self.default
+        for base in cls.__mro__[1:]:
+            if base in self:
+                handler = self[base]
+                break
+        self[cls] = handler
+        return handler
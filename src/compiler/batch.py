@@ -0,0 +1,277 @@
+"""Runs one program over many rows of input at once, with NumPy.
+
+Every lane runs the program with its own row of input for read_int, as
+the executable made by compiler.__main__ would. The values of a node
+for all lanes are an int64 or bool array. Branches run for the lanes
+that take them, and loops until no lane is left in them.
+
+NumPy is not needed by the rest of the compiler: it is installed with
+the `batch` extra, `poetry install --extras batch`."""
+from dataclasses import dataclass
+from typing import Any, Callable, Optional, Sequence
+import numpy as np
+from numpy.typing import NDArray
+from compiler import ast
+from compiler.resolver import FREE, Resolution, resolve
+from compiler.traversal import Visit, traverse
+from compiler.types import Bool, Int
+from compiler.vm import value_type, wrap
+
+type Lanes = NDArray[np.bool_]
+
+@dataclass
+class Lane:
+    """What the program did with one row of input."""
+    output: str
+    # Why the program stopped early, like "Division by zero."
+    error: Optional[str] = None
+
+def run_batch(
+    root: ast.Expression,
+    inputs: Sequence[Sequence[int]],
+    max_iterations: Optional[int] = None,
+    resolution: Optional[Resolution] = None
+) -> list[Lane]:
+    """Runs the type checked tree `root` for each row of `inputs`. With
+    `max_iterations`, lanes still in a loop after that many iterations
+    of it are stopped. `resolution` is what `resolve(root)` gave, when the
+    caller has already resolved it."""
+    if resolution is None:
+        resolution = resolve(root)
+    with np.errstate(over='ignore', divide='ignore', invalid='ignore'):
+        return Batch(root, inputs, max_iterations).run(resolution)
+
+class Batch:
+    def __init__(self, root: ast.Expression, inputs: Sequence[Sequence[int]], max_iterations: Optional[int]):
+        self.root = root
+        self.lanes = len(inputs)
+        self.max_iterations = max_iterations
+        n = self.lanes
+        self.lengths = np.array([len(row) for row in inputs], dtype=np.int64)
+        self.table = np.zeros((n, max((len(row) for row in inputs), default=0) + 1), dtype=np.int64)
+        for lane, row in enumerate(inputs):
+            self.table[lane, :len(row)] = [wrap(value) for value in row]
+        self.position = np.zeros(n, dtype=np.int64)
+        # Lanes that have not failed, and lanes that have not failed or
+        # jumped out of the current iteration of a loop.
+        self.alive = np.ones(n, dtype=np.bool_)
+        self.running = np.ones(n, dtype=np.bool_)
+        self.errors: list[Optional[str]] = [None] * n
+        # Prints: whether they print booleans, the lanes and their values.
+        self.prints: list[tuple[bool, NDArray[np.intp], list[Any]]] = []
+
+    def fail(self, lanes: Lanes, message: str) -> None:
+        for lane in np.flatnonzero(lanes):
+            self.errors[lane] = message
+        self.alive &= ~lanes
+        self.running &= ~lanes
+
+    def emit(self, booleans: bool, lanes: Lanes, value: Any) -> None:
+        indices = np.flatnonzero(lanes)
+        if len(indices):
+            values = np.broadcast_to(value, (self.lanes,))[indices]
+            self.prints.append((booleans, indices, values.tolist()))
+
+    def run(self, resolution: Resolution) -> list[Lane]:
+        n = self.lanes
+        bindings: list[Any] = [np.int64(0)] * resolution.count
+        free: dict[str, Any] = {}
+        # The lanes that run the node being entered. A visit sets it
+        # before each child it yields.
+        mask = np.ones(n, dtype=np.bool_)
+        # For each enclosing loop, the lanes that left it with break and
+        # the lanes that left the current iteration with continue.
+        loops: list[tuple[Lanes, Lanes]] = []
+        running = self.running
+
+        def load(variable: ast.Identifier) -> Any:
+            if variable.binding != FREE:
+                return bindings[variable.binding]
+            if variable.name not in free:
+                raise Exception(f"{variable.location}: Variable '{variable.name}' is not declared.")
+            return free[variable.name]
+
+        def store(variable: ast.Identifier, lanes: Lanes, value: Any) -> None:
+            if variable.binding != FREE:
+                bindings[variable.binding] = np.where(lanes, value, bindings[variable.binding])
+            else:
+                free[variable.name] = np.where(lanes, value, free.get(variable.name, np.int64(0)))
+
+        def visit_literal(node: ast.Literal) -> Any:
+            if type(node.value) is bool:
+                return np.bool_(node.value)
+            return np.int64(wrap(node.value or 0))
+
+        def visit_identifier(node: ast.Identifier) -> Any:
+            return load(node)
+
+        def visit_declaration(node: ast.VariableDeclaration) -> Any:
+            store(node.variable, mask & running, np.int64(0))
+            return np.int64(0)
+
+        def visit_jump(node: ast.Expression) -> Any:
+            if not loops:
+                raise Exception(f"{node.location}: {node} outside loop.")
+            lanes = mask & running
+            broken, continued = loops[-1]
+            (broken if isinstance(node, ast.Break) else continued)[lanes] = True
+            running[lanes] = False
+            return np.int64(0)
+
+        def visit_binary_op(node: ast.BinaryOp) -> Visit[Any]:
+            nonlocal mask
+            lanes = mask & running
+            op = node.op
+            if op == '=':
+                if isinstance(node.left, ast.VariableDeclaration):
+                    target = node.left.variable
+                    store(target, lanes, np.int64(0))
+                elif isinstance(node.left, ast.Identifier):
+                    target = node.left
+                    load(target)
+                else:
+                    raise Exception(f"{node.location}: can't assign to {node.left}.")
+                value = yield node.right
+                store(target, lanes & running, value)
+                return np.int64(0) if isinstance(node.left, ast.VariableDeclaration) else value
+
+            left = yield node.left
+            if op in ('and', 'or'):
+                truth = np.asarray(left, dtype=np.bool_)
+                mask = lanes & running & (truth if op == 'and' else ~truth)
+                right = (yield node.right) if mask.any() else np.False_
+                if op == 'and':
+                    return np.logical_and(truth, right)
+                return np.logical_or(truth, right)
+
+            mask = lanes & running
+            right = yield node.right
+            match op:
+                case '+': return np.add(left, right, dtype=np.int64)
+                case '-': return np.subtract(left, right, dtype=np.int64)
+                case '*': return np.multiply(left, right, dtype=np.int64)
+                case '/' | '%':
+                    zero = np.broadcast_to(right == 0, (n,))
+                    if (lanes & running & zero).any():
+                        self.fail(lanes & running & zero, "Division by zero.")
+                    divisor = np.where(zero, np.int64(1), right)
+                    # Rounded towards zero, as idivq does.
+                    remainder = np.fmod(left, divisor)
+                    if op == '%':
+                        return remainder
+                    return (left - remainder) // divisor
+                case '==': return np.equal(left, right)
+                case '!=': return np.not_equal(left, right)
+                case '<': return np.less(left, right)
+                case '<=': return np.less_equal(left, right)
+                case '>': return np.greater(left, right)
+                case '>=': return np.greater_equal(left, right)
+            raise Exception(f"{node.location}: unknown operator {op}.")
+
+        def visit_unary_op(node: ast.UnaryOp) -> Visit[Any]:
+            value = yield node.right
+            if node.op == '-':
+                return np.negative(value, dtype=np.int64)
+            return np.logical_not(value)
+
+        def visit_conditional(node: ast.Conditional) -> Visit[Any]:
+            nonlocal mask
+            lanes = mask & running
+            if node.op == 'while':
+                broken = np.zeros(n, dtype=np.bool_)
+                continued = np.zeros(n, dtype=np.bool_)
+                loops.append((broken, continued))
+                active = lanes.copy()
+                iterations = 0
+                while True:
+                    mask = active & running
+                    condition = yield node.condition
+                    active &= running & np.asarray(condition, dtype=np.bool_)
+                    if not active.any():
+                        break
+                    if self.max_iterations is not None and iterations == self.max_iterations:
+                        self.fail(active, "Too many loop iterations.")
+                        break
+                    iterations += 1
+                    mask = active
+                    yield node.first
+                    running[continued & self.alive] = True
+                    continued[:] = False
+                    active &= self.alive & ~broken
+                loops.pop()
+                running[broken & self.alive] = True
+                return np.int64(0)
+
+            condition = yield node.condition
+            truth = np.broadcast_to(np.asarray(condition, dtype=np.bool_), (n,))
+            branches: list[Any] = []
+            for branch, taken in ((node.first, truth), (node.second, ~truth)):
+                mask = lanes & running & taken
+                if branch is None or not mask.any():
+                    branches.append(np.int64(0))
+                else:
+                    branches.append((yield branch))
+            if node.second is None:
+                return np.int64(0)
+            return np.where(truth, branches[0], branches[1])
+
+        def visit_function_call(node: ast.FunctionCall) -> Visit[Any]:
+            nonlocal mask
+            lanes = mask & running
+            name = node.function.name
+            arguments = []
+            for param in node.parameters:
+                mask = lanes & running
+                arguments.append((yield param))
+            lanes = lanes & running
+            if name in ('print_int', 'print_bool') and len(arguments) == 1:
+                self.emit(name == 'print_bool', lanes, arguments[0])
+                return np.int64(0)
+            if name == 'read_int' and not arguments:
+                empty = lanes & (self.position >= self.lengths)
+                if empty.any():
+                    self.fail(empty, "read_int: no input.")
+                lanes = lanes & ~empty
+                values = self.table[np.arange(n), np.minimum(self.position, self.table.shape[1] - 1)]
+                self.position[lanes] += 1
+                return values
+            raise Exception(f"{node.location}: unknown function '{name}'.")
+
+        def visit_block(node: ast.Block) -> Visit[Any]:
+            nonlocal mask
+            lanes = mask & running
+            for expression in node.expressions:
+                mask = lanes & running
+                yield expression
+            mask = lanes & running
+            return (yield node.result)
+
+        def unknown_expression(node: ast.Expression) -> Any:
+            raise Exception(f"{node.location}: unknown expression.")
+
+        visits = ast.Dispatch[Callable[..., Visit[Any] | Any]]({
+            ast.Literal: visit_literal,
+            ast.Identifier: visit_identifier,
+            ast.VariableDeclaration: visit_declaration,
+            ast.Break: visit_jump,
+            ast.Continue: visit_jump,
+            ast.BinaryOp: visit_binary_op,
+            ast.UnaryOp: visit_unary_op,
+            ast.Conditional: visit_conditional,
+            ast.FunctionCall: visit_function_call,
+            ast.Block: visit_block,
+        }, unknown_expression)
+
+        value = traverse(self.root, lambda node: visits[type(node)](node))
+        result_type = value_type(self.root)
+        if result_type in (Int, Bool):
+            self.emit(result_type is Bool, self.alive.copy(), value)
+
+        outputs: list[list[str]] = [[] for _ in range(n)]
+        for booleans, indices, values in self.prints:
+            for lane, printed in zip(indices.tolist(), values):
+                if booleans:
+                    outputs[lane].append("true\n" if printed else "false\n")
+                else:
+                    outputs[lane].append(f"{printed}\n")
+        return [Lane("".join(output), error) for output, error in zip(outputs, self.errors)]
@@ -0,0 +1,132 @@
+from dataclasses import dataclass
+from typing import Optional
+from compiler.tokenizer import TokenBuffer, L
+from compiler.parser import parse
+import compiler.ast as ast
+
+@dataclass
+class Edit:
+    """Replacement of `source_code[start:end]` with `text`."""
+    start: int
+    end: int
+    text: str
+
+def reparse(old_tree: ast.Expression, old_tokens: TokenBuffer, edit: Edit) -> tuple[ast.Expression, TokenBuffer]:
+    """Applies an edit to a parsed program and returns the new tree and tokens.
+
+    Only the tokens around the edit are lexed again. The statements of the
+    innermost block containing the edit are reused, except the ones the
+    edit touches, which are parsed again. When the edit could change how
+    the surrounding code parses, the whole program is parsed again, so the
+    result is always the same as `parse(tokenize_buffer(new_source))`.
+
+    The tokens are edited in place, and so are the blocks of the tree that
+    contain the edit, so that an edit takes the same time however long the
+    program is. After an error, the tokens hold the edited source code and
+    the old tree must not be reused with them."""
+    tokens, first, old_stop, new_stop = old_tokens.edit(edit.start, edit.end, edit.text)
+    if first == old_stop == new_stop:
+        # Only whitespace or comments changed.
+        return old_tree, tokens
+    damage = Damage(tokens, first, old_stop, new_stop - old_stop)
+    tree: Optional[ast.Expression] = None
+    if isinstance(old_tree, ast.Block):
+        tree = damage.reparse_block(old_tree, 0, True)
+    if tree is None:
+        tree = parse(tokens)
+    return tree, tokens
+
+class Damage:
+    """The tokens replaced by an edit: the tokens from index `first` to
+    `old_stop` became `tokens[first:old_stop + shift]`."""
+
+    def __init__(self, tokens: TokenBuffer, first: int, old_stop: int, shift: int):
+        self.tokens = tokens
+        self.first = first
+        self.old_stop = old_stop
+        self.shift = shift
+
+    def reparse_block(self, block: ast.Block, start: int, root: bool = False) -> Optional[ast.Expression]:
+        """Parses the damaged statements of the block starting at token
+        `start` again and returns the block, or None if the block has to be
+        parsed again as a whole. The block is changed only if it is returned."""
+        spans = block.spans
+        if not spans:
+            return None
+        braced = spans[0][0] == 1
+        # The final Literal(None) of a block ending in a separator has no tokens.
+        final_literal = spans[-1][0] == spans[-1][1]
+        count = len(spans) - (1 if final_literal else 0)
+        # The braces must survive the edit.
+        if count == 0 or self.first < start + spans[0][0] or self.old_stop > start + spans[-1][1]:
+            return None
+
+        # The statements from i to j overlap the damaged tokens.
+        i = min(spans.first_ending_after(self.first - start), count - 1)
+        j = max(i, min(spans.first_starting_at(self.old_stop - start), count) - 1)
+
+        statement = block.expressions[i] if i < len(block.expressions) else block.result
+        if i == j and isinstance(statement, ast.Block) and self.is_token(start + spans[i][0], "{"):
+            inner = self.reparse_block(statement, start + spans[i][0])
+            if inner is not None:
+                spans.replace(i, i + 1, [(spans[i][0], spans[i][1] + self.shift)], self.shift)
+                block.location = block.result.location
+                return block
+
+        # Without a separator between them, a statement can take over the
+        # tokens of the next one, so those are parsed together.
+        while i > 0 and not self.ends_in_separator(start + spans[i - 1][1]):
+            i -= 1
+        while j < count - 1 and not self.ends_in_separator(start + spans[j][1]):
+            j += 1
+
+        first_token = start + spans[i][0]
+        stop_token = start + spans[j][1] + self.shift
+        try:
+            part = parse([self.tokens[index] for index in range(first_token, stop_token)], block=True)
+        except Exception:
+            return None
+        assert isinstance(part, ast.Block)
+        part_statements = part.expressions + [part.result]
+        part_spans = [(a + first_token - start, b + first_token - start) for a, b in part.spans]
+        ends_in_separator = part.spans[-1][0] == part.spans[-1][1]
+        if ends_in_separator:
+            part_statements.pop()
+            part_spans.pop()
+            if not part_statements:
+                return None
+        elif j < count - 1 or final_literal:
+            # The following statement would have continued the last one.
+            return None
+
+        # The result is kept at the end of the expressions while they change.
+        statements = block.expressions
+        statements.append(block.result)
+        statements[i:j + 1] = part_statements
+        spans.replace(i, j + 1, part_spans, self.shift)
+        if j == count - 1 and ends_in_separator:
+            end = spans[i + len(part_spans) - 1][1]
+            if final_literal:
+                statements.pop()
+            location = self.tokens.source(start + end) if braced else L
+            statements.append(ast.Literal(location, None))
+            spans.replace(i + len(part_spans), len(spans), [(end, end)], 0)
+        block.result = statements.pop()
+        block.location = block.result.location
+
+        if root and not braced and not statements:
+            # A single expression without a separator is not a block.
+            return block.result
+        return block
+
+    def is_token(self, index: int, text: str) -> bool:
+        """Whether the token at index `index` is `text` and was not replaced."""
+        if index >= self.old_stop:
+            index += self.shift
+        elif index >= self.first:
+            return False
+        return self.tokens.text(index) == text
+
+    def ends_in_separator(self, stop: int) -> bool:
+        """Whether the token before index `stop` is a ";" that was not replaced."""
+        return self.is_token(stop - 1, ";")
@@ -1,101 +1,252 @@
+import sys
+from collections import Counter
+from dataclasses import dataclass, field
+from types import GeneratorType
 from typing import Any
 from compiler import ast
-from typing import Optional, Self, Union, Callable
+from typing import Optional, Union, Callable
+from compiler import symtab, transpiler
+from compiler.resolver import FREE, Resolution, resolve
+from compiler.tokenizer import Source
+from compiler.traversal import Visit, traverse
+from compiler.vm import divide, modulo, wrap
 
+# Functions receive their arguments unevaluated and evaluate them by
+# yielding them, as `evaluate` does.
 type Function = Union[
-    Callable[[ast.Expression, ast.Expression, ast.Expression | None, SymTab], Value],
-    Callable[[ast.Expression, ast.Expression, SymTab], Value],
-    Callable[[ast.Expression, SymTab], Value],
+    Callable[[ast.Expression, ast.Expression, ast.Expression | None, SymTab], Visit[Value]],
+    Callable[[ast.Expression, ast.Expression, SymTab], Visit[Value]],
+    Callable[[ast.Expression, SymTab], Visit[Value]],
     Callable[[], None]
 ]
 type Value = int | bool | None | Function
 
-class SymTab:
-    parent : Optional[Self] = None
-    locals: dict
-    def __init__(self, parent: Optional[Self] = None):
-        self.parent = parent
-        self.locals = {}
+# The operators of the builtin functions. The engines call them directly
+# while the symbol table has the builtins of `initialize_top`. Integers
+# wrap around to 64 bits and division and remainders round towards zero,
+# as in the transpiled code and the compiled programs.
+binary_operations: dict[str, Callable[[int | bool, int | bool], Value]] = {
+    'or': lambda a, b: a or b,
+    'and': lambda a, b: a and b,
+    '==': lambda a, b: a == b,
+    '!=': lambda a, b: a != b,
+    '<': lambda a, b: a < b,
+    '<=': lambda a, b: a <= b,
+    '>': lambda a, b: a > b,
+    '>=': lambda a, b: a >= b,
+    '+': lambda a, b: wrap(a + b),
+    '-': lambda a, b: wrap(a - b),
+    '*': lambda a, b: wrap(a * b),
+    '/': divide,
+    '%': modulo
+}
+
+def negate(value: Value) -> Value:
+    if isinstance(value, (int, bool)):
+        return wrap(-value)
+    raise Exception(f"Unary operation unary_- recieved incompatible type.")
+
+def not_op(value: Value) -> Value:
+    if isinstance(value, (int, bool, type(None))):
+        return not value
+    raise Exception(f"Unary operation unary_not recieved incompatible type.")
+
+unary_operations: dict[str, Callable[[Value], Value]] = {
+    'unary_-': negate,
+    'unary_not': not_op,
+}
+
+class OutOfFuel(Exception):
+    """Raised by `interpret` when a run takes more steps than its fuel."""
+
+class Jump(Exception):
+    """Raised by the engines for a break or continue node, its argument,
+    and caught by the loop it jumps out of."""
+
+@dataclass(slots=True, eq=False)
+class Frame:
+    """A node in the tree of stacks of a `Profile`: the nodes being
+    evaluated, from the root down to the one at `location`."""
+    location: Optional[Source]
+    parent: Optional["Frame"]
+    # Evaluations of the node with this stack.
+    count: int = 0
+    children: dict[Source, "Frame"] = field(default_factory=dict)
+
+class Profile:
+    """Counts of the evaluations of the nodes in runs of `interpret`, by
+    the location of the node and by the stack of nodes being evaluated.
+    Blocks are left out, as they have the location of their result."""
+    counts: Counter[Source]
+    # What the node at each location is, like `while` or `+`.
+    labels: dict[Source, str]
+    root: Frame
+
+    def __init__(self) -> None:
+        self.counts = Counter()
+        self.labels = {}
+        self.root = Frame(None, None)
+
+    def enter(self, node: ast.Expression, frame: Frame) -> Frame:
+        location = node.location
+        self.counts[location] += 1
+        if location not in self.labels:
+            self.labels[location] = label(node)
+        child = frame.children.get(location)
+        if child is None:
+            child = frame.children[location] = Frame(location, frame)
+        child.count += 1
+        return child
+
+    def report(self, limit: Optional[int] = None) -> str:
+        """The locations evaluated most, with their share of all steps."""
+        total = self.counts.total()
+        return "".join(
+            f"{count:>12} {100 * count / total:>6.2f}%  {location}  {self.labels[location]}\n"
+            for location, count in self.counts.most_common(limit))
+
+    def collapsed(self) -> str:
+        """The counts by stack in the collapsed stack format of
+        flamegraph.pl: the frames from the root down, separated by
+        semicolons, and the number of evaluations of the last one."""
+        lines = []
+        frames: list[tuple[Frame, str]] = [(frame, "") for frame in reversed(self.root.children.values())]
+        while frames:
+            frame, stack = frames.pop()
+            assert frame.location is not None
+            name = f"{self.labels[frame.location]} {frame.location}".replace(";", ",")
+            stack = f"{stack};{name}" if stack else name
+            lines.append(f"{stack} {frame.count}\n")
+            frames.extend((child, stack) for child in reversed(frame.children.values()))
+        return "".join(lines)
+
+def label(node: ast.Expression) -> str:
+    match node:
+        case ast.BinaryOp() | ast.UnaryOp() | ast.Conditional():
+            return node.op
+        case ast.Identifier():
+            return node.name
+        case ast.Literal():
+            return str(node.value)
+        case ast.VariableDeclaration():
+            return f"var {node.variable.name}"
+        case ast.FunctionCall():
+            return f"{node.function.name}()"
+    return str(node)
+
+class Meter:
+    """Counts the steps of a run of `interpret`, the evaluations of nodes,
+    and stops the run when they exceed `fuel`."""
+    def __init__(self, fuel: Optional[int], profile: Optional[Profile]):
+        self.fuel = fuel
+        self.steps = 0
+        self.profile = profile
+        self.frame = profile.root if profile is not None else None
+
+    def enter(self, node: ast.Expression) -> None:
+        self.steps += 1
+        if self.fuel is not None and self.steps > self.fuel:
+            raise OutOfFuel(f"{node.location} Out of fuel after {self.fuel} steps.")
+        if self.profile is not None and self.frame is not None and type(node) is not ast.Block:
+            self.frame = self.profile.enter(node, self.frame)
+
+    def exit(self, node: ast.Expression) -> None:
+        if self.frame is not None and type(node) is not ast.Block:
+            self.frame = self.frame.parent
+
+    def wrap(self, node: ast.Expression, closure: "Closure") -> "Closure":
+        enter, exit = self.enter, self.exit
+        def metered() -> Value:
+            enter(node)
+            try:
+                return closure()
+            finally:
+                exit(node)
+        return metered
+
+class SymTab(symtab.SymTab[Value]):
+    # Values of the block variables, indexed by binding.
+    bindings: list[Value]
+    # The functions `initialize_top` declared, which the closure engine
+    # replaces with its own versions.
+    builtins: dict[str, Value]
+    # The names that still have their builtin value, set by `interpret`.
+    operators: set[str]
+    # The meter of the run, if it has fuel or a profile.
+    meter: Optional[Meter]
+    def __init__(self) -> None:
+        super().__init__()
+        self.bindings = []
+        self.builtins = {}
+        self.operators = set()
+        self.meter = None
 
     def declare(self, variable: str) -> None:
-        self.locals[variable] = None
+        self.define(variable, None)
 
-    def assign(self, variable: str, value: Value) -> None:
-        if variable in self.locals:
-            self.locals[variable] = value
-        elif self.parent is not None:
-            self.parent.assign(variable, value)
-        else:
+    def read(self, variable: str) -> Value:
+        stack = self.stacks.get(variable)
+        if stack is None:
             raise Exception(f"Variable '{variable}' is not declared.")
+        return stack[-1]
 
-    def read(self, variable: str) -> Value:
-        if variable in self.locals:
-            return self.locals[variable]
-        elif self.parent is not None:
-            return self.parent.read(variable)
+    def declare_variable(self, variable: ast.Identifier) -> None:
+        if variable.binding == FREE:
+            self.declare(variable.name)
         else:
-            raise Exception(f"Variable '{variable}' is not declared.")
+            self.bindings[variable.binding] = None
 
-    def call_function(self, func: str, params: list[ast.Expression | None], scope: Optional[Self] = None) -> Value:
-        if func in self.locals:
-            return self.locals[func](*params, self if scope is None else scope)
-        elif self.parent is not None:
-            return self.parent.call_function(func, params, self if scope is None else scope)
+    def assign_variable(self, variable: ast.Identifier, value: Value) -> None:
+        if variable.binding == FREE:
+            self.assign(variable.name, value)
         else:
+            self.bindings[variable.binding] = value
+
+    def read_variable(self, variable: ast.Identifier) -> Value:
+        if variable.binding == FREE:
+            return self.read(variable.name)
+        return self.bindings[variable.binding]
+
+    def call_function(self, func: str, params: list[ast.Expression | None]) -> Visit[Value]:
+        stack = self.stacks.get(func)
+        if stack is None:
             raise Exception(f"Function '{func}' is not declared.")
+        function: Any = stack[-1]
+        return function(*params, self)
 
     def initialize_top(self) -> None:
-        def binary_op(op: str, sym_tab: SymTab, a: ast.Expression, b: ast.Expression) -> Value:
-            operations: dict[str, Callable[[int | bool, int | bool], Value]] = {
-                'or': lambda a, b: a or b,
-                'and': lambda a, b: a and b,
-                '==': lambda a, b: a == b,
-                '!=': lambda a, b: a != b,
-                '<': lambda a, b: a < b,
-                '<=': lambda a, b: a <= b,
-                '>': lambda a, b: a > b,
-                '>=': lambda a, b: a >= b,
-                '+': lambda a, b: a + b,
-                '-': lambda a, b: a - b,
-                '*': lambda a, b: a * b,
-                '/': lambda a, b: int(a / b),
-                '%': lambda a, b: a % b
-            }
-            left = interpret(a, sym_tab)
-            right = interpret(b, sym_tab)
+        def binary_op(op: str, sym_tab: SymTab, a: ast.Expression, b: ast.Expression) -> Visit[Value]:
+            left = yield a
+            right = yield b
             
             if isinstance(left, (int, bool)) and isinstance(right, (int, bool)):
-                return operations[op](left, right)
+                return binary_operations[op](left, right)
             else:
                 raise Exception(f"Binary operation {op} recieved incompatible type.")
 
-        def unary_op(op: str, sym_tab: SymTab, a: ast.Expression) -> Value:
-            value = interpret(a, sym_tab)
-            match op:
-                case 'unary_-':
-                    if isinstance(value, (int, bool)):
-                        return -value
-                    else:
-                        raise Exception(f"Unary operation {op} recieved incompatible type.")
-                case 'unary_not':
-                    if isinstance(value, (int, bool, type(None))):
-                        return not value
-                    else:
-                        raise Exception(f"Unary operation {op} recieved incompatible type.")
-                case _:
-                    raise Exception(f"Unkown operator {op}")
+        def unary_op(op: str, sym_tab: SymTab, a: ast.Expression) -> Visit[Value]:
+            value = yield a
+            if op not in unary_operations:
+                raise Exception(f"Unkown operator {op}")
+            return unary_operations[op](value)
             
-        def while_clause(sym_tab: SymTab, condition: ast.Expression, expression: ast.Expression) -> Value:
-            while interpret(condition, sym_tab):
-                interpret(expression, sym_tab)
+        def while_clause(sym_tab: SymTab, condition: ast.Expression, expression: ast.Expression) -> Visit[Value]:
+            while (yield condition):
+                try:
+                    yield expression
+                except Jump as jump:
+                    if type(jump.args[0]) is ast.Break:
+                        break
             return None
 
-        def conditional_op(op: str, sym_tab: SymTab, condition: ast.Expression, first: ast.Expression, second: Optional[ast.Expression] = None, ) -> Value:
+        def conditional_op(op: str, sym_tab: SymTab, condition: ast.Expression, first: ast.Expression, second: Optional[ast.Expression] = None, ) -> Visit[Value]:
             match op:
                 case 'if':
-                    return interpret(first, sym_tab) if interpret(condition, sym_tab) else (interpret(second, sym_tab) if second is not None else None)
+                    if (yield condition):
+                        return (yield first)
+                    return (yield second) if second is not None else None
                 case 'while':
-                    return while_clause(sym_tab, condition, first)
+                    return (yield from while_clause(sym_tab, condition, first))
                 case _:
                     raise Exception(f"Unkown operator ${op}")
 
@@ -108,73 +259,430 @@ class SymTab:
         for variable in ['if', 'while']:
             self.declare(variable)
             self.assign(variable, lambda condition, first, second, sym_tab, var=variable: conditional_op(var,sym_tab,condition,first,second))
+        for variable, stack in self.stacks.items():
+            self.builtins[variable] = stack[-1]
         self.declare('unit')
         self.assign('unit', None)
 
-def interpret(node: ast.Expression, sym_tab: SymTab | None = None, ) -> Value:
+def interpret(
+    node: ast.Expression,
+    sym_tab: SymTab | None = None,
+    closures: bool = True,
+    transpile: bool = False,
+    fuel: Optional[int] = None,
+    profile: Optional[Profile] = None,
+    resolution: Optional[Resolution] = None
+) -> Value:
+    """Evaluates `node`. With `closures`, the tree is compiled to closures
+    with `compile_closures` and run, unless it is too deep to run them
+    within the recursion limit. Otherwise the nodes are visited with
+    `evaluate`. Both give the same results and errors. Integers wrap
+    around to 64 bits, as in the compiled programs.
+
+    With `transpile`, the tree is first run as Python code made by
+    compiler.transpiler, if it only uses the builtin operators. It gives
+    the same results. If the code raises, the symbol table is restored
+    and the tree is run again as above, to raise the error with its
+    locations.
+
+    Every evaluation of a node is a step. With `fuel`, OutOfFuel is raised
+    when the run takes more steps. With `profile`, the steps are counted
+    in it. Both need the engines above, so `transpile` is then ignored.
+
+    `resolution` is what `resolve(node)` gave, when the caller has already
+    resolved it."""
     if sym_tab is None:
         sym_tab = SymTab()
         sym_tab.initialize_top()
-        
-    match node:
-        case ast.Literal():
-            return node.value
+    if resolution is None:
+        resolution = resolve(node)
+    count = resolution.count
+    sym_tab.bindings[:] = [None] * count
+    sym_tab.operators = {name for name in sym_tab.builtins if builtin(sym_tab, name)}
+    sym_tab.meter = None
+    if fuel is not None or profile is not None:
+        sym_tab.meter = Meter(fuel, profile)
+        transpile = False
+    if transpile:
+        program = transpiler.transpile(node, count)
+        function = None
+        if program is not None and program.operators <= sym_tab.operators:
+            function = transpiler.load(program.source)
+        if function is not None:
+            stacks = {name: stack.copy() for name, stack in sym_tab.stacks.items()}
+            undo_log = [scope.copy() for scope in sym_tab.undo_log]
+            try:
+                return function(sym_tab) # type: ignore[no-any-return]
+            except Exception:
+                sym_tab.stacks, sym_tab.undo_log = stacks, undo_log
+    try:
+        if closures:
+            # A metered closure calls the closure it wraps, so the closures
+            # take twice the Python stack.
+            limit = sys.getrecursionlimit() // (2 if sym_tab.meter is None else 4)
+            run = compile_closures(node, sym_tab, limit)
+            if run is not None:
+                return run()
+        return visit(node, sym_tab)
+    except Jump as jump:
+        raise Exception(f"{jump.args[0].location}: {jump.args[0]} outside loop.")
 
-        case ast.Identifier():
+def visit(node: ast.Expression, sym_tab: SymTab) -> Value:
+    """Evaluates `node` by visiting the nodes with `evaluate`."""
+    meter = sym_tab.meter
+    if meter is None:
+        return traverse(node, lambda node: evaluate(node, sym_tab))
+
+    def enter(node: ast.Expression) -> Visit[Value] | Value:
+        assert meter is not None
+        meter.enter(node)
+        return evaluate(node, sym_tab)
+
+    return traverse(node, enter, lambda node, value: meter.exit(node))
+
+def located(location: Source, e: Exception) -> Exception:
+    """`e` with `location` in front of its message. Running out of fuel
+    and jumps are raised as is."""
+    if isinstance(e, (OutOfFuel, Jump)):
+        return e
+    return Exception(f"{location} {e.args[0]}")
+
+def evaluate(node: ast.Expression, sym_tab: SymTab) -> Visit[Value] | Value:
+    """Returns the value of a node without children, or the visit that
+    evaluates other nodes."""
+    return evaluators[type(node)](node, sym_tab)
+
+def evaluate_literal(node: ast.Literal, sym_tab: SymTab) -> Value:
+    if type(node.value) is int:
+        return wrap(node.value)
+    return node.value
+
+def evaluate_jump(node: ast.Expression, sym_tab: SymTab) -> Value:
+    raise Jump(node)
+
+def evaluate_identifier(node: ast.Identifier, sym_tab: SymTab) -> Value:
+    try:
+        return sym_tab.read_variable(node)
+    except Exception as e:
+        raise Exception(f"{node.location} {e.args[0]}")
+
+def evaluate_declaration(node: ast.VariableDeclaration, sym_tab: SymTab) -> Value:
+    sym_tab.declare_variable(node.variable)
+    return None
+
+def evaluate_binary_op(node: ast.BinaryOp, sym_tab: SymTab) -> Visit[Value]:
+    if node.op == '=':
+        variable_value: Any = yield node.left
+        match node.left:
+            case ast.Identifier():
+                sym_tab.assign_variable(node.left, (yield node.right))
+            case ast.VariableDeclaration():
+                sym_tab.assign_variable(node.left.variable, (yield node.right))
+            case _:
+                raise Exception(f"{node.location} Can't assign to literal.")
+        return None
+    elif node.op == 'and':
+        try:
+            if not (yield node.left):
+                return False
+            return (yield node.right)
+        except Exception as e:
+            raise located(node.location, e)
+    elif node.op == 'or':
+        try:
+            if (yield node.left):
+                return True
+            return (yield node.right)
+        except Exception as e:
+            raise located(node.location, e)
+    op = node.op
+    try:
+        if op not in sym_tab.operators:
+            return (yield from sym_tab.call_function(op, [node.left, node.right]))
+        left = yield node.left
+        right = yield node.right
+        if isinstance(left, (int, bool)) and isinstance(right, (int, bool)):
+            return binary_operations[op](left, right)
+        raise Exception(f"Binary operation {op} recieved incompatible type.")
+    except Exception as e:
+        raise located(node.location, e)
+
+def evaluate_unary_op(node: ast.UnaryOp, sym_tab: SymTab) -> Visit[Value]:
+    op = "unary_" + node.op
+    try:
+        if op not in sym_tab.operators:
+            return (yield from sym_tab.call_function(op, [node.right]))
+        return unary_operations[op]((yield node.right))
+    except Exception as e:
+        raise located(node.location, e)
+
+def evaluate_block(node: ast.Block, sym_tab: SymTab) -> Visit[Value]:
+    # Block variables are resolved to bindings, so no new scope is needed.
+    for expression in node.expressions:
+        yield expression
+    return (yield node.result)
+
+def evaluate_conditional(node: ast.Conditional, sym_tab: SymTab) -> Visit[Value]:
+    if node.op not in sym_tab.operators:
+        return (yield from sym_tab.call_function(node.op, [node.condition, node.first, node.second]))
+    condition, first = node.condition, node.first
+    if node.op == 'while':
+        # The visits between the loop and a jump are not exited, so the
+        # meter is put back in the loop's frame.
+        meter = sym_tab.meter
+        frame = meter.frame if meter is not None else None
+        while (yield condition):
             try:
-                return sym_tab.read(node.name)
+                yield first
+            except Jump as jump:
+                if meter is not None:
+                    meter.frame = frame
+                if type(jump.args[0]) is ast.Break:
+                    break
+        return None
+    if (yield condition):
+        return (yield first)
+    return (yield node.second) if node.second is not None else None
+
+def unknown_expression(node: ast.Expression, sym_tab: SymTab) -> Value:
+    raise Exception(f"{node.location} Unkown expression: {node}")
+
+evaluators = ast.Dispatch[Callable[..., Visit[Value] | Value]]({
+    ast.Literal: evaluate_literal,
+    ast.Break: evaluate_jump,
+    ast.Continue: evaluate_jump,
+    ast.Identifier: evaluate_identifier,
+    ast.VariableDeclaration: evaluate_declaration,
+    ast.BinaryOp: evaluate_binary_op,
+    ast.UnaryOp: evaluate_unary_op,
+    ast.Block: evaluate_block,
+    ast.Conditional: evaluate_conditional,
+}, unknown_expression)
+
+# The closure engine. Each node is compiled once into a closure that
+# evaluates it, with its operator and the slot of its variable already
+# looked up, so a loop body is not dispatched and resolved again on every
+# iteration. The closures call the closures of their children, so the
+# depth of the tree is limited by the recursion limit.
+
+type Closure = Callable[[], Value]
+
+def compile_closures(node: ast.Expression, sym_tab: SymTab, max_depth: int) -> Optional[Closure]:
+    """Returns a closure that evaluates `node` as `evaluate` does, or None
+    if the tree is deeper than `max_depth`."""
+    depth = 0
+    height = 0
+
+    def enter(node: ast.Expression) -> Visit[Closure] | Closure:
+        nonlocal depth, height
+        depth += 1
+        height = max(height, depth)
+        compiled = compilers[type(node)](node, sym_tab)
+        if sym_tab.meter is None:
+            return compiled
+        if type(compiled) is GeneratorType:
+            return metered(node, compiled, sym_tab.meter)
+        return sym_tab.meter.wrap(node, compiled) # type: ignore[arg-type]
+
+    def exit(node: ast.Expression, closure: Closure) -> None:
+        nonlocal depth
+        depth -= 1
+
+    run = traverse(node, enter, exit)
+    return run if height <= max_depth else None
+
+def metered(node: ast.Expression, compiling: Visit[Closure], meter: Meter) -> Visit[Closure]:
+    closure = yield from compiling
+    return meter.wrap(node, closure)
+
+def evaluated(node: ast.Expression, sym_tab: SymTab) -> Closure:
+    """A closure that visits `node` with `evaluate`, for the functions
+    `compile_closures` does not know."""
+    return lambda: visit(node, sym_tab)
+
+def builtin(sym_tab: SymTab, function: str) -> bool:
+    value = sym_tab.lookup(function)
+    return value is not None and value is sym_tab.builtins.get(function)
+
+def undeclared(location: Source, function: str) -> Closure:
+    def run() -> Value:
+        raise Exception(f"{location} Function '{function}' is not declared.")
+    return run
+
+def compile_literal(node: ast.Literal, sym_tab: SymTab) -> Closure:
+    value = wrap(node.value) if type(node.value) is int else node.value
+    return lambda: value
+
+def compile_jump(node: ast.Expression, sym_tab: SymTab) -> Closure:
+    def jump() -> Value:
+        raise Jump(node)
+    return jump
+
+def compile_identifier(node: ast.Identifier, sym_tab: SymTab) -> Closure:
+    if node.binding != FREE:
+        bindings, binding = sym_tab.bindings, node.binding
+        return lambda: bindings[binding]
+    stacks, name, location = sym_tab.stacks, node.name, node.location
+    def read() -> Value:
+        stack = stacks.get(name)
+        if stack is None:
+            raise Exception(f"{location} Variable '{name}' is not declared.")
+        return stack[-1]
+    return read
+
+def compile_declaration(node: ast.VariableDeclaration, sym_tab: SymTab) -> Closure:
+    variable = node.variable
+    if variable.binding != FREE:
+        bindings, binding = sym_tab.bindings, variable.binding
+        def declare_binding() -> Value:
+            bindings[binding] = None
+            return None
+        return declare_binding
+    def declare() -> Value:
+        sym_tab.declare_variable(variable)
+        return None
+    return declare
+
+def compile_assignment(node: ast.BinaryOp, left: Closure, right: Closure, sym_tab: SymTab) -> Closure:
+    target = node.left
+    if isinstance(target, ast.VariableDeclaration):
+        target = target.variable
+    elif not isinstance(target, ast.Identifier):
+        location = node.location
+        def fail() -> Value:
+            left()
+            raise Exception(f"{location} Can't assign to literal.")
+        return fail
+
+    if target.binding != FREE:
+        bindings, binding = sym_tab.bindings, target.binding
+        def assign_binding() -> Value:
+            left()
+            bindings[binding] = right()
+            return None
+        return assign_binding
+
+    name = target.name
+    def assign() -> Value:
+        left()
+        sym_tab.assign(name, right())
+        return None
+    return assign
+
+def compile_binary_op(node: ast.BinaryOp, sym_tab: SymTab) -> Visit[Closure]:
+    left: Closure = yield node.left
+    right: Closure = yield node.right
+    op, location = node.op, node.location
+    if op == '=':
+        return compile_assignment(node, left, right, sym_tab)
+
+    if op == 'and':
+        def and_op() -> Value:
+            try:
+                return right() if left() else False
             except Exception as e:
-                raise Exception(f"{node.location} {e.args[0]}")
-
-        case ast.BinaryOp():
-            if node.op == '=':
-                variable_value: Any = interpret(node.left, sym_tab)
-                match node.left:
-                    case ast.Identifier():
-                        sym_tab.assign(node.left.name, interpret(node.right, sym_tab))
-                    case ast.VariableDeclaration():
-                        sym_tab.assign(node.left.variable.name, interpret(node.right, sym_tab))
-                    case _:
-                        raise Exception(f"{node.location} Can't assign to literal.")
-                return None
-            elif node.op == 'and':
-                try:
-                    if not interpret(node.left, sym_tab):
-                        return False
-                    return interpret(node.right, sym_tab)
-                except Exception as e:
-                    raise Exception(f"{node.location} {e.args[0]}")
-            elif node.op == 'or':
-                try:
-                    if interpret(node.left, sym_tab):
-                        return True
-                    return interpret(node.right, sym_tab)
-                except Exception as e:
-                    raise Exception(f"{node.location} {e.args[0]}")
-            else:
-                try:
-                    return sym_tab.call_function(node.op, [node.left, node.right])
-                except Exception as e:
-                    raise Exception(f"{node.location} {e.args[0]}")
+                raise located(location, e)
+        return and_op
 
-        case ast.UnaryOp():
+    if op == 'or':
+        def or_op() -> Value:
             try:
-                return sym_tab.call_function("unary_"+node.op, [node.right])
+                return True if left() else right()
             except Exception as e:
-                raise Exception(f"{node.location} {e.args[0]}")
+                raise located(location, e)
+        return or_op
 
-        case ast.VariableDeclaration():
-            sym_tab.declare(node.variable.name)
+    if op not in sym_tab.stacks:
+        return undeclared(location, op)
+    if not builtin(sym_tab, op):
+        return evaluated(node, sym_tab)
+    operation = binary_operations[op]
+    def binary_op() -> Value:
+        try:
+            a = left()
+            b = right()
+            if isinstance(a, (int, bool)) and isinstance(b, (int, bool)):
+                return operation(a, b)
+            raise Exception(f"Binary operation {op} recieved incompatible type.")
+        except Exception as e:
+            raise located(location, e)
+    return binary_op
+
+def compile_unary_op(node: ast.UnaryOp, sym_tab: SymTab) -> Visit[Closure]:
+    right: Closure = yield node.right
+    op, location = f"unary_{node.op}", node.location
+    if op not in sym_tab.stacks:
+        return undeclared(location, op)
+    if not builtin(sym_tab, op):
+        return evaluated(node, sym_tab)
+
+    operation = unary_operations[op]
+    def unary_op() -> Value:
+        try:
+            return operation(right())
+        except Exception as e:
+            raise located(location, e)
+    return unary_op
+
+def compile_block(node: ast.Block, sym_tab: SymTab) -> Visit[Closure]:
+    expressions: list[Closure] = []
+    for expression in node.expressions:
+        expressions.append((yield expression))
+    result: Closure = yield node.result
+    def block() -> Value:
+        for expression in expressions:
+            expression()
+        return result()
+    return block
+
+def compile_conditional(node: ast.Conditional, sym_tab: SymTab) -> Visit[Closure]:
+    condition: Closure = yield node.condition
+    first: Closure = yield node.first
+    second: Optional[Closure] = None
+    if node.second is not None:
+        second = yield node.second
+    if node.op not in sym_tab.stacks:
+        op = node.op
+        def fail() -> Value:
+            raise Exception(f"Function '{op}' is not declared.")
+        return fail
+    if not builtin(sym_tab, node.op):
+        return evaluated(node, sym_tab)
+
+    if node.op == 'while':
+        def while_loop() -> Value:
+            while condition():
+                try:
+                    first()
+                except Jump as jump:
+                    if type(jump.args[0]) is ast.Break:
+                        break
             return None
+        return while_loop
+
+    if second is None:
+        def if_then() -> Value:
+            return first() if condition() else None
+        return if_then
 
-        case ast.Block():
-            new_sym_tab = SymTab(sym_tab)
-            for expression in node.expressions:
-                interpret(expression, new_sym_tab)
-            return interpret(node.result, new_sym_tab)
+    otherwise = second
+    def if_then_else() -> Value:
+        return first() if condition() else otherwise()
+    return if_then_else
 
-        case ast.Conditional():
-            return sym_tab.call_function(node.op, [node.condition, node.first, node.second]) 
+def compile_unknown(node: ast.Expression, sym_tab: SymTab) -> Closure:
+    def fail() -> Value:
+        raise Exception(f"{node.location} Unkown expression: {node}")
+    return fail
 
-        case _:
-            raise Exception(f"{node.location} Unkown expression: {node}")
+compilers = ast.Dispatch[Callable[..., Visit[Closure] | Closure]]({
+    ast.Literal: compile_literal,
+    ast.Break: compile_jump,
+    ast.Continue: compile_jump,
+    ast.Identifier: compile_identifier,
+    ast.VariableDeclaration: compile_declaration,
+    ast.BinaryOp: compile_binary_op,
+    ast.UnaryOp: compile_unary_op,
+    ast.Block: compile_block,
+    ast.Conditional: compile_conditional,
+}, compile_unknown)
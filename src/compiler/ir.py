@@ -2,7 +2,7 @@ from dataclasses import dataclass, fields
 from compiler.tokenizer import Source
 from typing import Any
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class IRVar:
     """Represents the name of a memory location or built-in."""
     name: str
@@ -10,7 +10,7 @@ class IRVar:
     def __str__(self) -> str:
         return self.name
     
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class Instruction():
     """Base class for IR instructions."""
     location: Source
@@ -30,42 +30,42 @@ class Instruction():
         )
         return f'{type(self).__name__}({args})'
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class LoadBoolConst(Instruction):
     """Loads a boolean constant value to `dest`."""
     value: bool
     dest: IRVar
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class LoadIntConst(Instruction):
     """Loads a constant value to `dest`."""
     value: int
     dest: IRVar
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class Copy(Instruction):
     """Copies a value from one variable to another."""
     source: IRVar
     dest: IRVar
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class Call(Instruction):
     """Calls a function or built-in."""
     fun: IRVar
     args: list[IRVar]
     dest: IRVar
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class Label(Instruction):
     """Marks the destination of a jump instruction."""
     name: str
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class Jump(Instruction):
     """Unconditionally continues execution from the given label."""
     label: Label
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class CondJump(Instruction):
     """Continues execution from `then_label` if `cond` is true, otherwise from `else_label`."""
     cond: IRVar
@@ -1,14 +1,23 @@
-from compiler import ast, ir
+from compiler import ast, ir, type_checker
 from compiler.symtab import SymTab
-from compiler.types import Bool, Int, Type, Unit
+from compiler.types import Any, Bool, Int, Type, Unit
 from compiler.ir import IRVar, Label, Source
-from typing import List
+from compiler.resolver import FREE, Resolution, resolve
+from compiler.traversal import Visit, traverse
+from typing import Callable, List, Optional
 
 def generate_ir(
     # 'root_types' parameter should map all global names
     # like 'print_int' and '+' to their types.
     root_types: dict[IRVar, Type],
-    root_expr: ast.Expression
+    root_expr: ast.Expression,
+    # With 'typecheck', the tree is also type checked in the
+    # same traversal, with the results and errors of calling
+    # compiler.type_checker.typecheck first.
+    typecheck: bool = False,
+    # What compiler.resolver.resolve gave for 'root_expr', when
+    # the caller has already resolved it.
+    resolution: Optional[Resolution] = None
 ) -> list[ir.Instruction]:
     var_types: dict[IRVar, Type] = root_types.copy()
     labels: dict[str, list[Label]] = {}
@@ -20,6 +29,27 @@ def generate_ir(
     var_types[var_unit] = Unit
     global_var_n = len (var_types)
 
+    # IR variables of the block variables, indexed by binding.
+    if resolution is None:
+        resolution = resolve(root_expr)
+    binding_vars: list[Optional[IRVar]] = [None] * resolution.count
+
+    # Types of the names, when type checking.
+    types = type_checker.SymTab()
+    if typecheck:
+        types.initialize_top()
+        types.bindings[:] = [Any] * resolution.count
+
+    # When type checking, the errors of this stage are kept
+    # until the whole tree is checked, as type errors come
+    # first when the type checker runs before this stage.
+    errors: list[Exception] = []
+
+    def fail(message: str) -> None:
+        if not typecheck:
+            raise Exception(message)
+        errors.append(Exception(message))
+
     def new_var(t: Type) -> IRVar:
         # Create a new unique IR variable and
         # add it to var_types
@@ -36,219 +66,341 @@ def generate_ir(
             labels[name] = [Label(loc, name)]
         return labels[name][-1]
 
+    def read_variable(st: SymTab[IRVar], variable: ast.Identifier) -> IRVar:
+        binding = variable.binding
+        while binding != FREE:
+            var = binding_vars[binding]
+            if var is not None:
+                return var
+            # Only the initializer of `var x = ...` reads x before the
+            # declaration is visited. It sees the x the declaration shadows.
+            binding = resolution.shadows[binding]
+        return read(st, variable.name)
+
+    def read(st: SymTab[IRVar], name: str) -> IRVar:
+        try:
+            return st.read(name)
+        except Exception as e:
+            fail(e.args[0])
+            return var_unit
+
+    def declare_variable(st: SymTab[IRVar], declaration: ast.VariableDeclaration) -> IRVar:
+        variable = declaration.variable
+        if variable.binding == FREE:
+            try:
+                st.declare(variable.name)
+            except Exception as e:
+                fail(e.args[0])
+            st.assign(variable.name, new_var(variable.type))
+        else:
+            if variable.binding in resolution.redeclarations:
+                fail(f"Local variable '{variable.name}' is already declared.")
+            binding_vars[variable.binding] = new_var(variable.type)
+        return read_variable(st, variable)
+
+    def leaf_type(expr: ast.Expression) -> Type:
+        t = type_checker.typecheck_resolve(expr, types)
+        assert isinstance(t, Type)
+        return t
+
+    def declare_type(declaration: ast.VariableDeclaration) -> None:
+        type_checker.declare(declaration, types)
+        declaration.type = declaration.variable.type = leaf_type(declaration.variable)
+
     # We collect the IR instructions that we generate
     # into this list.
     ins: list[ir.Instruction] = []
 
-    # This function visits an AST node,
-    # appends IR instructions to 'ins',
-    # and returns the IR variable where
+    # These functions visit an AST node,
+    # append IR instructions to 'ins',
+    # and return the IR variable where
     # the emitted IR instructions put the result.
+    # For nodes with children they return a generator
+    # that visits the children by yielding them to
+    # 'traverse', which sends back their variables.
     #
-    # It uses a symbol table to map local variables
-    # (which may be shadowed) to unique IR variables.
-    # The symbol table will be updated in the same way as
-    # in the interpreter and type checker.
-    def visit(st: SymTab[IRVar], expr: ast.Expression) -> IRVar:
+    # Block variables (which may be shadowed) are mapped to
+    # unique IR variables through their resolved bindings.
+    # Other names are looked up in the symbol table, which
+    # is updated in the same way as in the interpreter and
+    # type checker.
+    def visit_continue(st: SymTab[IRVar], expr: ast.Continue) -> IRVar:
         loc = expr.location
+        if typecheck:
+            expr.type = leaf_type(expr)
+        if len(loop_start) == 0:
+            fail("Continue outside loop.")
+        else:
+            ins.append(ir.Jump(loc, loop_start[-1]))
+        return var_unit
 
-        match expr:
-            case ast.Continue():
-                if len(loop_start) == 0:
-                    raise Exception("Continue outside loop.")
-                ins.append(ir.Jump(loc, loop_start[-1]))
-                return var_unit
-
-            case ast.Break():
-                if len(loop_end) == 0:
-                    raise Exception("Break outside loop.")
-                ins.append(ir.Jump(loc, loop_end[-1]))
-                return var_unit
-
-            case ast.Literal():
-                # Create an IR variable to hold the value,
-                # and emit the correct instruction to
-                # load the constant value.
-                match expr.value:
-                    case bool():
-                        var = new_var(Bool)
-                        ins.append(ir.LoadBoolConst(loc, expr.value, var))
-                    case int():
-                        var = new_var(Int)
-                        ins.append(ir.LoadIntConst(loc, expr.value, var))
-                    case None:
-                        var = var_unit
-                    case _:
-                        raise Exception(f"{loc}: unsupported literal: {type(expr.value)}")
-
-                # Return the variable that holds
-                # the loaded value.
-                return var
+    def visit_break(st: SymTab[IRVar], expr: ast.Break) -> IRVar:
+        loc = expr.location
+        if typecheck:
+            expr.type = leaf_type(expr)
+        if len(loop_end) == 0:
+            fail("Break outside loop.")
+        else:
+            ins.append(ir.Jump(loc, loop_end[-1]))
+        return var_unit
 
-            case ast.Identifier():
-                # Look up the IR variable that corresponds to
-                # the source code variable.
-                return st.read(expr.name)
-
-            case ast.VariableDeclaration():
-                st.declare(expr.variable.name)
-                st.assign(expr.variable.name, new_var(expr.variable.type))
-                return visit(st, expr.variable)
-
-            case ast.BinaryOp():
-                
-                match expr.op:
-                    case '=':
-                        var_right = visit(st, expr.right)
-                        var_left = visit(st, expr.left)
-                        ins.append(ir.Copy(loc, var_right, var_left))
-                        return var_left if type(expr.left) != ast.VariableDeclaration else var_unit
-                    case 'and':
-                        l_left = new_label(loc, "left_circut")
-                        l_right = new_label(loc, "right_eval")
-                        l_end = new_label(loc, "and_end")
-
-                        var_left = visit(st, expr.left)
-                        
-                        ins.append(ir.CondJump(loc, var_left, l_right, l_left))
-
-                        ins.append(l_right)
-                        var_right = visit(st, expr.right)
-                        var_result = new_var(expr.type)
-                        ins.append(ir.Copy(loc, var_right, var_result))
-                        ins.append(ir.Jump(loc, l_end))
-
-                        ins.append(l_left)
-                        ins.append(ir.LoadBoolConst(loc, False, var_result))
-                        ins.append(ir.Jump(loc, l_end))
-
-                        ins.append(l_end)
-                        return var_result
-                    case 'or':
-                        l_left = new_label(loc, "left_circut")
-                        l_right = new_label(loc, "right_eval")
-                        l_end = new_label(loc, "or_end")
-                        
-                        var_left = visit(st, expr.left)
-                        
-                        ins.append(ir.CondJump(loc, var_left, l_left, l_right))
-
-                        ins.append(l_right)
-                        var_right = visit(st, expr.right)
-                        var_result = new_var(expr.type)
-                        ins.append(ir.Copy(loc, var_right, var_result))
-                        ins.append(ir.Jump(loc, l_end))
-
-                        ins.append(l_left)
-                        ins.append(ir.LoadBoolConst(loc, True, var_result))
-                        ins.append(ir.Jump(loc, l_end))
-
-                        ins.append(l_end)
-                        return var_result
-                    case _:
-                        # Ask the symbol table to return the variable that refers
-                        # to the operator to call.
-                        var_op = st.read(expr.op)
-                        # Recursively emit instructions to calculate the operands.
-                        var_left = visit(st, expr.left)
-                        var_right = visit(st, expr.right)
-                        var_result = new_var(expr.type)
-                        # Generate variable to hold the result.
-                        
-                        # Emit a Call instruction that writes to that variable.
-                        ins.append(ir.Call(loc, var_op, [var_left, var_right], var_result))
-                        return var_result
-
-            case ast.UnaryOp():
-                var_op = st.read(f"unary_{expr.op}")
-                var_value = visit(st, expr.right)
-                var_result = new_var(expr.type)
-                ins.append(ir.Call(loc, var_op, [var_value], var_result))
-                return var_result
+    def visit_literal(st: SymTab[IRVar], expr: ast.Literal) -> IRVar:
+        loc = expr.location
+        if typecheck:
+            expr.type = leaf_type(expr)
+        # Create an IR variable to hold the value,
+        # and emit the correct instruction to
+        # load the constant value.
+        match expr.value:
+            case bool():
+                var = new_var(Bool)
+                ins.append(ir.LoadBoolConst(loc, expr.value, var))
+            case int():
+                var = new_var(Int)
+                ins.append(ir.LoadIntConst(loc, expr.value, var))
+            case None:
+                var = var_unit
+            case _:
+                raise Exception(f"{loc}: unsupported literal: {type(expr.value)}")
+
+        # Return the variable that holds
+        # the loaded value.
+        return var
 
-            case ast.Conditional():
-                # Create (but don't emit) some jump targets.
-                
-                # Recursively emit instructions for
-                # evaluating the condition.
-                
-                if expr.op == "if" and expr.second is None:
-                    var_cond = visit(st, expr.condition)
-                    l_then = new_label(loc, "if_then")
-                    l_end = new_label(loc, "if_end")
-                    # Emit a conditional jump instruction
-                    # to jump to 'l_then' or 'l_end',
-                    # depending on the content of 'var_cond'.
-                    ins.append(ir.CondJump(loc, var_cond, l_then, l_end))
-
-                    # Emit the label that marks the beginning of
-                    # the "then" branch.
-                    ins.append(l_then)
-                    # Recursively emit instructions for the "then" branch.
-                    visit(st, expr.first)
-
-                    # Emit the label that we jump to
-                    # when we don't want to go to the "then" branch.
-                    ins.append(l_end)
-                    # An if expression doesn't return anything, so we
-                    # return a special variable "unit".
-                    return var_unit
-                elif expr.op == "if" and expr.second is not None:
-                    var_cond = visit(st, expr.condition)
-                    l_then = new_label(loc, "if_then")
-                    l_end = new_label(loc, "if_end")
-                    # "if-then-else" case
-                    l_else = new_label(loc, "if_else")
-                    result = new_var(expr.type)
-                    ins.append(ir.CondJump(loc, var_cond, l_then, l_else))
-                    ins.append(l_then)
-                    ins.append(ir.Copy(loc, visit(st, expr.first), result))
-                    ins.append(ir.Jump(loc, l_end))
-                    ins.append(l_else)
-                    ins.append(ir.Copy(loc, visit(st, expr.second), result))
-                    ins.append(l_end)
-                    # An if-else expression returns what it evaluates.
-                    return result
+    def visit_identifier(st: SymTab[IRVar], expr: ast.Identifier) -> IRVar:
+        if typecheck:
+            expr.type = leaf_type(expr)
+        # Look up the IR variable that corresponds to
+        # the source code variable.
+        return read_variable(st, expr)
+
+    def visit_declaration(st: SymTab[IRVar], expr: ast.VariableDeclaration) -> IRVar:
+        if typecheck:
+            declare_type(expr)
+        return declare_variable(st, expr)
+
+    def visit_binary_op(st: SymTab[IRVar], expr: ast.BinaryOp) -> Visit[IRVar]:
+        loc = expr.location
+        match expr.op:
+            case '=':
+                left = expr.left
+                if typecheck and isinstance(left, ast.VariableDeclaration):
+                    # The type checker visits the left side first.
+                    declare_type(left)
+                elif typecheck and isinstance(left, ast.Identifier):
+                    left.type = leaf_type(left)
+                elif typecheck:
+                    # An error, found once both sides are checked.
+                    yield left
+                    yield expr.right
+                    type_checker.assignment_type(expr, left.type, expr.right.type, types)
+                var_right = yield expr.right
+                if typecheck:
+                    expr.type = type_checker.assignment_type(expr, left.type, expr.right.type, types)
+                if isinstance(left, ast.VariableDeclaration):
+                    var_left = declare_variable(st, left)
+                elif isinstance(left, ast.Identifier):
+                    var_left = read_variable(st, left)
                 else:
-                    l_while_start = new_label(loc, "while_start")
-                    l_while_body = new_label(loc, "while_body")
-                    l_while_end = new_label(loc, "while_end")
-                    ins.append(l_while_start)
-                    var_cond = visit(st, expr.condition)
-                    ins.append(ir.CondJump(loc, var_cond, l_while_body, l_while_end))
-                    ins.append(l_while_body)
-                    loop_start.append(l_while_start)
-                    loop_end.append(l_while_end)
-                    visit(st, expr.first)
-                    loop_start.pop()
-                    loop_end.pop()
-
-                    ins.append(ir.Jump(loc, l_while_start))
-                    ins.append(l_while_end)
-                    # A while expression doesn't return anything, so we
-                    # return a special variable "unit".
-                    return var_unit
-
-            case ast.FunctionCall():
-                var_func = st.read(expr.function.name)
-                var_params: List[IRVar] = []
-                
-                for param in expr.parameters:
-                    var_params.append(visit(st, param))
+                    var_left = yield left
+                ins.append(ir.Copy(loc, var_right, var_left))
+                return var_left if not isinstance(expr.left, ast.VariableDeclaration) else var_unit
+            case 'and':
+                l_left = new_label(loc, "left_circut")
+                l_right = new_label(loc, "right_eval")
+                l_end = new_label(loc, "and_end")
+
+                var_left = yield expr.left
 
+                ins.append(ir.CondJump(loc, var_left, l_right, l_left))
+
+                ins.append(l_right)
+                var_right = yield expr.right
+                if typecheck:
+                    expr.type = type_checker.binary_op_type(expr, expr.left.type, expr.right.type, types)
                 var_result = new_var(expr.type)
-                
-                ins.append(ir.Call(loc, var_func, var_params, var_result))
+                ins.append(ir.Copy(loc, var_right, var_result))
+                ins.append(ir.Jump(loc, l_end))
+
+                ins.append(l_left)
+                ins.append(ir.LoadBoolConst(loc, False, var_result))
+                ins.append(ir.Jump(loc, l_end))
+
+                ins.append(l_end)
                 return var_result
+            case 'or':
+                l_left = new_label(loc, "left_circut")
+                l_right = new_label(loc, "right_eval")
+                l_end = new_label(loc, "or_end")
 
-            case ast.Block():
-                new_st = SymTab(st)
-                for expression in expr.expressions:
-                    visit(new_st, expression)
-                return visit(new_st, expr.result)
+                var_left = yield expr.left
 
+                ins.append(ir.CondJump(loc, var_left, l_left, l_right))
+
+                ins.append(l_right)
+                var_right = yield expr.right
+                if typecheck:
+                    expr.type = type_checker.binary_op_type(expr, expr.left.type, expr.right.type, types)
+                var_result = new_var(expr.type)
+                ins.append(ir.Copy(loc, var_right, var_result))
+                ins.append(ir.Jump(loc, l_end))
+
+                ins.append(l_left)
+                ins.append(ir.LoadBoolConst(loc, True, var_result))
+                ins.append(ir.Jump(loc, l_end))
+
+                ins.append(l_end)
+                return var_result
             case _:
-                raise Exception(f"{loc}: unknown expression.")
+                # Ask the symbol table to return the variable that refers
+                # to the operator to call.
+                var_op = read(st, expr.op)
+                # Recursively emit instructions to calculate the operands.
+                var_left = yield expr.left
+                var_right = yield expr.right
+                if typecheck:
+                    expr.type = type_checker.binary_op_type(expr, expr.left.type, expr.right.type, types)
+                var_result = new_var(expr.type)
+                # Generate variable to hold the result.
+
+                # Emit a Call instruction that writes to that variable.
+                ins.append(ir.Call(loc, var_op, [var_left, var_right], var_result))
+                return var_result
+
+    def visit_unary_op(st: SymTab[IRVar], expr: ast.UnaryOp) -> Visit[IRVar]:
+        loc = expr.location
+        var_op = read(st, f"unary_{expr.op}")
+        var_value = yield expr.right
+        if typecheck:
+            expr.type = type_checker.unary_op_type(expr, expr.right.type, types)
+        var_result = new_var(expr.type)
+        ins.append(ir.Call(loc, var_op, [var_value], var_result))
+        return var_result
+
+    def visit_conditional(st: SymTab[IRVar], expr: ast.Conditional) -> Visit[IRVar]:
+        loc = expr.location
+        # Create (but don't emit) some jump targets.
+
+        # Recursively emit instructions for
+        # evaluating the condition.
+
+        if expr.op == "if" and expr.second is None:
+            var_cond = yield expr.condition
+            l_then = new_label(loc, "if_then")
+            l_end = new_label(loc, "if_end")
+            # Emit a conditional jump instruction
+            # to jump to 'l_then' or 'l_end',
+            # depending on the content of 'var_cond'.
+            ins.append(ir.CondJump(loc, var_cond, l_then, l_end))
+
+            # Emit the label that marks the beginning of
+            # the "then" branch.
+            ins.append(l_then)
+            # Recursively emit instructions for the "then" branch.
+            yield expr.first
+            if typecheck:
+                type_checker.check_condition(expr.condition.type)
+                expr.type = type_checker.conditional_type(expr, expr.first.type, None)
+
+            # Emit the label that we jump to
+            # when we don't want to go to the "then" branch.
+            ins.append(l_end)
+            # An if expression doesn't return anything, so we
+            # return a special variable "unit".
+            return var_unit
+        elif expr.op == "if" and expr.second is not None:
+            var_cond = yield expr.condition
+            l_then = new_label(loc, "if_then")
+            l_end = new_label(loc, "if_end")
+            # "if-then-else" case
+            l_else = new_label(loc, "if_else")
+            result = new_var(expr.type)
+            ins.append(ir.CondJump(loc, var_cond, l_then, l_else))
+            ins.append(l_then)
+            ins.append(ir.Copy(loc, (yield expr.first), result))
+            if typecheck:
+                type_checker.check_condition(expr.condition.type)
+            ins.append(ir.Jump(loc, l_end))
+            ins.append(l_else)
+            ins.append(ir.Copy(loc, (yield expr.second), result))
+            if typecheck:
+                # The type of the result is known once both branches are.
+                expr.type = var_types[result] = type_checker.conditional_type(expr, expr.first.type, expr.second.type)
+            ins.append(l_end)
+            # An if-else expression returns what it evaluates.
+            return result
+        else:
+            l_while_start = new_label(loc, "while_start")
+            l_while_body = new_label(loc, "while_body")
+            l_while_end = new_label(loc, "while_end")
+            ins.append(l_while_start)
+            var_cond = yield expr.condition
+            ins.append(ir.CondJump(loc, var_cond, l_while_body, l_while_end))
+            ins.append(l_while_body)
+            loop_start.append(l_while_start)
+            loop_end.append(l_while_end)
+            yield expr.first
+            loop_start.pop()
+            loop_end.pop()
+            if typecheck:
+                type_checker.check_condition(expr.condition.type)
+                second_type = None
+                if expr.second is not None:
+                    yield expr.second
+                    second_type = expr.second.type
+                expr.type = type_checker.conditional_type(expr, expr.first.type, second_type)
+
+            ins.append(ir.Jump(loc, l_while_start))
+            ins.append(l_while_end)
+            # A while expression doesn't return anything, so we
+            # return a special variable "unit".
+            return var_unit
+
+    def visit_function_call(st: SymTab[IRVar], expr: ast.FunctionCall) -> Visit[IRVar]:
+        loc = expr.location
+        var_func = read_variable(st, expr.function)
+        if typecheck:
+            expr.function.type = leaf_type(expr.function)
+        var_params: List[IRVar] = []
+
+        for param in expr.parameters:
+            var_params.append((yield param))
+        if typecheck:
+            expr.type = type_checker.function_call_type(expr, expr.function.type, [param.type for param in expr.parameters])
+
+        var_result = new_var(expr.type)
+
+        ins.append(ir.Call(loc, var_func, var_params, var_result))
+        return var_result
+
+    def visit_block(st: SymTab[IRVar], expr: ast.Block) -> Visit[IRVar]:
+        loc = expr.location
+        # Block variables are resolved to bindings, so no new scope is needed.
+        for expression in expr.expressions:
+            yield expression
+        var_result = yield expr.result
+        if typecheck:
+            expr.type = expr.result.type
+        return var_result
+
+    def unknown_expression(st: SymTab[IRVar], expr: ast.Expression) -> IRVar:
+        loc = expr.location
+        if typecheck:
+            raise Exception(f"Unknown expression {expr}")
+        raise Exception(f"{loc}: unknown expression.")
+
+    handlers = ast.Dispatch[Callable[..., Visit[IRVar] | IRVar]]({
+        ast.Continue: visit_continue,
+        ast.Break: visit_break,
+        ast.Literal: visit_literal,
+        ast.Identifier: visit_identifier,
+        ast.VariableDeclaration: visit_declaration,
+        ast.BinaryOp: visit_binary_op,
+        ast.UnaryOp: visit_unary_op,
+        ast.Conditional: visit_conditional,
+        ast.FunctionCall: visit_function_call,
+        ast.Block: visit_block,
+    }, unknown_expression)
 
     # Convert 'root_types' into a SymTab
     # that maps all available global names to
@@ -256,12 +408,14 @@ def generate_ir(
     # In the Assembly generator stage, we will give
     # definitions for these globals. For now,
     # they just need to exist.
-    root_symtab = SymTab[IRVar](parent=None)
+    root_symtab = SymTab[IRVar]()
     for v in root_types.keys():
         root_symtab.declare(v.name)
         root_symtab.assign(v.name, v)
     # Start visiting the AST from the root.
-    var_final_result = visit(root_symtab, root_expr)
+    var_final_result = traverse(root_expr, lambda expr: handlers[type(expr)](root_symtab, expr))
+    if errors:
+        raise errors[0]
     dest = new_var(Unit)
     if var_types[var_final_result] == Int:
         # Emit a call to 'print_int'
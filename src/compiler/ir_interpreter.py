@@ -0,0 +1,139 @@
+import sys
+from collections import Counter
+from typing import Callable, TextIO
+from compiler import ir
+from compiler.assembly_generator import get_all_ir_variables
+from compiler.vm import divide, modulo, read_int, wrap
+
+def add(a: int, b: int) -> int:
+    return wrap(a + b)
+
+def subtract(a: int, b: int) -> int:
+    return wrap(a - b)
+
+def multiply(a: int, b: int) -> int:
+    return wrap(a * b)
+
+# The functions the assembly generator inlines. Like the generated code,
+# they work on 64 bit integers, with 1 for true and 0 for false.
+intrinsics: dict[str, Callable[..., int]] = {
+    '+': add,
+    '-': subtract,
+    '*': multiply,
+    '/': divide,
+    '%': modulo,
+    '==': lambda a, b: int(a == b),
+    '!=': lambda a, b: int(a != b),
+    '<': lambda a, b: int(a < b),
+    '<=': lambda a, b: int(a <= b),
+    '>': lambda a, b: int(a > b),
+    '>=': lambda a, b: int(a >= b),
+    'unary_-': lambda a: wrap(-a),
+    'unary_not': lambda a: a ^ 1,
+}
+builtins = ['print_int', 'print_bool', 'read_int']
+
+# Kinds of the prepared instructions.
+CONST, COPY, UNARY, BINARY, PRINT_INT, PRINT_BOOL, READ_INT, JUMP, COND_JUMP = range(9)
+
+def prepare(instructions: list[ir.Instruction]) -> tuple[list[tuple], list[ir.Instruction], int]:
+    """Turns `instructions` into tuples of a kind and its operands, with
+    variables as slot numbers and labels as indices of the tuples. Gives
+    the tuples, the instruction of each tuple and the number of slots."""
+    variables = get_all_ir_variables(instructions, list(intrinsics) + builtins)
+    slots = {var: slot for slot, var in enumerate(variables)}
+    targets: dict[str, int] = {}
+    kept: list[ir.Instruction] = []
+    for insn in instructions:
+        if isinstance(insn, ir.Label):
+            targets[insn.name] = len(kept)
+        else:
+            kept.append(insn)
+
+    def target(label: ir.Label) -> int:
+        if label.name not in targets:
+            raise Exception(f"{label.location}: unknown label '{label.name}'.")
+        return targets[label.name]
+
+    code: list[tuple] = []
+    for insn in kept:
+        match insn:
+            case ir.LoadIntConst():
+                code.append((CONST, wrap(insn.value), slots[insn.dest]))
+            case ir.LoadBoolConst():
+                code.append((CONST, int(insn.value), slots[insn.dest]))
+            case ir.Copy():
+                code.append((COPY, slots[insn.source], slots[insn.dest]))
+            case ir.Jump():
+                code.append((JUMP, target(insn.label)))
+            case ir.CondJump():
+                code.append((COND_JUMP, slots[insn.cond], target(insn.then_label), target(insn.else_label)))
+            case ir.Call():
+                name = insn.fun.name
+                args = [slots[arg] for arg in insn.args]
+                if name in intrinsics and len(args) == 1:
+                    code.append((UNARY, intrinsics[name], args[0], slots[insn.dest]))
+                elif name in intrinsics and len(args) == 2:
+                    code.append((BINARY, intrinsics[name], args[0], args[1], slots[insn.dest]))
+                elif name in ('print_int', 'print_bool') and len(args) == 1:
+                    code.append((PRINT_INT if name == 'print_int' else PRINT_BOOL, args[0]))
+                elif name == 'read_int' and not args:
+                    code.append((READ_INT, slots[insn.dest]))
+                else:
+                    raise Exception(f"{insn.location}: can't call '{name}' with {len(args)} arguments.")
+            case _:
+                raise Exception(f"{insn.location}: unknown instruction {insn}.")
+    return code, kept, len(variables)
+
+def run(
+    instructions: list[ir.Instruction],
+    stdin: TextIO = sys.stdin,
+    stdout: TextIO = sys.stdout
+) -> Counter[str]:
+    """Runs `instructions` like the executable made from them would. The
+    output is written to `stdout` when the program ends or fails. Gives
+    the number of instructions run, by instruction class. Labels are not
+    counted."""
+    code, kept, slot_count = prepare(instructions)
+    slots = [0] * slot_count
+    executed = [0] * len(code)
+    output: list[str] = []
+    end = len(code)
+    pc = 0
+    try:
+        while pc < end:
+            executed[pc] += 1
+            insn = code[pc]
+            kind = insn[0]
+            if kind == BINARY:
+                slots[insn[4]] = insn[1](slots[insn[2]], slots[insn[3]])
+                pc += 1
+            elif kind == COND_JUMP:
+                pc = insn[2] if slots[insn[1]] else insn[3]
+            elif kind == COPY:
+                slots[insn[2]] = slots[insn[1]]
+                pc += 1
+            elif kind == CONST:
+                slots[insn[2]] = insn[1]
+                pc += 1
+            elif kind == JUMP:
+                pc = insn[1]
+            elif kind == UNARY:
+                slots[insn[3]] = insn[1](slots[insn[2]])
+                pc += 1
+            elif kind == PRINT_INT:
+                output.append(f"{slots[insn[1]]}\n")
+                pc += 1
+            elif kind == PRINT_BOOL:
+                output.append("true\n" if slots[insn[1]] else "false\n")
+                pc += 1
+            else:
+                slots[insn[1]] = read_int(stdin)
+                pc += 1
+    finally:
+        stdout.write("".join(output))
+    counts: Counter[str] = Counter()
+    for instruction, count in zip(kept, executed):
+        if count:
+            counts[type(instruction).__name__] += count
+    return counts
@@ -0,0 +1,323 @@
+"""Runs the output of compiler.assembly_generator in this process.
+
+The assembly is encoded to x86-64 machine code here, without `as` and
+`ld`, placed in memory mapped executable with mmap and called through
+ctypes. print_int, print_bool and read_int call back into Python, which
+collects the output and reads the input from streams.
+
+The code runs natively and can't be stopped: only run trusted programs,
+as a loop that never ends hangs the process. It needs x86-64 and a
+System V platform like Linux."""
+import ctypes
+import mmap
+import platform
+import re
+import sys
+from functools import cache
+from typing import Any, Optional, TextIO
+from compiler.vm import read_int
+
+registers = {
+    name: number for number, name in enumerate(
+        ['rax', 'rcx', 'rdx', 'rbx', 'rsp', 'rbp', 'rsi', 'rdi',
+         'r8', 'r9', 'r10', 'r11', 'r12', 'r13', 'r14', 'r15'])
+}
+
+# Opcodes of `op reg, r/m`, `op r/m, reg` and the extension of
+# `op $imm, r/m`, for the arithmetic instructions.
+arithmetic = {
+    'addq': (0x01, 0x03, 0), 'subq': (0x29, 0x2B, 5),
+    'xorq': (0x31, 0x33, 6), 'xor': (0x31, 0x33, 6),
+    'cmpq': (0x39, 0x3B, 7),
+}
+conditions = {'e': 0x4, 'ne': 0x5, 'l': 0xC, 'ge': 0xD, 'le': 0xE, 'g': 0xF}
+
+# Register or memory operands: a register number, or a base register
+# and a displacement.
+type Operand = int | tuple[int, int]
+
+class Unencodable(Exception):
+    pass
+
+def operand(text: str) -> Operand | str:
+    """A register, memory reference or `$immediate`, which is kept as
+    text."""
+    if text.startswith('$'):
+        return text
+    if (m := re.fullmatch(r'%(\w+)', text)) is not None and m[1] in registers:
+        return registers[m[1]]
+    if (m := re.fullmatch(r'(-?\d*)\(%(\w+)\)', text)) is not None and m[2] in registers:
+        return (registers[m[2]], int(m[1] or 0))
+    raise Unencodable(f"operand '{text}'")
+
+def instruction(opcode: bytes, reg: int, rm: Operand, wide: bool = True) -> bytes:
+    """An instruction with a ModRM byte for `rm` and `reg` in its reg
+    field, which is an extension of the opcode for some. It has 64 bit
+    operands if `wide`."""
+    rex = 0x40 | (8 if wide else 0) | (4 if reg >= 8 else 0)
+    if isinstance(rm, int):
+        rex |= 1 if rm >= 8 else 0
+        encoded = bytes([0xC0 | (reg & 7) << 3 | rm & 7])
+    else:
+        base, displacement = rm
+        rex |= 1 if base >= 8 else 0
+        # A base of rbp or r13 needs a displacement, and one of rsp or
+        # r12 a SIB byte.
+        if displacement == 0 and base & 7 != 5:
+            mode, tail = 0x00, b''
+        elif -128 <= displacement < 128:
+            mode, tail = 0x40, displacement.to_bytes(1, 'little', signed=True)
+        else:
+            mode, tail = 0x80, displacement.to_bytes(4, 'little', signed=True)
+        sib = b'\x24' if base & 7 == 4 else b''
+        encoded = bytes([mode | (reg & 7) << 3 | base & 7]) + sib + tail
+    return (bytes([rex]) if rex != 0x40 else b'') + opcode + encoded
+
+def immediate(text: str) -> int:
+    return int(text[1:], 0)
+
+def encode(assembly: str) -> tuple[bytes, dict[str, int]]:
+    """Encodes `assembly` in the AT&T syntax of generate_assembly, and
+    gives the code and the offsets of its labels. Only the instructions
+    and operands it uses are known. Jumps and calls are to labels in the
+    code, or to a register with `*%reg`."""
+    code = bytearray()
+    labels: dict[str, int] = {}
+    # Offsets of rel32 fields and the labels they point to.
+    fixups: list[tuple[int, str]] = []
+
+    def relative(opcode: bytes, label: str) -> None:
+        code.extend(opcode)
+        fixups.append((len(code), label))
+        code.extend(bytes(4))
+
+    for number, text in enumerate(assembly.splitlines(), 1):
+        line = text.split('#')[0].strip()
+        if not line or line.startswith('.') and not line.endswith(':'):
+            continue
+        if line.endswith(':'):
+            labels[line[:-1]] = len(code)
+            continue
+        name, _, rest = line.partition(' ')
+        args = [arg.strip() for arg in rest.split(',')] if rest else []
+        try:
+            if name in ('jmp', 'callq') and args[0].startswith('*'):
+                target = operand(args[0][1:])
+                assert not isinstance(target, str)
+                code.extend(instruction(b'\xFF', 4 if name == 'jmp' else 2, target, wide=False))
+            elif name == 'jmp':
+                relative(b'\xE9', args[0])
+            elif name == 'callq':
+                relative(b'\xE8', args[0])
+            elif name.startswith('j') and name[1:] in conditions:
+                relative(bytes([0x0F, 0x80 | conditions[name[1:]]]), args[0])
+            elif name.startswith('set') and name[3:] in conditions and args == ['%al']:
+                code.extend(bytes([0x0F, 0x90 | conditions[name[3:]], 0xC0]))
+            elif name == 'ret':
+                code.append(0xC3)
+            elif name == 'cqto':
+                code.extend(b'\x48\x99')
+            elif name == 'movabsq':
+                reg = operand(args[1])
+                assert isinstance(reg, int) and args[0].startswith('$')
+                code.extend(bytes([0x48 | (1 if reg >= 8 else 0), 0xB8 | reg & 7]))
+                code.extend((immediate(args[0]) & (2**64 - 1)).to_bytes(8, 'little'))
+            elif name in ('pushq', 'popq') and isinstance(reg := operand(args[0]), int):
+                if reg >= 8:
+                    code.append(0x41)
+                code.append((0x50 if name == 'pushq' else 0x58) | reg & 7)
+            elif name == 'pushq':
+                rm = operand(args[0])
+                assert not isinstance(rm, str)
+                code.extend(instruction(b'\xFF', 6, rm, wide=False))
+            elif name in ('negq', 'idivq'):
+                rm = operand(args[0])
+                assert not isinstance(rm, str)
+                code.extend(instruction(b'\xF7', 3 if name == 'negq' else 7, rm))
+            elif name == 'imulq':
+                rm, reg = operand(args[0]), operand(args[1])
+                assert not isinstance(rm, str) and isinstance(reg, int)
+                code.extend(instruction(b'\x0F\xAF', reg, rm))
+            elif name == 'movq' or name in arithmetic:
+                source, destination = operand(args[0]), operand(args[1])
+                assert not isinstance(destination, str)
+                if isinstance(source, str):
+                    value = immediate(source)
+                    if not -2**31 <= value < 2**31:
+                        raise Unencodable(f"immediate {value}")
+                    if name == 'movq':
+                        code.extend(instruction(b'\xC7', 0, destination))
+                        code.extend(value.to_bytes(4, 'little', signed=True))
+                    elif -128 <= value < 128:
+                        code.extend(instruction(b'\x83', arithmetic[name][2], destination))
+                        code.extend(value.to_bytes(1, 'little', signed=True))
+                    else:
+                        code.extend(instruction(b'\x81', arithmetic[name][2], destination))
+                        code.extend(value.to_bytes(4, 'little', signed=True))
+                else:
+                    store, load, _ = arithmetic.get(name, (0x89, 0x8B, 0))
+                    if isinstance(source, int):
+                        code.extend(instruction(bytes([store]), source, destination))
+                    elif isinstance(destination, int):
+                        code.extend(instruction(bytes([load]), destination, source))
+                    else:
+                        raise Unencodable("two memory operands")
+            else:
+                raise Unencodable(f"instruction '{name}'")
+        except (Unencodable, AssertionError, IndexError, ValueError) as e:
+            detail = f": {e.args[0]}" if isinstance(e, Unencodable) else ""
+            raise Exception(f"line {number}: can't encode '{line}'{detail}.")
+
+    for offset, label in fixups:
+        if label not in labels:
+            raise Exception(f"unknown label '{label}'.")
+        code[offset:offset + 4] = (labels[label] - offset - 4).to_bytes(4, 'little', signed=True)
+    return bytes(code), labels
+
+def guard_divisions(assembly: str) -> str:
+    """`assembly` with a check before each idivq, as the processor traps
+    on division by zero and on overflow. Division by zero returns from
+    main with 1, and the smallest integer divided by -1 is itself with a
+    remainder of 0, like the other engines wrap it."""
+    lines = []
+    for number, line in enumerate(assembly.splitlines()):
+        if (m := re.fullmatch(r'\s*idivq (\S+)', line)) is None:
+            lines.append(line)
+            continue
+        divisor = m[1]
+        lines += [
+            f'cmpq $0, {divisor}',
+            f'je .Lnative_division_by_zero',
+            f'cmpq $-1, {divisor}',
+            f'jne .Lnative_divide_{number}',
+            f'negq %rax',
+            f'movq $0, %rdx',
+            f'jmp .Lnative_divided_{number}',
+            f'.Lnative_divide_{number}:',
+            line,
+            f'.Lnative_divided_{number}:',
+        ]
+    return "\n".join(lines) + "\n"
+
+# Codes main returns with: it returns 0 when the program ends.
+DIVISION_BY_ZERO, FAILED = 1, 2
+
+print_type = ctypes.CFUNCTYPE(ctypes.c_int64, ctypes.c_int64)
+read_type = ctypes.CFUNCTYPE(ctypes.c_int64)
+
+class Program:
+    """A program compiled to machine code in executable memory. It can be
+    run any number of times, and must be closed to free the memory."""
+    def __init__(self, assembly: str):
+        if platform.machine().lower() not in ('x86_64', 'amd64') or sys.platform == 'win32':
+            raise Exception("Native execution needs x86-64 and a System V platform.")
+        self.stdin: TextIO = sys.stdin
+        self.output: list[str] = []
+        self.error: Optional[Exception] = None
+        # Set by the callbacks when they fail, and checked by the stubs
+        # that call them.
+        self.failed = ctypes.c_int64(0)
+        # The callbacks must be kept alive as long as the code.
+        self.callbacks = {
+            'print_int': print_type(self.print_int),
+            'print_bool': print_type(self.print_bool),
+            'read_int': read_type(self.read_int),
+        }
+        stubs = []
+        for name, callback in self.callbacks.items():
+            address = ctypes.cast(callback, ctypes.c_void_p).value
+            # Called with the stack as main aligns it for calls, so it is
+            # aligned again for the callback.
+            stubs += [
+                f'{name}:',
+                f'subq $8, %rsp',
+                f'movabsq ${address}, %rax',
+                f'callq *%rax',
+                f'addq $8, %rsp',
+                f'movabsq ${ctypes.addressof(self.failed)}, %rcx',
+                f'cmpq $0, (%rcx)',
+                f'jne .Lnative_failed',
+                f'ret',
+            ]
+        # Called in main, whose frame they leave.
+        stubs += [
+            '.Lnative_division_by_zero:',
+            f'movq ${DIVISION_BY_ZERO}, %rax',
+            'movq %rbp, %rsp',
+            'popq %rbp',
+            'ret',
+            '.Lnative_failed:',
+            f'movq ${FAILED}, %rax',
+            'movq %rbp, %rsp',
+            'popq %rbp',
+            'ret',
+        ]
+        code, labels = encode(guard_divisions(assembly) + "\n".join(stubs))
+        if 'main' not in labels:
+            raise Exception("unknown label 'main'.")
+        self.size = max(len(code), 1)
+        self.address: Optional[int] = mmap_code(code, self.size)
+        self.main = ctypes.CFUNCTYPE(ctypes.c_int64)(self.address + labels['main'])
+
+    def print_int(self, value: int) -> int:
+        self.output.append(f"{value}\n")
+        return value
+
+    def print_bool(self, value: int) -> int:
+        self.output.append("true\n" if value else "false\n")
+        return value
+
+    def read_int(self) -> int:
+        try:
+            return read_int(self.stdin)
+        except Exception as e:
+            self.error = e
+            self.failed.value = 1
+            return 0
+
+    def run(self, stdin: TextIO = sys.stdin, stdout: TextIO = sys.stdout) -> None:
+        """Runs the program like its executable would. The output is written
+        to `stdout` when the program ends or fails."""
+        if self.address is None:
+            raise Exception("Program is closed.")
+        self.stdin = stdin
+        self.output = []
+        self.error = None
+        self.failed.value = 0
+        try:
+            result = self.main()
+        finally:
+            stdout.write("".join(self.output))
+        if result == DIVISION_BY_ZERO:
+            raise Exception("Division by zero.")
+        if result == FAILED:
+            assert self.error is not None
+            raise self.error
+
+    def close(self) -> None:
+        if self.address is not None:
+            libc().munmap(self.address, self.size)
+            self.address = None
+
+@cache
+def libc() -> Any:
+    library = ctypes.CDLL(None, use_errno=True)
+    library.mmap.restype = ctypes.c_void_p
+    library.mmap.argtypes = [ctypes.c_void_p, ctypes.c_size_t, ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_long]
+    library.mprotect.argtypes = [ctypes.c_void_p, ctypes.c_size_t, ctypes.c_int]
+    library.munmap.argtypes = [ctypes.c_void_p, ctypes.c_size_t]
+    return library
+
+def mmap_code(code: bytes, size: int) -> int:
+    """Maps memory for `code`, copies it there and makes it executable
+    and read only. Gives its address."""
+    address = libc().mmap(None, size, mmap.PROT_READ | mmap.PROT_WRITE, mmap.MAP_PRIVATE | mmap.MAP_ANONYMOUS, -1, 0)
+    if address is None or address == ctypes.c_void_p(-1).value:
+        raise OSError(ctypes.get_errno(), "mmap failed")
+    ctypes.memmove(address, code, len(code))
+    if libc().mprotect(address, size, mmap.PROT_READ | mmap.PROT_EXEC) != 0:
+        errno = ctypes.get_errno()
+        libc().munmap(address, size)
+        raise OSError(errno, "mprotect failed")
+    assert isinstance(address, int)
+    return address
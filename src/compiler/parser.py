@@ -1,256 +1,363 @@
-from compiler.tokenizer import Token, Source, L
+from array import array
+from compiler.tokenizer import Token, TokenBuffer, TokenKind, Source, L, token_kinds, token_pat
 import compiler.ast as ast
 import compiler.types as types
-from typing import Optional
+from typing import Any, Callable, Generator, Optional, Protocol, Sequence
 
-def parse(tokens: list[Token]) -> ast.Expression:
-    pos = 0
-    left_associative_binary_operators = [
-        ['or'],
-        ['and'],
-        ['==', '!='],
-        ['<', '<=', '>', '>='],
-        ['+', '-'],
-        ['*', '/', '%'],
-    ]
-    right_associative_binary_operators = [
-        ['=']
-    ]
-    unary_operators = [
-        ['-', 'not']
-    ]
-
-    def peek() -> Token:
-        if len(tokens) == 0:
-            return Token(
-                source=Source("",0,0),
-                type="end",
-                text="",
-            )
-        elif pos < len(tokens):
-            return tokens[pos]
+# Parsing functions that need to parse a nested construct are generators:
+# they yield the sub-parser and receive its result. `run` drives them with
+# an explicit stack, so deeply nested input does not use up the Python stack.
+type Parser[T] = Generator[Parser[Any], Any, T]
+
+def run[T](parser: Parser[T]) -> T:
+    stack: list[Parser[Any]] = [parser]
+    value: Any = None
+    while True:
+        try:
+            sub_parser = stack[-1].send(value)
+        except StopIteration as result:
+            stack.pop()
+            if not stack:
+                return result.value # type: ignore[no-any-return]
+            value = result.value
         else:
-            return Token(
-                source=tokens[-1].source,
-                type="end",
-                text="",
-            )
-    
-    def peek_last() -> Token:
-        if len(tokens) == 0:
-            return Token(
-                source=Source("",0,0),
-                type="end",
-                text="",
-            )
-        elif pos-1 > 0:
-            return tokens[pos-1]
+            stack.append(sub_parser)
+            value = None
+
+# Binary operators and how tightly they bind their operands.
+binding_powers = {
+    '=': 1,
+    'or': 2,
+    'and': 3,
+    '==': 4, '!=': 4,
+    '<': 5, '<=': 5, '>': 5, '>=': 5,
+    '+': 6, '-': 6,
+    '*': 7, '/': 7, '%': 7,
+}
+right_associative_binary_operators = {'='}
+unary_operators = {'-', 'not'}
+# Operators are operator tokens or, like "and" and "not", identifiers.
+operator_kinds = (TokenKind.OPERATOR, TokenKind.IDENTIFIER)
+# The kind after the last token.
+END = len(TokenKind)
+
+# Kinds of the texts the parser expects, see `kind_of`.
+expected_kinds: dict[str, int] = {}
+
+def kind_of(text: str) -> int:
+    """The kind a token with `text` gets from the tokenizer."""
+    kind = expected_kinds.get(text)
+    if kind is None:
+        match = token_pat.fullmatch(text)
+        group = match.lastgroup if match is not None else None
+        kind = expected_kinds[text] = token_kinds.get(group or "", TokenKind.OPERATOR)
+    return kind
+
+class Builder[N](Protocol):
+    """Makes the nodes of the parsed program. Locations of blocks and
+    function calls come from their result and function name."""
+    def literal(self, location: Source, value: int | bool | None) -> N: ...
+    def identifier(self, location: Source, name: str) -> N: ...
+    def binary_op(self, location: Source, left: N, op: str, right: N) -> N: ...
+    def unary_op(self, location: Source, op: str, right: N) -> N: ...
+    def variable_declaration(self, location: Source, variable: N, var_type: Optional[types.Type]) -> N: ...
+    def conditional(self, location: Source, op: str, condition: N, first: N, second: Optional[N]) -> N: ...
+    def block(self, expressions: list[N], result: N, spans: list[tuple[int, int]]) -> N: ...
+    def function_call(self, function: N, parameters: list[N]) -> N: ...
+    def break_(self, location: Source) -> N: ...
+    def continue_(self, location: Source) -> N: ...
+
+class AstBuilder:
+    """Builds the program out of `compiler.ast` dataclasses."""
+    def literal(self, location: Source, value: int | bool | None) -> ast.Expression:
+        return ast.Literal(location, value)
+
+    def identifier(self, location: Source, name: str) -> ast.Expression:
+        return ast.Identifier(location, name)
+
+    def binary_op(self, location: Source, left: ast.Expression, op: str, right: ast.Expression) -> ast.Expression:
+        return ast.BinaryOp(location, left, op, right)
+
+    def unary_op(self, location: Source, op: str, right: ast.Expression) -> ast.Expression:
+        return ast.UnaryOp(location, op, right)
+
+    def variable_declaration(self, location: Source, variable: ast.Expression, var_type: Optional[types.Type]) -> ast.Expression:
+        assert isinstance(variable, ast.Identifier)
+        return ast.VariableDeclaration(location, variable, var_type)
+
+    def conditional(self, location: Source, op: str, condition: ast.Expression, first: ast.Expression, second: Optional[ast.Expression]) -> ast.Expression:
+        return ast.Conditional(location, op, condition, first, second)
+
+    def block(self, expressions: list[ast.Expression], result: ast.Expression, spans: list[tuple[int, int]]) -> ast.Expression:
+        return ast.Block(result.location, expressions, result, spans=ast.Spans(spans))
+
+    def function_call(self, function: ast.Expression, parameters: list[ast.Expression]) -> ast.Expression:
+        assert isinstance(function, ast.Identifier)
+        return ast.FunctionCall(function.location, function, parameters)
+
+    def break_(self, location: Source) -> ast.Expression:
+        return ast.Break(location)
+
+    def continue_(self, location: Source) -> ast.Expression:
+        return ast.Continue(location)
+
+ast_builder = AstBuilder()
+
+def parse(tokens: list[Token] | TokenBuffer, block: bool = False) -> ast.Expression:
+    """Parses a whole program. With `block`, the tokens are parsed as the
+    contents of a block and the result is always an `ast.Block`."""
+    return parse_with(tokens, ast_builder, block)
+
+def parse_with[N](tokens: list[Token] | TokenBuffer, builder: Builder[N], block: bool = False) -> N:
+    """Parses a whole program into the nodes made by `builder`."""
+    pos = 0
+    token_count = len(tokens)
+    # The parser reads the kinds of the tokens, and slices the text of a
+    # token only when its kind could match.
+    kinds: Sequence[int]
+    text: Callable[[int], str]
+    source: Callable[[int], Source]
+    if isinstance(tokens, TokenBuffer):
+        kinds, text, source = tokens.kinds, tokens.text, tokens.source
+    else:
+        token_list = tokens
+        # Like the tokens themselves, their kinds come from the text.
+        kinds = array('B', [kind_of(token.text) for token in tokens])
+        text = lambda index: token_list[index].text
+        source = lambda index: token_list[index].source
+
+    def peek_kind() -> int:
+        return kinds[pos] if pos < token_count else END
+
+    def peek_is(expected: str) -> bool:
+        return pos < token_count and kinds[pos] == kind_of(expected) and text(pos) == expected
+
+    def peek_text() -> str:
+        return text(pos) if pos < token_count else ""
+
+    def peek_source() -> Source:
+        if pos < token_count:
+            return source(pos)
+        elif token_count == 0:
+            return Source("",0,0)
         else:
-            return Token(
-                source=tokens[0].source,
-                type="start",
-                text="",
-            )
+            return source(token_count - 1)
+
+    def last_is(expected: str) -> bool:
+        return pos - 1 > 0 and kinds[pos - 1] == kind_of(expected) and text(pos - 1) == expected
 
-    def consume(expected: str | list[str] | None = None) -> Token:
+    def consume(expected: str | list[str] | None = None) -> int:
+        """Moves past the next token and returns its index."""
         nonlocal pos
-        token = peek()
-        if isinstance(expected, str) and token.text != expected:
-            raise Exception(f'{token.source}: expected "{expected}"')
-        if isinstance(expected, list) and token.text not in expected:
-            comma_separated = ", ".join([f'"{e}"' for e in expected])
-            raise Exception(f'{token.source}: expected one of: {comma_separated}')
+        if expected is not None:
+            if isinstance(expected, str) and not peek_is(expected):
+                raise Exception(f'{peek_source()}: expected "{expected}"')
+            if isinstance(expected, list) and not any(peek_is(e) for e in expected):
+                comma_separated = ", ".join([f'"{e}"' for e in expected])
+                raise Exception(f'{peek_source()}: expected one of: {comma_separated}')
         pos += 1
-        return token
-    
-    def parse_int_literal() -> ast.Literal:
-        if peek().type != 'int_literal':
-            raise Exception(f'{peek().source}: expected an integer literal')
-        token = consume()
-        return ast.Literal(token.source, int(token.text))
-    
-    def parse_bool_literal(bool: str) -> ast.Literal:
-        token = consume(bool)
-        return ast.Literal(token.source, token.text == "true")
-
-    def parse_identifier() -> ast.Identifier:
-        if peek().type != 'identifier':
-            raise Exception(f'{peek().source}: expected an identifier')
-        token = consume()
-        return ast.Identifier(token.source, token.text)
-    
-    def parse_parenthesized() -> ast.Expression:
+        return pos - 1
+
+    def parse_bool_literal(bool: str) -> N:
+        return builder.literal(source(consume(bool)), bool == "true")
+
+    def parse_identifier() -> int:
+        if peek_kind() != TokenKind.IDENTIFIER:
+            raise Exception(f'{peek_source()}: expected an identifier')
+        return consume()
+
+    def parse_parenthesized() -> Parser[N]:
         consume('(')
-        expr = parse_expression_right_binary()
+        expr = yield parse_expression()
         consume(')')
         return expr
 
-    def parse_conditional(operator: str) -> ast.Conditional:
-        location = consume(operator).source 
-        expr = ast.Conditional(
-            location,
-            operator,
-            parse_expression_right_binary(),
-            ast.Expression(L)
-        )
+    def parse_conditional(operator: str) -> Parser[N]:
+        location = source(consume(operator))
+        condition = yield parse_expression()
+        second: Optional[N] = None
         if operator == "if":
             consume("then")
-            expr.first = parse_expression_right_binary()
-            if peek().text == "else":
+            first = yield parse_expression()
+            if peek_is("else"):
                 consume("else")
-                expr.second = parse_expression_right_binary()
+                second = yield parse_expression()
         else:
             consume("do")
-            expr.first = parse_expression_right_binary()
+            first = yield parse_expression()
 
-        return expr
+        return builder.conditional(location, operator, condition, first, second)
 
-    def parse_list() -> list[ast.Expression]:
-        expr = parse_expression_right_binary()
-        if peek().text == ',':
+    def parse_list() -> Parser[list[N]]:
+        expressions = [(yield parse_expression())]
+        while peek_is(','):
             consume(',')
-            return [expr] + parse_list()
-        return [expr]
+            expressions.append((yield parse_expression()))
+        return expressions
 
-    def parse_function(function_name: ast.Identifier) -> ast.FunctionCall:
+    def parse_function(function_name: N) -> Parser[N]:
         consume('(')
-        params = parse_list() if peek().text != ')' else []
+        params = (yield parse_list()) if not peek_is(')') else []
         consume(')')
-        return ast.FunctionCall(
-            function_name.location,
-            function_name,
-            params,
-        )
-    
-    def parse_block(expressions: list[ast.Expression] = [], last: Optional[ast.Expression] = None) -> ast.Block:
-        expr: ast.Expression = ast.Literal(L, None)
-        
-        if peek().type != "end":
-            expr = parse_top(False)
-
-        separator = consume(";") if peek().text == ";" else None
-        
-        if separator is None and expr == ast.Literal(expr.location, None):
-            expr = expr if last is None else last
-            return ast.Block(expr.location, expressions, expr)
-
-        elif separator is None and peek_last().text == "}":#isinstance(expr, (ast.Block, ast.Conditional)):
-            expressions = expressions if last is None else expressions+[last]
-            return parse_block(expressions, expr)
-
-        elif separator is None:
-            expressions = expressions if last is None else expressions+[last]
-            return ast.Block(expr.location, expressions, expr)
-        
-        else:
-            expressions = expressions if last is None else expressions+[last]
-            return parse_block(expressions + [expr])
-     
+        return builder.function_call(function_name, params)
+
+    def parse_block(
+        start: int,
+        expressions: Optional[list[N]] = None,
+        spans: Optional[list[tuple[int, int]]] = None,
+    ) -> Parser[N]:
+        expressions = [] if expressions is None else expressions
+        spans = [] if spans is None else spans
+        # An expression ending in "}" followed by another expression without
+        # a separator. It becomes the result if the block ends here.
+        last: Optional[N] = None
+        while True:
+            expression_start = pos
+            # None when the block ends without a final expression.
+            expr: Optional[N] = None
+            if peek_kind() == END:
+                location = L
+            elif peek_is("}"):
+                location = source(pos)
+            else:
+                expr = yield parse_top(False)
+
+            if expr is None:
+                if last is None:
+                    result = builder.literal(location, None)
+                    spans.append((pos - start, pos - start))
+                else:
+                    result = last
+                return builder.block(expressions, result, spans)
+
+            separator = consume(";") if peek_is(";") else None
+            spans.append((expression_start - start, pos - start))
+
+            if last is not None:
+                expressions.append(last)
+                last = None
+
+            if separator is None and last_is("}"):#isinstance(expr, (ast.Block, ast.Conditional)):
+                last = expr
 
-    def parse_variable_declaration() -> ast.VariableDeclaration:
+            elif separator is None:
+                return builder.block(expressions, expr, spans)
+
+            else:
+                expressions.append(expr)
+
+    def parse_variable_declaration() -> N:
         var = consume("var")
         name = parse_identifier()
         var_type = None
-        if peek().text == ':':
+        if peek_is(':'):
             consume(':')
             type_identifier = parse_identifier()
-            if not type_identifier.name in types.Types:
-                raise Exception(f"{type_identifier.location}: Unknown type '{type_identifier.name}'.")
-            var_type = types.Types[type_identifier.name]
-        return ast.VariableDeclaration(var.source, name, var_type)
-
-    def parse_factor(top: bool = True) -> ast.Expression:
-        expr = ast.Expression(L)
-        
-        match peek().type:
-            case "punctuation":
-                match peek().text:
-                    case "(":
-                        expr = parse_parenthesized()
-                    case "{":
-                        consume("{")
-                        expr = parse_block()
-                        consume("}")
-                    case "}":
-                        return ast.Literal(peek().source, None)
-            case "identifier":
-                if top and peek().text == "var":
-                    expr = parse_variable_declaration()
-                elif peek().text == "continue":
-                    expr = ast.Continue(consume("continue").source)
-                elif peek().text == "break":
-                    expr = ast.Break(consume("break").source)
-                else:
-                    match peek().text:
-                        case "if" | "while":
-                            expr = parse_conditional(peek().text)
-                        case "true" | "false":
-                            expr = parse_bool_literal(peek().text)
-                        case _:
-                            expr = parse_identifier()
-                            if peek().text == '(':
-                                expr = parse_function(expr)
-            case 'int_literal':
-                expr = parse_int_literal()       
-            case _:
-                raise Exception(f'{peek().source}: expected "(", an integer literal or an identifier')
-        return expr
+            type_name = text(type_identifier)
+            if not type_name in types.Types:
+                raise Exception(f"{source(type_identifier)}: Unknown type '{type_name}'.")
+            var_type = types.Types[type_name]
+        return builder.variable_declaration(source(var), builder.identifier(source(name), text(name)), var_type)
 
-    def parse_expression_unary(index: int = 0, top: bool = True) -> ast.Expression:
-        if index == len(unary_operators):
-            return parse_factor(top)
-        while peek().text in unary_operators[index]:
-            operator_token = consume()
-            right = parse_expression_unary(top = False)
-            return ast.UnaryOp(
-                operator_token.source,
-                operator_token.text,
-                right
-            )
-        return parse_expression_unary(index+1, top)
-
-    def parse_expression_left_binary(index: int = 0, top: bool = True) -> ast.Expression:
-        if index == len(left_associative_binary_operators):
-            return parse_expression_unary(top=top)
-
-        left = parse_expression_left_binary(index+1, top)
-        while peek().text in left_associative_binary_operators[index]:
-            operator_token = consume()
-            right = parse_expression_left_binary(index+1, False)
-            left = ast.BinaryOp(
-                operator_token.source,
-                left,
-                operator_token.text,
+    def parse_expression(top: bool = False) -> Parser[N]:
+        # Operands and binary operators seen so far. Operators on the stack
+        # bind tighter than the ones below them, so an incoming operator
+        # first folds the stack until it can be pushed.
+        operands: list[N] = []
+        # The operators are kept as their token index and text.
+        operators: list[tuple[int, str, int]] = []
+
+        def reduce() -> None:
+            operator_token, operator, _ = operators.pop()
+            right = operands.pop()
+            operands[-1] = builder.binary_op(
+                source(operator_token),
+                operands[-1],
+                operator,
                 right
             )
-        return left
-
-    def parse_assignment(left : ast.Expression) -> ast.BinaryOp:
-        location = consume("=").source
-        right = parse_expression_right_binary()
-        return ast.BinaryOp(
-            location,
-            left,
-            "=",
-            right
-        )
-
-    def parse_expression_right_binary(top: bool = False) -> ast.Expression:
-        left = parse_expression_left_binary(top=top)
-        if peek().text == '=':
-            return parse_assignment(left)
-        else:
-            return left
-    
-    def parse_top(top : bool = True) -> ast.Expression:
-        expr = parse_expression_right_binary(top=True)
+
+        while True:
+            # Unary operators apply to the factor right after them only.
+            unary_tokens: list[int] = []
+            while peek_kind() in operator_kinds and peek_text() in unary_operators:
+                unary_tokens.append(consume())
+            # Variable declarations are allowed only at the start of a top level expression.
+            top_factor = top and not operands and not unary_tokens
+
+            token = pos
+            expr: N
+            match peek_kind():
+                case TokenKind.PUNCTUATION:
+                    match text(token):
+                        case "(":
+                            expr = yield parse_parenthesized()
+                        case "{":
+                            consume("{")
+                            expr = yield parse_block(pos - 1)
+                            consume("}")
+                        case "}":
+                            expr = builder.literal(source(token), None)
+                        case _:
+                            raise Exception(f'{source(token)}: expected "(", an integer literal or an identifier')
+                case TokenKind.IDENTIFIER:
+                    name = text(token)
+                    if top_factor and name == "var":
+                        expr = parse_variable_declaration()
+                    elif name == "continue":
+                        expr = builder.continue_(source(consume()))
+                    elif name == "break":
+                        expr = builder.break_(source(consume()))
+                    else:
+                        match name:
+                            case "if" | "while":
+                                expr = yield parse_conditional(name)
+                            case "true" | "false":
+                                expr = parse_bool_literal(name)
+                            case _:
+                                consume()
+                                expr = builder.identifier(source(token), name)
+                                if peek_is('('):
+                                    expr = yield parse_function(expr)
+                case TokenKind.INT_LITERAL:
+                    consume()
+                    expr = builder.literal(source(token), int(text(token)))
+                case _:
+                    raise Exception(f'{peek_source()}: expected "(", an integer literal or an identifier')
+
+            for operator_token in reversed(unary_tokens):
+                expr = builder.unary_op(
+                    source(operator_token),
+                    text(operator_token),
+                    expr
+                )
+            operands.append(expr)
+
+            if peek_kind() not in operator_kinds:
+                break
+            operator = peek_text()
+            binding_power = binding_powers.get(operator)
+            if binding_power is None:
+                break
+            while operators and (operators[-1][2] > binding_power or (
+                    operators[-1][2] == binding_power and operator not in right_associative_binary_operators)):
+                reduce()
+            operators.append((consume(), operator, binding_power))
+
+        while operators:
+            reduce()
+        return operands[0]
+
+    def parse_top(top : bool = True) -> Parser[N]:
+        start = pos
+        expr = yield parse_expression(top=True)
         if top:
-            separator = consume(";") if peek().text == ";" else None
-            if separator is not None or (peek_last().text == "}" and peek().type != "end"):
-                expr = parse_block([expr])
+            separator = consume(";") if peek_is(";") else None
+            if separator is not None or (last_is("}") and peek_kind() != END):
+                expr = yield parse_block(start, [expr], [(0, pos - start)])
         return expr
-    
-    main_expression = parse_top()
-    if peek().type != "end":
-        raise(Exception(f'{peek().source}: garbage at end of expression.'))
+
+    main_expression = run(parse_block(0) if block else parse_top())
+    if peek_kind() != END:
+        raise(Exception(f'{peek_source()}: garbage at end of expression.'))
     return main_expression
@@ -0,0 +1,90 @@
+from dataclasses import dataclass
+from compiler import ast
+from compiler.symtab import SymTab
+from compiler.traversal import Visit, traverse
+
+# Binding of a name that is not declared in an enclosing block. Such names
+# are looked up in the symbol table: builtins, variables the caller has
+# declared and variables declared outside of any block.
+FREE = -1
+
+@dataclass
+class Resolution:
+    """Bindings found by `resolve`."""
+    # Number of bindings. They are numbered from 0 in declaration order.
+    count: int
+    # Bindings that redeclare a name already declared in the same block.
+    redeclarations: set[int]
+    # For each binding, the binding its name referred to before the
+    # declaration, or FREE.
+    shadows: list[int]
+
+def resolve(root: ast.Expression) -> Resolution:
+    """Gives every variable declared in a block a binding number and sets
+    `binding` on the identifiers that refer to it.
+
+    Programs have no functions, so a binding has at most one live value at
+    a time and the stages can keep the values of all bindings in one list.
+    Names are resolved in the order the type checker and the interpreter
+    evaluate the tree, so the initializer of `var x = x` sees the new x."""
+    scopes = SymTab[int]()
+    redeclarations: set[int] = set()
+    shadows: list[int] = []
+
+    def lookup(name: str) -> int:
+        binding = scopes.lookup(name)
+        return FREE if binding is None else binding
+
+    def enter(node: ast.Expression) -> Visit[None] | None:
+        match node:
+            case ast.Identifier():
+                node.binding = lookup(node.name)
+
+            case ast.VariableDeclaration():
+                name = node.variable.name
+                if scopes.depth() == 0:
+                    node.variable.binding = FREE
+                    return None
+                binding = len(shadows)
+                if scopes.is_local(name):
+                    redeclarations.add(binding)
+                shadows.append(lookup(name))
+                scopes.define(name, binding)
+                node.variable.binding = binding
+
+            case ast.Literal() | ast.Break() | ast.Continue():
+                pass
+
+            case _:
+                return visit(node)
+        return None
+
+    def visit(node: ast.Expression) -> Visit[None]:
+        match node:
+            case ast.BinaryOp():
+                yield node.left
+                yield node.right
+
+            case ast.UnaryOp():
+                yield node.right
+
+            case ast.Conditional():
+                yield node.condition
+                yield node.first
+                if node.second is not None:
+                    yield node.second
+
+            case ast.FunctionCall():
+                yield node.function
+                for param in node.parameters:
+                    yield param
+
+            case ast.Block():
+                scopes.enter_scope()
+                for expression in node.expressions:
+                    yield expression
+                yield node.result
+                scopes.exit_scope()
+
+    traverse(root, enter)
+    return Resolution(len(shadows), redeclarations, shadows)
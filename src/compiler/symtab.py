@@ -1,32 +1,68 @@
-from typing import Optional, Self
+from typing import Optional
 
 class SymTab[T]:
-    parent : Optional[Self] = None
-    locals : dict[str, T | None]
-    def __init__(self, parent: Optional[Self] = None):
-        self.parent = parent
-        self.locals = {}
+    """Symbol table of nested scopes.
+
+    All scopes share one dict from a name to the stack of its values,
+    innermost last, so a lookup costs the same at any nesting depth. The
+    undo log holds the names each scope has declared, and `exit_scope`
+    pops them off their stacks."""
+    stacks: dict[str, list[T | None]]
+    undo_log: list[set[str]]
+
+    def __init__(self) -> None:
+        self.stacks = {}
+        self.undo_log = [set()]
+
+    def enter_scope(self) -> None:
+        self.undo_log.append(set())
+
+    def exit_scope(self) -> None:
+        for variable in self.undo_log.pop():
+            stack = self.stacks[variable]
+            stack.pop()
+            if not stack:
+                del self.stacks[variable]
+
+    def depth(self) -> int:
+        """Number of scopes entered and not yet exited."""
+        return len(self.undo_log) - 1
+
+    def is_local(self, variable: str) -> bool:
+        """Whether `variable` is declared in the innermost scope."""
+        return variable in self.undo_log[-1]
+
+    def define(self, variable: str, value: T | None) -> None:
+        """Declares `variable` in the innermost scope with `value`. A
+        declaration already in that scope is replaced."""
+        scope = self.undo_log[-1]
+        if variable in scope:
+            self.stacks[variable][-1] = value
+        else:
+            scope.add(variable)
+            self.stacks.setdefault(variable, []).append(value)
+
+    def lookup(self, variable: str) -> Optional[T]:
+        """Innermost value of `variable`, or None if it is not declared."""
+        stack = self.stacks.get(variable)
+        return None if stack is None else stack[-1]
 
     def declare(self, variable: str) -> None:
-        if variable in self.locals:
+        if variable in self.undo_log[-1]:
             raise Exception(f"Local variable '{variable}' is already declared.")
-        self.locals[variable] = None
+        self.define(variable, None)
 
     def assign(self, variable: str, value: T) -> None:
-        if variable in self.locals:
-            self.locals[variable] = value
-        elif self.parent is not None:
-            self.parent.assign(variable, value)
-        else:
+        stack = self.stacks.get(variable)
+        if stack is None:
             raise Exception(f"Variable '{variable}' is not declared.")
+        stack[-1] = value
 
     def read(self, variable: str) -> T:
-        if variable in self.locals:
-            value = self.locals[variable]
-            if value is None:
-                raise Exception(f"Variable '{variable}' has been declared but not defined.") 
-            return value
-        elif self.parent is not None:
-            return self.parent.read(variable)
-        else:
+        stack = self.stacks.get(variable)
+        if stack is None:
             raise Exception(f"Variable '{variable}' is not declared.")
+        value = stack[-1]
+        if value is None:
+            raise Exception(f"Variable '{variable}' has been declared but not defined.")
+        return value
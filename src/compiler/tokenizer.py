@@ -1,19 +1,183 @@
+import codecs
+import mmap
 import re
+import sys
+from array import array
+from bisect import bisect_left, bisect_right
 from dataclasses import dataclass
+from enum import IntEnum
+from typing import Iterator, Optional, TextIO
+
+def move_gap(values: array[int], gap: int, shift: int, index: int) -> None:
+    """Moves the gap of `values`, whose values from index `gap` on are
+    stored without `shift`, to `index`. Only the values in between are
+    visited."""
+    if shift and index < gap:
+        values[index:gap] = array(values.typecode, [value - shift for value in values[index:gap]])
+    elif shift and index > gap:
+        values[gap:index] = array(values.typecode, [value + shift for value in values[gap:index]])
+
+def bisect_gap_left(values: array[int], gap: int, shift: int, value: int) -> int:
+    """`bisect_left` for values stored with a gap, see `move_gap`."""
+    if gap < len(values) and value > values[gap] + shift:
+        return bisect_left(values, value - shift, gap)
+    return bisect_left(values, value, 0, gap)
+
+def bisect_gap_right(values: array[int], gap: int, shift: int, value: int) -> int:
+    """`bisect_right` for values stored with a gap, see `move_gap`."""
+    if gap < len(values) and value >= values[gap] + shift:
+        return bisect_right(values, value - shift, gap)
+    return bisect_right(values, value, 0, gap)
+
+class SourceFile:
+    """Name and line start offsets of a source file, shared by its locations.
+
+    When the file is edited, `successor` links it to the edited version as
+    `(start, end, delta, file)`: the text between `start` and `end` was
+    replaced and later offsets moved by `delta`. Locations kept from before
+    the edit are looked up in the newest version, which takes over the
+    line starts.
+
+    The line starts from index `gap` on are stored without `shift`, and an
+    edit moves the gap to the lines it changes, so that it does not have
+    to rewrite all the lines after it."""
+    __slots__ = ("name", "line_starts", "gap", "shift", "successor")
+    name: str
+    line_starts: array[int]
+    gap: int
+    shift: int
+    successor: Optional[tuple[int, int, int, "SourceFile"]]
+
+    def __init__(self, name: str):
+        self.name = name
+        self.line_starts = array('q', [0])
+        self.gap = 0
+        self.shift = 0
+        self.successor = None
+
+    def add_lines(self, text: str, start: int, end: int, offset: int = 0) -> None:
+        """Records the lines starting after each linebreak in `text[start:end]`.
+        `offset` is the position of `text` in the whole file."""
+        offset -= self.shift
+        linebreak = text.find("\n", start, end)
+        while linebreak != -1:
+            self.line_starts.append(offset + linebreak + 1)
+            linebreak = text.find("\n", linebreak + 1, end)
+
+    def line_count(self, offset: int) -> int:
+        """Returns the number of lines starting at or before an offset."""
+        return bisect_gap_right(self.line_starts, self.gap, self.shift, offset)
+
+    def line_start(self, row: int) -> int:
+        return self.line_starts[row] + (self.shift if row >= self.gap else 0)
+
+    def newest(self, offset: int) -> tuple["SourceFile", int]:
+        """Returns the newest version of the file and the offset in it."""
+        file = self
+        while file.successor is not None:
+            start, end, delta, file = file.successor
+            if offset >= end:
+                offset += delta
+            elif offset > start:
+                offset = start
+        return file, offset
+
+    def position(self, offset: int) -> tuple[int, int]:
+        """Returns the row and column of an offset."""
+        file, offset = self.newest(offset)
+        row = file.line_count(offset) - 1
+        return row, offset - file.line_start(row)
+
+    def edit(self, start: int, end: int, text: str) -> "SourceFile":
+        """Returns the file with the text between `start` and `end` replaced
+        by `text`. Locations in this file are moved to the new one."""
+        delta = len(text) - (end - start)
+        first = self.line_count(start)
+        stop = self.line_count(end)
+        move_gap(self.line_starts, self.gap, self.shift, first)
+        lines = SourceFile(self.name)
+        lines.add_lines(text, 0, len(text), start)
+        self.line_starts[first:stop] = lines.line_starts[1:]
+        file = SourceFile(self.name)
+        file.line_starts, self.line_starts = self.line_starts, array('q')
+        file.gap = first + len(lines.line_starts) - 1
+        file.shift = self.shift + delta
+        self.successor = (start, end, delta, file)
+        return file
+
+    def __str__(self) -> str:
+        return self.name
 
-@dataclass
 class Source:
-    file: str
-    row: int
-    column: int
+    """A location in a source file.
+
+    Locations made by the tokenizer only hold an offset into a shared
+    `SourceFile`; the row and column are looked up when first needed."""
+    __slots__ = ("_file", "_offset", "_row", "_column")
+    _file: str | SourceFile
+    _offset: int
+    _row: int
+    _column: int
+
     def __init__(self, file: str, row: int, column: int):
-        self.file = file
-        self.row = row
-        self.column = column
+        self._file = file
+        self._offset = -1
+        self._row = row
+        self._column = column
+
+    @classmethod
+    def at(cls, file: SourceFile, offset: int) -> "Source":
+        source = cls.__new__(cls)
+        source._file = file
+        source._offset = offset
+        source._row = -1
+        source._column = -1
+        return source
+
+    def offset_in(self, file: SourceFile) -> int:
+        """Returns the offset of this location in `file`, or -1 if it was
+        not made by `Source.at` for that file."""
+        return self._offset if self._file is file else -1
+
+    def _resolve(self) -> None:
+        file = self._file
+        if isinstance(file, SourceFile) and (self._row < 0 or file.successor is not None):
+            # The location moves to the newest version of the file, so that
+            # it only follows the edits made after this the next time.
+            self._file, self._offset = file.newest(self._offset)
+            self._row, self._column = self._file.position(self._offset)
+
+    @property
+    def file(self) -> str:
+        return str(self._file)
+
+    @property
+    def row(self) -> int:
+        self._resolve()
+        return self._row
+
+    @property
+    def column(self) -> int:
+        self._resolve()
+        return self._column
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, Source):
+            return NotImplemented
+        if self._file is other._file and self._offset >= 0:
+            return self._offset == other._offset
+        return self.file == other.file and self.row == other.row and self.column == other.column
+
+    def __hash__(self) -> int:
+        return hash((self.file, self.row, self.column))
+
+    def __repr__(self) -> str:
+        return f"Source(file={self.file!r}, row={self.row}, column={self.column})"
+
     def __str__(self) -> str:
         return f"{self.file}:{self.row}:{self.column}"
 L = Source('',0,0)
-@dataclass
+@dataclass(slots=True)
 class Token:
     text: str
     type: str
@@ -29,76 +193,355 @@ class Token:
             return NotImplemented
         return self.text == other.text and self.type == other.type and (self.source == other.source or self.source == L or other.source == L)
 
+# One combined pattern for the whole lexer. Alternatives are tried in order,
+# so comments must come before operators and identifiers before int literals.
+# The name of the matching group is the token type; groups whose name starts
+# with an underscore are skipped. Only the opening "/*" of a block comment is
+# matched here, its end is found with str.find so that scanning stays linear
+# even for unterminated comments.
+token_pat = re.compile(r'''
+    (?P<_linebreak>\n)
+  | (?P<_whitespace>[^\S\n]+)
+  | (?P<_multi_line_comment>/\*)
+  | (?P<_one_line_comment>(?:\#|//)[^\n]*)
+  | (?P<identifier>[A-Za-z_][A-Za-z0-9_]*)
+  | (?P<int_literal>\d+(?![a-zA-Z]))
+  | (?P<operator>[=!<>]=|[+\-*/=<>%])
+  | (?P<punctuation>[(){},;:])
+''', re.VERBOSE | re.DOTALL)
+
+class TokenKind(IntEnum):
+    """Compact code for a token type. `str()` gives the name used in `Token.type`."""
+    IDENTIFIER = 0
+    INT_LITERAL = 1
+    OPERATOR = 2
+    PUNCTUATION = 3
+
+    def __str__(self) -> str:
+        return self.name.lower()
+
+token_kinds = {str(kind): kind for kind in TokenKind}
+
+class Text:
+    """Source code kept in pieces of up to `piece_size` characters, so that
+    an edit copies only the pieces it changes. Like the line starts of a
+    `SourceFile`, the start offsets of the pieces from index `gap` on are
+    stored without `shift`."""
+    piece_size = 1 << 14
+    pieces: list[str]
+    starts: array[int]
+    gap: int
+    shift: int
+    length: int
+    # Start, end and text of the piece sliced last.
+    _last: tuple[int, int, str]
+
+    def __init__(self, text: str):
+        size = self.piece_size
+        self.pieces = [text[start:start + size] for start in range(0, len(text), size)] or [""]
+        self.starts = array('q', range(0, len(text) or 1, size))
+        self.gap = 0
+        self.shift = 0
+        self.length = len(text)
+        self._last = (0, len(self.pieces[0]), self.pieces[0])
+
+    def __len__(self) -> int:
+        return self.length
+
+    def piece_at(self, offset: int) -> int:
+        """Returns the index of the last piece starting at or before an offset."""
+        return bisect_gap_right(self.starts, self.gap, self.shift, offset) - 1
+
+    def start(self, piece: int) -> int:
+        return self.starts[piece] + (self.shift if piece >= self.gap else 0)
+
+    def slice(self, start: int, stop: int) -> str:
+        """Returns the text between offsets `start` and `stop`."""
+        piece_start, piece_end, piece = self._last
+        if piece_start <= start and stop <= piece_end:
+            return piece[start - piece_start:stop - piece_start]
+        index = self.piece_at(start)
+        piece_start = self.start(index)
+        piece = self.pieces[index]
+        piece_end = piece_start + len(piece)
+        self._last = (piece_start, piece_end, piece)
+        if stop <= piece_end:
+            return piece[start - piece_start:stop - piece_start]
+        parts = [piece[start - piece_start:]]
+        while piece_end < stop:
+            index += 1
+            parts.append(self.pieces[index][:stop - piece_end])
+            piece_end += len(self.pieces[index])
+        return "".join(parts)
+
+    def edit(self, start: int, end: int, text: str) -> None:
+        """Replaces the text between offsets `start` and `end` by `text`."""
+        delta = len(text) - (end - start)
+        first = self.piece_at(start)
+        last = self.piece_at(end)
+        first_start = self.start(first)
+        text = self.pieces[first][:start - first_start] + text + self.pieces[last][end - self.start(last):]
+        # Small pieces are joined with the next one, so that edits don't
+        # split the text into ever more pieces.
+        if len(text) < self.piece_size // 2 and last + 1 < len(self.pieces):
+            last += 1
+            text += self.pieces[last]
+        size = self.piece_size
+        pieces = [text[offset:offset + size] for offset in range(0, len(text), size)]
+        if not pieces and last - first + 1 == len(self.pieces):
+            pieces = [""]
+        move_gap(self.starts, self.gap, self.shift, first)
+        self.pieces[first:last + 1] = pieces
+        self.starts[first:last + 1] = array('q', range(first_start, first_start + len(pieces) * size, size))
+        self.gap = first + len(pieces)
+        self.shift += delta
+        self.length += delta
+        self._last = (0, len(self.pieces[0]), self.pieces[0])
+
+class TokenBuffer:
+    """Tokens of one source file stored as parallel arrays.
+
+    Only the kind and the start and end offsets of each token are stored.
+    The text is sliced from the source code when asked for, and `Token`
+    objects are built on demand when indexing or iterating the buffer.
+    Like the line starts of a `SourceFile`, the offsets from index `gap` on
+    are stored without `shift`."""
+    source_code: Text
+    file: SourceFile
+    kinds: array[int]
+    starts: array[int]
+    ends: array[int]
+    gap: int
+    shift: int
+    _recent: dict[int, Token]
+
+    def __init__(self, source_code: str, file_name: str = ""):
+        self.source_code = Text(source_code)
+        self.file = SourceFile(file_name)
+        self.kinds = array('B')
+        self.starts = array('q')
+        self.ends = array('q')
+        self.gap = 0
+        self.shift = 0
+        self._recent = {}
+
+    def __len__(self) -> int:
+        return len(self.kinds)
+
+    def kind(self, index: int) -> TokenKind:
+        return TokenKind(self.kinds[index])
+
+    def start(self, index: int) -> int:
+        return self.starts[index] + (self.shift if index >= self.gap else 0)
+
+    def end(self, index: int) -> int:
+        return self.ends[index] + (self.shift if index >= self.gap else 0)
+
+    def text(self, index: int) -> str:
+        shift = self.shift if index >= self.gap else 0
+        text = self.source_code.slice(self.starts[index] + shift, self.ends[index] + shift)
+        if self.kinds[index] == TokenKind.IDENTIFIER:
+            return sys.intern(text)
+        return text
+
+    def source(self, index: int) -> Source:
+        return Source.at(self.file, self.start(index))
+
+    def __getitem__(self, index: int) -> Token:
+        if index < 0:
+            index += len(self)
+        # The parser looks at the same few tokens many times in a row.
+        token = self._recent.get(index)
+        if token is None:
+            if len(self._recent) >= 4:
+                self._recent.clear()
+            token = Token(text=self.text(index), type=str(self.kind(index)), source=self.source(index))
+            self._recent[index] = token
+        return token
+
+    def __iter__(self) -> Iterator[Token]:
+        for index in range(len(self)):
+            yield Token(text=self.text(index), type=str(self.kind(index)), source=self.source(index))
+
+    def _lex(self, source_code: str, offset: int = 0, partial: bool = False, old: Optional["TokenBuffer"] = None, delta: int = 0, sync_from: int = 0, old_index: int = 0) -> int:
+        """Appends the tokens found in `source_code`, the source code from
+        offset `offset` on. With `partial`, it is only a part of the rest.
+
+        With `old`, stops at the first token at or after `sync_from` that
+        `old` also has, `delta` characters earlier, looking from `old_index`
+        on. The lexer only depends on its position, so the rest of the
+        tokens are the same as in `old`. Returns the index of that token
+        in `old`, or -1 if a `partial` source code ends before it."""
+        kinds = self.kinds.append
+        starts = self.starts.append
+        ends = self.ends.append
+        match = token_pat.match
+        end = len(source_code)
+        pos = 0
+
+        while pos < end:
+            m = match(source_code, pos)
+            if m is None:
+                if partial and pos == end - 1:
+                    # Could be the first half of a two character operator.
+                    return -1
+                # Unknown character, skip it.
+                pos += 1
+                continue
+            if partial and m.end() == end:
+                # The token may continue after the part.
+                return -1
+            kind = m.lastgroup
+            if kind == "_multi_line_comment":
+                close = source_code.find("*/", m.end())
+                if close == -1:
+                    if partial:
+                        return -1
+                    raise Exception(f"{Source.at(self.file, offset + pos)}: unterminated comment")
+                pos = close + 2
+                continue
+            elif kind is not None and kind[0] != "_":
+                if old is not None and offset + pos >= sync_from:
+                    while old_index < len(old) and old.start(old_index) < offset + pos - delta:
+                        old_index += 1
+                    if old_index < len(old) and old.start(old_index) == offset + pos - delta:
+                        return old_index
+                kinds(token_kinds[kind])
+                starts(offset + pos)
+                ends(offset + m.end())
+            pos = m.end()
+
+        if partial:
+            return -1
+        return 0 if old is None else len(old)
+
+    def edit(self, start: int, end: int, text: str) -> tuple["TokenBuffer", int, int, int]:
+        """Replaces `source_code[start:end]` by `text` and lexes again only
+        around the edit. Returns the buffer, which is edited in place.
+
+        Also returns the index of the first changed token and the index
+        after the changed tokens before and after the edit. The buffer's
+        locations are moved to the new version of the file.
+
+        An edit only copies the pieces of the source code it changes and
+        moves the gaps of the arrays to it, so typing at one place takes the
+        same time however long the file is."""
+        delta = len(text) - (end - start)
+        source_code = self.source_code
+        file = self.file.edit(start, end, text)
+
+        # A token ending right where the edit starts may grow into it, so
+        # lexing starts again after the last token that ends before it.
+        # The tokens are lexed from a part of the edited source code, made
+        # longer until they are the same as the old ones again.
+        first = self.first_ending_at(start)
+        pos = self.end(first - 1) if first > 0 else 0
+        size = Text.piece_size
+        lexed = TokenBuffer("")
+        lexed.file = file
+        try:
+            while True:
+                stop = min(end + size, len(source_code))
+                part = source_code.slice(pos, start) + text + source_code.slice(end, stop)
+                lexed.kinds, lexed.starts, lexed.ends = array('B'), array('q'), array('q')
+                old_stop = lexed._lex(part, pos, stop < len(source_code), self, delta, start + len(text), first)
+                if old_stop >= 0:
+                    break
+                size *= 4
+        except Exception:
+            # The locations of the buffer are moved back.
+            self.file = file.edit(start, start + len(text), source_code.slice(start, end))
+            raise
+
+        source_code.edit(start, end, text)
+        self.file = file
+        for values in (self.starts, self.ends):
+            move_gap(values, self.gap, self.shift, first)
+        self.kinds[first:old_stop] = lexed.kinds
+        self.starts[first:old_stop] = lexed.starts
+        self.ends[first:old_stop] = lexed.ends
+        self.gap = first + len(lexed)
+        self.shift += delta
+        self._recent.clear()
+        return self, first, old_stop, self.gap
+
+    def first_ending_at(self, offset: int) -> int:
+        """Returns the index of the first token ending at or after an offset."""
+        return bisect_gap_left(self.ends, self.gap, self.shift, offset)
+
+def tokenize_buffer(source_code: str, file_name: str = "") -> TokenBuffer:
+    buffer = TokenBuffer(source_code, file_name)
+    buffer.file.add_lines(source_code, 0, len(source_code))
+    buffer._lex(source_code)
+    return buffer
+
 def tokenize(source_code: str, file_name: str = "") -> list[Token]:
-    one_line_comment_pat = re.compile(r'^(#|//).*')
-    multi_line_comment_pat = re.compile(r'^(/\*).*(.*\n)*?.*?(\*/)')
-    whitespace_pat = re.compile(r'^\s+')
-    identifier_pat= re.compile(r'^(?<!\d)([A-Za-z_][A-Za-z0-9_]*)')
-    int_literal_pat = re.compile(r'^(?<![a-zA-Z])\d+(?![a-zA-Z])')
-    operator_pat = re.compile(r'^[=!<>]=|^[+\-*/=<>%]')
-    punctuation_pat = re.compile(r'^[(){},;:]')
-    linebreak_pat = re.compile('^\n')
-    tokens: list[Token] = []
-
-    start = 0
-    row = 0
-    col = 0
-    while(start < len(source_code)):
-        whitespace = whitespace_pat.search(source_code[start:])
-        one_line_comment = one_line_comment_pat.search(source_code[start:])
-        multi_line_comment = multi_line_comment_pat.search(source_code[start:])
-        identifier = identifier_pat.search(source_code[start:])
-        int_literal = int_literal_pat.search(source_code[start:])
-        operator = operator_pat.search(source_code[start:])
-        punctuation = punctuation_pat.search(source_code[start:])
-        linebreak = linebreak_pat.search(source_code[start:])
-        #print(source_code[start:])
-        if linebreak:
-            #print(start, linebreak)
-            row += 1
-            col = 0
-            start += linebreak.end(0)
-        elif whitespace:
-            #print(start, whitespace)
-            start += whitespace.end(0)
-            col += whitespace.end(0)
-        elif multi_line_comment:
-            #print(start, multi_line_comment)
-            linebreak_n = len(re.compile(r'\n').findall(multi_line_comment.group(0)))
-            if linebreak_n:
-                for i, match in enumerate(re.compile(r'\n').finditer(multi_line_comment.group(0))):
-                    row += 1
-                    if i == linebreak_n-1:
-                        col = multi_line_comment.start(0) + match.end(0)
-            else:
-                col += multi_line_comment.end(0)
-            start += multi_line_comment.end(0)
-        elif one_line_comment:
-            #print(start, one_line_comment)
-            #row += 1
-            col += one_line_comment.end(0)
-            start += one_line_comment.end(0)
-        elif identifier:
-            #print(start, identifier)
-            tokens.append(Token(text=identifier.group(0),type="identifier",source=Source(file_name,row,col)))
-            start += identifier.end(0)
-            col += identifier.end(0)
-        elif int_literal:
-            #print(start, int_literal)
-            tokens.append(Token(text=int_literal.group(0),type="int_literal",source=Source(file_name,row,col)))
-            start += int_literal.end(0)
-            col += int_literal.end(0)
-        elif operator:
-            #print(start, operator)
-            tokens.append(Token(text=operator.group(0),type="operator",source=Source(file_name,row,col)))
-            start += operator.end(0)
-            col += operator.end(0)
-        elif punctuation:
-            #print(start, punctuation)
-            tokens.append(Token(text=punctuation.group(0),type="punctuation",source=Source(file_name,row,col)))
-            start += punctuation.end(0)
-            col += punctuation.end(0)
-        else:
-            start+=1
-
-    return tokens
+    return list(tokenize_buffer(source_code, file_name))
+
+def read_chunks(source: TextIO | bytes | bytearray | mmap.mmap, chunk_size: int) -> Iterator[str]:
+    """Yields the text of `source` in pieces of at most `chunk_size` characters.
+    Byte buffers and mmaps are decoded as UTF-8."""
+    if isinstance(source, (bytes, bytearray, mmap.mmap)):
+        decoder = codecs.getincrementaldecoder("utf-8")()
+        for start in range(0, len(source), chunk_size):
+            yield decoder.decode(source[start:start + chunk_size])
+        yield decoder.decode(b"", final=True)
+    else:
+        while chunk := source.read(chunk_size):
+            yield chunk
+
+def tokenize_stream(source: TextIO | bytes | bytearray | mmap.mmap, file_name: str = "", chunk_size: int = 1 << 16) -> Iterator[Token]:
+    """Lazily tokenizes a text file, a bytes buffer or an mmap.
+
+    Only the current chunk and the unfinished token at its end are kept in
+    memory, along with the line start offsets. Block comments are skipped
+    as they are read, so they may span any number of chunks."""
+    match = token_pat.match
+    chunks = read_chunks(source, chunk_size)
+    file = SourceFile(file_name)
+    buffer = ""
+    offset = 0 # Offset of buffer[0] in the whole source.
+    pos = 0
+    comment_start: Source | None = None
+    eof = False
+    while not eof:
+        chunk = next(chunks, None)
+        eof = chunk is None
+        offset += pos
+        buffer = buffer[pos:] + (chunk or "")
+        pos = 0
+        end = len(buffer)
+        while pos < end:
+            if comment_start is not None:
+                close = buffer.find("*/", pos)
+                if close == -1 and eof:
+                    raise Exception(f"{comment_start}: unterminated comment")
+                # Keep the last character, it may be the start of "*/".
+                skip_to = end - 1 if close == -1 else close + 2
+                file.add_lines(buffer, pos, skip_to, offset)
+                pos = skip_to
+                if close == -1:
+                    break
+                comment_start = None
+                continue
+
+            m = match(buffer, pos)
+            if m is None:
+                if not eof and pos == end - 1:
+                    # Could be the first half of a two character operator.
+                    break
+                pos += 1
+                continue
+            if not eof and m.end() == end:
+                # The token may continue in the next chunk.
+                break
+            kind = m.lastgroup
+            if kind == "_linebreak":
+                file.line_starts.append(offset + m.end())
+            elif kind == "_multi_line_comment":
+                comment_start = Source.at(file, offset + pos)
+            elif kind is not None and kind[0] != "_":
+                yield Token(text=m.group(), type=kind, source=Source.at(file, offset + pos))
+            pos = m.end()
+    if comment_start is not None:
+        raise Exception(f"{comment_start}: unterminated comment")
@@ -0,0 +1,419 @@
+import hashlib
+import re
+from dataclasses import dataclass
+from types import CodeType
+from typing import Any, Callable, Iterator, Optional
+from compiler import ast
+from compiler.resolver import FREE
+from compiler.traversal import Visit, traverse
+from compiler.types import Bool, Int
+from compiler.vm import divide, modulo, wrap
+
+# Python source for the interpreter. The tree is lowered to the body of
+# `def run(sym_tab)`: block variables become locals, `while` a while loop
+# and `break` and `continue` themselves. The value of every node is a
+# Python expression without side effects, and the side effects are
+# statements before it, like the IR of compiler.ir_generator.
+
+MIN, MAX = -2**63, 2**63 - 1
+
+class Unsupported(Exception):
+    pass
+
+@dataclass
+class Transpiled:
+    """Source of `run`, and the builtins of the interpreter it inlines."""
+    source: str
+    operators: set[str]
+
+def check(value: Any) -> Any:
+    if type(value) not in (int, bool):
+        raise TypeError("Operand of incompatible type.")
+    return value
+
+def negation(value: Any) -> bool:
+    if value is not None:
+        check(value)
+    return not value
+
+namespace = {'wrap': wrap, 'divide': divide, 'modulo': modulo, 'check': check, 'negation': negation}
+arithmetic = {'+', '-', '*'}
+comparisons = {'==', '!=', '<', '<=', '>', '>='}
+
+def transpile(root: ast.Expression, bindings: int) -> Optional[Transpiled]:
+    """Lowers `root`, resolved with `bindings` block variables, to Python.
+    Returns None for trees with nodes the interpreter can't run, like
+    function calls and assignments to literals."""
+    lines: list[str] = []
+    indent = 1
+    temps = 0
+    free: set[str] = set()
+    operators: set[str] = set()
+    # Variables read by the value expressions, by the expression. Temporaries
+    # and literals read none.
+    reads: dict[str, frozenset[str]] = {}
+    # Number of assignments to variables emitted so far, and for each
+    # variable, the number before its last one.
+    assignments = 0
+    assigned: dict[str, int] = {}
+    # Value expressions that can be None, though the type checker may have
+    # given their node type Int or Bool: assignments evaluate to None.
+    none_values = {"None"}
+    # Variables that can hold None where they are read, and the block
+    # variables read in their own initializer, whose declaration must
+    # store None.
+    nullable: set[str] = set()
+    uninitialized: set[str] = set()
+
+    def line(text: str) -> None:
+        lines.append("    " * indent + text)
+
+    def assign(name: str, text: str) -> None:
+        nonlocal assignments
+        line(text)
+        assigned[name] = assignments
+        assignments += 1
+
+    def temp() -> str:
+        nonlocal temps
+        temps += 1
+        return f"t{temps}"
+
+    def expression(text: str, *values: str) -> str:
+        """`text`, an expression that reads the variables `values` read."""
+        names = frozenset().union(*(reads.get(value, ()) for value in values))
+        if names:
+            reads[text] = names
+        return text
+
+    def is_atom(value: str) -> bool:
+        """Whether evaluating `value` can't fail or change anything."""
+        return re.fullmatch(r"[tv]\d+|None|True|False|\(?-?\d+\)?", value) is not None
+
+    def after(value: str, mark: int, count: int) -> str:
+        """`value`, computed before the lines from `mark` on if they assign
+        a variable it reads. `count` is the number of assignments before
+        `mark`."""
+        if not any(assigned.get(name, -1) >= count for name in reads.get(value, ())):
+            return value
+        name = temp()
+        lines.insert(mark, "    " * indent + f"{name} = {value}")
+        if value in none_values:
+            none_values.add(name)
+        return name
+
+    def checked(expression: str) -> str:
+        """A temporary with the value of `expression` wrapped to 64 bits."""
+        name = temp()
+        line(f"{name} = {expression}")
+        line(f"if not {MIN} <= {name} <= {MAX}: {name} = wrap({name})")
+        return name
+
+    def key(node: ast.Identifier) -> str:
+        """The Python name of the variable `node` refers to."""
+        if node.binding != FREE:
+            return f"v{node.binding}"
+        return f"f_{node.name}"
+
+    def variable(node: ast.Identifier) -> str:
+        name = key(node)
+        if node.binding == FREE:
+            free.add(node.name)
+            value = f"{name}[-1]"
+        else:
+            value = name
+        reads[value] = frozenset([name])
+        if name in nullable:
+            none_values.add(value)
+        return value
+
+    def results(node: ast.Expression) -> Iterator[ast.Expression]:
+        """The nodes whose value can be the value of `node`."""
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            match node:
+                case ast.Block():
+                    stack.append(node.result)
+                case ast.Conditional(op='if') if node.second is not None:
+                    stack += [node.first, node.second]
+                case ast.BinaryOp(op='and' | 'or'):
+                    stack.append(node.right)
+                case _:
+                    yield node
+
+    def analyze() -> None:
+        """Finds the `nullable` and `uninitialized` variables."""
+        # For each variable, the variables its value is assigned to.
+        copies: dict[str, list[str]] = {}
+        # The variables whose initializer is being visited, and the free
+        # variables declared so far.
+        initializing: set[str] = set()
+        declared: set[str] = set()
+
+        def assigned(target: str, value: ast.Expression) -> None:
+            for node in results(value):
+                match node:
+                    case ast.Identifier():
+                        copies.setdefault(key(node), []).append(target)
+                    case ast.Literal() if node.value is not None:
+                        pass
+                    case ast.BinaryOp(op='='):
+                        nullable.add(target)
+                    case ast.BinaryOp() | ast.UnaryOp():
+                        pass
+                    case _:
+                        nullable.add(target)
+
+        def enter(node: ast.Expression) -> Visit[None] | None:
+            match node:
+                case ast.Identifier():
+                    name = key(node)
+                    if name in initializing:
+                        nullable.add(name)
+                        if node.binding != FREE:
+                            uninitialized.add(name)
+                    elif node.binding == FREE and name not in declared:
+                        # The value of the caller's variable.
+                        nullable.add(name)
+                case ast.VariableDeclaration():
+                    # A declaration without an initializer.
+                    name = key(node.variable)
+                    nullable.add(name)
+                    uninitialized.add(name)
+                    declared.add(name)
+                case ast.Literal() | ast.Break() | ast.Continue():
+                    pass
+                case _:
+                    return visit(node)
+            return None
+
+        def visit(node: ast.Expression) -> Visit[None]:
+            match node:
+                case ast.BinaryOp(op='=', left=ast.VariableDeclaration(variable=target)):
+                    name = key(target)
+                    initializing.add(name)
+                    yield node.right
+                    initializing.discard(name)
+                    declared.add(name)
+                    assigned(name, node.right)
+                case ast.BinaryOp(op='=', left=ast.Identifier() as target):
+                    yield node.right
+                    assigned(key(target), node.right)
+                case ast.BinaryOp():
+                    yield node.left
+                    yield node.right
+                case ast.UnaryOp():
+                    yield node.right
+                case ast.Conditional():
+                    yield node.condition
+                    yield node.first
+                    if node.second is not None:
+                        yield node.second
+                case ast.Block():
+                    for expression in node.expressions:
+                        yield expression
+                    yield node.result
+                case ast.FunctionCall():
+                    yield node.function
+                    for param in node.parameters:
+                        yield param
+
+        traverse(root, enter)
+        stack = list(nullable)
+        while stack:
+            for target in copies.pop(stack.pop(), []):
+                if target not in nullable:
+                    nullable.add(target)
+                    stack.append(target)
+
+    def transpile_literal(node: ast.Literal) -> str:
+        if type(node.value) is int:
+            return f"({wrap(node.value)})"
+        return repr(node.value)
+
+    def transpile_identifier(node: ast.Identifier) -> str:
+        return variable(node)
+
+    def transpile_declaration(node: ast.VariableDeclaration) -> str:
+        name = node.variable.name
+        if node.variable.binding == FREE:
+            free.add(name)
+            line(f"sym_tab.declare({name!r})")
+            assign(key(node.variable), f"f_{name} = stacks[{name!r}]")
+        elif key(node.variable) in uninitialized:
+            # The None it stores is seen by a read before the assignment.
+            assign(key(node.variable), f"v{node.variable.binding} = None")
+        return "None"
+
+    def transpile_jump(node: ast.Expression) -> str:
+        line(str(node))
+        return "None"
+
+    def transpile_binary_op(node: ast.BinaryOp) -> Visit[str]:
+        op = node.op
+        if op == '=':
+            yield node.left
+            if isinstance(node.left, ast.VariableDeclaration):
+                target = node.left.variable
+            elif isinstance(node.left, ast.Identifier):
+                target = node.left
+            else:
+                raise Unsupported()
+            value = yield node.right
+            assign(key(target), f"{variable(target)} = {value}")
+            return "None"
+
+        left = yield node.left
+        mark = len(lines)
+        count = assignments
+        right = yield node.right
+        if op in ('and', 'or'):
+            if len(lines) == mark:
+                if op == 'and':
+                    value = expression(f"({right} if {left} else False)", left, right)
+                else:
+                    value = expression(f"(True if {left} else {right})", left, right)
+                if right in none_values:
+                    none_values.add(value)
+                return value
+            name = temp()
+            lines[mark:] = ["    " + text for text in lines[mark:]]
+            if op == 'and':
+                lines[mark:mark] = ["    " * indent + f"{name} = False", "    " * indent + f"if {left}:"]
+            else:
+                lines[mark:mark] = ["    " * indent + f"{name} = True", "    " * indent + f"if not {left}:"]
+            line(f"    {name} = {right}")
+            if right in none_values:
+                none_values.add(name)
+            return name
+
+        operators.add(op)
+        left = after(left, mark, count)
+        if op in arithmetic:
+            return checked(f"{left} {op} {right}")
+        if op in ('/', '%'):
+            name = temp()
+            line(f"{name} = {'divide' if op == '/' else 'modulo'}({left}, {right})")
+            return name
+        if op in ('==', '!='):
+            # Only Int and Bool operands can be compared without checking
+            # them, and the type checker types an assignment as its value.
+            if (node.left.type not in (Int, Bool) or node.right.type not in (Int, Bool)
+                    or left in none_values or right in none_values):
+                return expression(f"(check({left}) {op} check({right}))", left, right)
+        if op in comparisons:
+            return expression(f"({left} {op} {right})", left, right)
+        raise Unsupported()
+
+    def transpile_unary_op(node: ast.UnaryOp) -> Visit[str]:
+        value = yield node.right
+        operators.add(f"unary_{node.op}")
+        if node.op == '-':
+            return checked(f"-{value}")
+        if node.right.type in (Int, Bool):
+            return expression(f"(not {value})", value)
+        return expression(f"negation({value})", value)
+
+    def transpile_block(node: ast.Block) -> Visit[str]:
+        for expression in node.expressions:
+            value = yield expression
+            if not is_atom(value):
+                line(value)
+        return (yield node.result)
+
+    def transpile_conditional(node: ast.Conditional) -> Visit[str]:
+        nonlocal indent
+        operators.add(node.op)
+        if node.op == 'while':
+            line("while True:")
+            start = len(lines)
+            indent += 1
+            condition = yield node.condition
+            if len(lines) == start:
+                lines[-1] = "    " * (indent - 1) + f"while {condition}:"
+            else:
+                line(f"if not {condition}: break")
+            value = yield node.first
+            if not is_atom(value) or len(lines) == start:
+                line(value)
+            indent -= 1
+            return "None"
+
+        condition = yield node.condition
+        start = len(lines)
+        line(f"if {condition}:")
+        name = temp()
+        # Whether a branch gives a value other than None.
+        assigned = False
+        unassigned = node.second is None
+        branches = [node.first] if node.second is None else [node.first, node.second]
+        for i, branch in enumerate(branches):
+            if i == 1:
+                line("else:")
+            indent += 1
+            mark = len(lines)
+            value = yield branch
+            if value != "None":
+                line(f"{name} = {value}")
+                assigned = True
+                if value in none_values:
+                    none_values.add(name)
+            else:
+                unassigned = True
+                if len(lines) == mark:
+                    line("pass")
+            indent -= 1
+        if not assigned:
+            return "None"
+        if unassigned:
+            lines.insert(start, "    " * indent + f"{name} = None")
+            none_values.add(name)
+        return name
+
+    def transpile_unknown(node: ast.Expression) -> str:
+        raise Unsupported()
+
+    handlers = ast.Dispatch[Callable[..., Visit[str] | str]]({
+        ast.Literal: transpile_literal,
+        ast.Identifier: transpile_identifier,
+        ast.VariableDeclaration: transpile_declaration,
+        ast.Break: transpile_jump,
+        ast.Continue: transpile_jump,
+        ast.BinaryOp: transpile_binary_op,
+        ast.UnaryOp: transpile_unary_op,
+        ast.Block: transpile_block,
+        ast.Conditional: transpile_conditional,
+    }, transpile_unknown)
+
+    analyze()
+    try:
+        value = traverse(root, lambda node: handlers[type(node)](node))
+    except Unsupported:
+        return None
+    header = ["def run(sym_tab):", "    stacks = sym_tab.stacks"]
+    if bindings:
+        header.append("    " + " = ".join(f"v{binding}" for binding in range(bindings)) + " = None")
+    header += [f"    f_{name} = stacks.get({name!r})" for name in sorted(free)]
+    return Transpiled("\n".join(header + lines + [f"    return {value}", ""]), operators)
+
+# Code objects of the sources `load` has compiled, by the hash of the
+# source. None for sources Python can't compile.
+codes: dict[bytes, Optional[CodeType]] = {}
+
+def load(source: str) -> Optional[Callable[[Any], Any]]:
+    """The `run` function defined by `source`, or None if Python can't
+    compile it, like a loop nested too deep or a break outside a loop."""
+    key = hashlib.sha256(source.encode()).digest()
+    if key not in codes:
+        try:
+            codes[key] = compile(source, "<transpiled>", "exec")
+        except (SyntaxError, RecursionError, MemoryError):
+            codes[key] = None
+    code = codes[key]
+    if code is None:
+        return None
+    scope: dict[str, Any] = dict(namespace)
+    exec(code, scope)
+    run: Callable[[Any], Any] = scope['run']
+    return run
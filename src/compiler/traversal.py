@@ -0,0 +1,78 @@
+from types import GeneratorType
+from typing import Any, Callable, Generator, Optional
+from compiler import ast
+
+# Visits to AST nodes are generators, like the sub-parsers of the parser:
+# to visit a child, a visit yields the child node and receives the child's
+# result. The value it returns is the result of the node. `traverse` drives
+# the visits with a stack of its own, so deep trees don't use the Python
+# stack.
+type Visit[T] = Generator[ast.Expression, Any, T]
+
+def traverse[T](
+    root: ast.Expression,
+    enter: Callable[[ast.Expression], Visit[T] | T],
+    exit: Optional[Callable[[ast.Expression, T], None]] = None
+) -> T:
+    """Visits `root`. `enter` starts the visit of a node: it returns the
+    visit, or the result itself for nodes without children. `exit` is
+    called with each node and its result.
+
+    An exception raised while visiting a child, or by `exit` for it, is raised in the parent's
+    visit at the point where it yielded the child, as a recursive call
+    would raise it."""
+    nodes: list[ast.Expression] = []
+    visits: list[Visit[T]] = []
+    push_node, pop_node = nodes.append, nodes.pop
+    push_visit, pop_visit = visits.append, visits.pop
+    child: Optional[ast.Expression] = root
+    value: Any = None
+    error: Optional[Exception] = None
+    while True:
+        if child is not None:
+            try:
+                visit = enter(child)
+                if exit is not None and type(visit) is not GeneratorType:
+                    exit(child, visit) # type: ignore[arg-type]
+            except Exception as e:
+                if not visits:
+                    raise
+                error = e
+            else:
+                if type(visit) is GeneratorType:
+                    push_node(child)
+                    push_visit(visit)
+                    value = None
+                else:
+                    if not visits:
+                        return visit # type: ignore[return-value]
+                    value = visit
+            child = None
+
+        try:
+            if error is None:
+                child = visits[-1].send(value)
+            else:
+                child = visits[-1].throw(error)
+                error = None
+        except StopIteration as result:
+            value = result.value
+            error = None
+            node = pop_node()
+            pop_visit()
+            if exit is not None:
+                try:
+                    exit(node, value)
+                except Exception as e:
+                    if not visits:
+                        raise
+                    error = e
+                    continue
+            if not visits:
+                return value # type: ignore[no-any-return]
+        except Exception as e:
+            pop_node()
+            pop_visit()
+            if not visits:
+                raise
+            error = e
@@ -1,191 +1,314 @@
 import compiler.ast as ast
-from typing import Optional, Self, Callable
-from compiler.types import Int, Bool, Type, Unit, FunType, Any
+from dataclasses import dataclass
+from typing import Optional, Callable
+from compiler import symtab
+from compiler.tokenizer import Source
+from compiler.types import Int, Bool, Type, Unit, FunType, Any, Error
+from compiler.resolver import FREE, Resolution, resolve
+from compiler.traversal import Visit, traverse
 
-class SymTab:
-    parent : Optional[Self] = None
-    locals: dict
-    def __init__(self, parent: Optional[Self] = None):
-        self.parent = parent
-        self.locals = {}
+class TypeCheckError(Exception):
+    """A type error. `code` names the kind of error."""
+    code: str
+    def __init__(self, message: str, code: str):
+        super().__init__(message)
+        self.code = code
+
+@dataclass(frozen=True, slots=True)
+class Diagnostic:
+    """A type error found by `typecheck`."""
+    location: Source
+    message: str
+    code: str
+
+class Diagnostics(Exception):
+    """The errors of a program type checked with `diagnostics`."""
+    diagnostics: list[Diagnostic]
+    def __init__(self, diagnostics: list[Diagnostic]):
+        super().__init__("\n".join(f"{d.location}: {d.message}" for d in diagnostics))
+        self.diagnostics = diagnostics
+
+class SymTab(symtab.SymTab[Type]):
+    # Types of the block variables, indexed by binding.
+    bindings: list[Type]
+    # Where errors are recorded instead of raised, see `typecheck`.
+    diagnostics: Optional[list[Diagnostic]]
+    def __init__(self) -> None:
+        super().__init__()
+        self.bindings = []
+        self.diagnostics = None
 
     def declare(self, variable: str) -> None:
-        self.locals[variable] = Any
+        self.define(variable, Any)
+
+    def read(self, variable: str) -> Type:
+        if variable not in self.stacks:
+            raise TypeCheckError(f"Variable '{variable}' is not declared.", "undeclared")
+        return super().read(variable)
 
-    def assign(self, variable: str, value: Type) -> None:
-        if variable in self.locals:
-            self.locals[variable] = value
-        elif self.parent is not None:
-            self.parent.assign(variable, value)
+    def report(self, node: ast.Expression, error: Exception) -> None:
+        """Records `error` as a diagnostic at `node`, or raises it when
+        errors are not collected."""
+        if self.diagnostics is None:
+            raise error
+        code = error.code if isinstance(error, TypeCheckError) else "error"
+        self.diagnostics.append(Diagnostic(node.location, error.args[0], code))
+
+    def declare_variable(self, variable: ast.Identifier) -> None:
+        if variable.binding == FREE:
+            self.declare(variable.name)
         else:
-            raise Exception(f"Variable '{variable}' is not declared.")
+            self.bindings[variable.binding] = Any
 
-    def read(self, variable: str) -> Type:
-        if variable in self.locals:
-            return self.locals[variable]
-        elif self.parent is not None:
-            return self.parent.read(variable)
+    def assign_variable(self, variable: ast.Identifier, value: Type) -> None:
+        if variable.binding == FREE:
+            self.assign(variable.name, value)
         else:
-            raise Exception(f"Variable '{variable}' is not declared.")
+            self.bindings[variable.binding] = value
+
+    def read_variable(self, variable: ast.Identifier) -> Type:
+        if variable.binding == FREE:
+            return self.read(variable.name)
+        return self.bindings[variable.binding]
 
     def initialize_top(self) -> None:
         builtin_functions: dict[str, Type] = {
-            'or': FunType([Bool, Bool], Bool),
-            'and': FunType([Bool, Bool], Bool),
-            '==': FunType([Any, Any], Bool),
-            '!=': FunType([Any, Any], Bool),
-            '<': FunType([Int, Int], Bool),
-            '<=': FunType([Int, Int], Bool),
-            '>': FunType([Int, Int], Bool),
-            '>=': FunType([Int, Int], Bool),
-            '+': FunType([Int, Int], Int),
-            '-': FunType([Int, Int], Int),
-            '*': FunType([Int, Int], Int),
-            '/': FunType([Int, Int], Int),
-            '%': FunType([Int, Int], Int),
-            'unary_-': FunType([Int], Int),
-            'unary_not': FunType([Bool], Bool),
-            'if': FunType([Bool, Any, Any], Any),
-            'while': FunType([Bool, Any], Unit),
+            'or': FunType((Bool, Bool), Bool),
+            'and': FunType((Bool, Bool), Bool),
+            '==': FunType((Any, Any), Bool),
+            '!=': FunType((Any, Any), Bool),
+            '<': FunType((Int, Int), Bool),
+            '<=': FunType((Int, Int), Bool),
+            '>': FunType((Int, Int), Bool),
+            '>=': FunType((Int, Int), Bool),
+            '+': FunType((Int, Int), Int),
+            '-': FunType((Int, Int), Int),
+            '*': FunType((Int, Int), Int),
+            '/': FunType((Int, Int), Int),
+            '%': FunType((Int, Int), Int),
+            'unary_-': FunType((Int,), Int),
+            'unary_not': FunType((Bool,), Bool),
+            'if': FunType((Bool, Any, Any), Any),
+            'while': FunType((Bool, Any), Unit),
             'unit': Unit,
-            'print_int': FunType([Int], Unit),
-            'print_bool': FunType([Bool], Unit),
-            'read_int': FunType([], Int)
-            #'f' : FunType([Int, Int, Int, Int, Int, Int, Int, Int], Unit)
+            'print_int': FunType((Int,), Unit),
+            'print_bool': FunType((Bool,), Unit),
+            'read_int': FunType((), Int)
+            #'f' : FunType((Int, Int, Int, Int, Int, Int, Int, Int), Unit)
         }
 
         for variable, var_type in builtin_functions.items():
             self.declare(variable)
             self.assign(variable, var_type)
 
-def typecheck_resolve(node: ast.Expression, sym_tab: SymTab) -> Type:
-    match node:
-        case ast.Literal():
-            if isinstance(node.value, bool):
-                return Bool
-            elif isinstance(node.value, int):
-                return Int
-            elif node.value is None:
-                return Unit
-            else:
-                raise Exception(f"Unsupported type '{type(node.value)}' for literal.")
-        
-        case ast.Continue():
-            return Unit
-
-        case ast.Break():
-            return Unit
-
-        case ast.Identifier():
-            return sym_tab.read(node.name)
-
-        case ast.VariableDeclaration():
-            sym_tab.declare(node.variable.name)
-            if node.var_type is not None:
-                sym_tab.assign(node.variable.name, node.var_type)
-            return typecheck(node.variable, sym_tab)
-
-        case ast.BinaryOp():
-            t1 = typecheck(node.left, sym_tab)
-            t2 = typecheck(node.right, sym_tab)
-            if node.op == '=':
-                left: ast.Identifier
-                if isinstance(node.left, ast.Identifier):
-                    if t1 < t2 or not t1 >= t2:
-                        raise Exception(f"Left and right of '{node.op}' are of different types. {t1} != {t2}")
-                    else:
-                        left = node.left  
-                elif isinstance(node.left, ast.VariableDeclaration):
-                    if t1 < t2 or not t1 >= t2:
-                        raise Exception(f"Left and right of '{node.op}' are of different types. {t1} != {t2}")
-                    left = node.left.variable
-                    node.left.variable.type = t2
-                else:
-                    raise Exception(f"Unsupported type '{t1}' to the left of '{node.op}'.")
-                
-                sym_tab.assign(left.name, t2)
-                return t2
-
-            operation = sym_tab.read(node.op)
-            if not isinstance(operation, FunType):
-                raise Exception(f"'{node.op}' is not a binary function.")
-            
-            if not t1 <= operation.parameters[0]:
-                raise Exception(f"Unsupported type '{t1}' left of '{node.op}'. {operation}")
-            if not t2 <= operation.parameters[1]:
-                raise Exception(f"Unsupported type '{t2}' right of '{node.op}'. {operation}")
-            else:
-                return operation.value
-
-        case ast.UnaryOp():
-            t = typecheck(node.right, sym_tab)
-            operation = sym_tab.read(f"unary_{node.op}")
-            if not isinstance(operation, FunType):
-                raise Exception(f"'{node.op}' is not a unary function.")
-            if t is not operation.parameters[0]:
-                raise Exception(f"Unsupported type '{t}' for '{node.op}' {str(operation)}.")
-            else:
-                return operation.value
-
-        case ast.FunctionCall():
-            func_t = typecheck(node.function, sym_tab)
-            param_t = []
-            for param in node.parameters:
-                param_t.append(typecheck(param, sym_tab))
-            
-            if not isinstance(func_t, FunType):
-                raise Exception(f"Variable '{node.function.name}' is not a function.")
-            
-            arg_n = len(func_t.parameters)
-            if arg_n != len(param_t):
-                raise Exception(f"Function '{node.function.name}' received incorrect number of arguments. Expected {arg_n}, but received {len(param_t)}.")
-            
-            for i in range(arg_n):
-                if func_t.parameters[i] < param_t[i] or not func_t.parameters[i] >= param_t[i]:
-                    raise Exception(f"Function '{node.function.name}' argument number {i+1} is incorrect type. Expected '{func_t.parameters[i]}', but received '{param_t[i]}'.")
-            
-            return func_t.value
-
-        case ast.Block():
-            local_sym_tab = SymTab(sym_tab)
-            for expr in node.expressions:
-                typecheck(expr, local_sym_tab)
-            return typecheck(node.result, local_sym_tab)
-
-        case ast.Conditional():
-            t1 = typecheck(node.condition, sym_tab)
-            t2 = typecheck(node.first, sym_tab)
-            t3 = None
-            if t1 != Bool:
-                raise Exception(f"Expected condition to be of type 'Bool', but received '{t1}'.")
-            params = [t1, t2]
-            if node.second is not None:
-                t3 = typecheck(node.second, sym_tab)
-                params.append(t3)
-            
-            arg_n = len(params)
-            
-            if node.op == 'if':
-                if arg_n == 3:
-                    if t2 != t3:
-                        raise Exception(F"Expected 'if-else' expressions to be same type, but received '{t2} != {t3}'.")
-                elif arg_n != 2:
-                    raise Exception(f"Conditional '{node.op}' received incorrect number of arguments. Expected 2 or 3, but received {arg_n}.")
-                return t2
-            elif node.op == 'while':
-                if arg_n != 2:
-                    raise Exception(f"Conditional '{node.op}' received incorrect number of arguments. Expected 2, but received {arg_n}.")
-                return Unit
-            else:
-                raise Exception(f"'{node.op}' is not a conditional.")
-
-        case _:
-            raise Exception(f"Unknown expression {node}")
-
-def typecheck(node: ast.Expression, sym_tab: Optional[SymTab] = None) -> Type:
+def typecheck_resolve(node: ast.Expression, sym_tab: SymTab) -> Visit[Type] | Type:
+    """Returns the type of a node without children, or the visit that
+    checks the children of other nodes."""
+    return type_handlers[type(node)](node, sym_tab)
+
+def literal_type(node: ast.Literal, sym_tab: SymTab) -> Type:
+    if isinstance(node.value, bool):
+        return Bool
+    elif isinstance(node.value, int):
+        return Int
+    elif node.value is None:
+        return Unit
+    else:
+        raise TypeCheckError(f"Unsupported type '{type(node.value)}' for literal.", "unsupported-literal")
+
+def jump_type(node: ast.Break | ast.Continue, sym_tab: SymTab) -> Type:
+    return Unit
+
+def identifier_type(node: ast.Identifier, sym_tab: SymTab) -> Type:
+    return sym_tab.read_variable(node)
+
+def typecheck_declaration(node: ast.VariableDeclaration, sym_tab: SymTab) -> Visit[Type]:
+    declare(node, sym_tab)
+    return (yield node.variable)
+
+def typecheck_binary_op(node: ast.BinaryOp, sym_tab: SymTab) -> Visit[Type]:
+    t1 = yield node.left
+    t2 = yield node.right
+    if node.op == '=':
+        return assignment_type(node, t1, t2, sym_tab)
+    return binary_op_type(node, t1, t2, sym_tab)
+
+def typecheck_unary_op(node: ast.UnaryOp, sym_tab: SymTab) -> Visit[Type]:
+    t = yield node.right
+    return unary_op_type(node, t, sym_tab)
+
+def typecheck_function_call(node: ast.FunctionCall, sym_tab: SymTab) -> Visit[Type]:
+    func_t = yield node.function
+    param_t = []
+    for param in node.parameters:
+        param_t.append((yield param))
+    return function_call_type(node, func_t, param_t)
+
+def typecheck_block(node: ast.Block, sym_tab: SymTab) -> Visit[Type]:
+    # Block variables are resolved to bindings, so no new scope is needed.
+    for expr in node.expressions:
+        yield expr
+    return (yield node.result)
+
+def typecheck_conditional(node: ast.Conditional, sym_tab: SymTab) -> Visit[Type]:
+    t1 = yield node.condition
+    t2 = yield node.first
+    try:
+        check_condition(t1)
+    except TypeCheckError as e:
+        # The type of the conditional does not depend on the condition,
+        # so the other errors can still be found.
+        if t1 is not Error:
+            sym_tab.report(node.condition, e)
+    t3 = None
+    if node.second is not None:
+        t3 = yield node.second
+    return conditional_type(node, t2, t3)
+
+def unknown_expression(node: ast.Expression, sym_tab: SymTab) -> Type:
+    raise TypeCheckError(f"Unknown expression {node}", "unknown-expression")
+
+type_handlers = ast.Dispatch[Callable[..., Visit[Type] | Type]]({
+    ast.Literal: literal_type,
+    ast.Break: jump_type,
+    ast.Continue: jump_type,
+    ast.Identifier: identifier_type,
+    ast.VariableDeclaration: typecheck_declaration,
+    ast.BinaryOp: typecheck_binary_op,
+    ast.UnaryOp: typecheck_unary_op,
+    ast.FunctionCall: typecheck_function_call,
+    ast.Block: typecheck_block,
+    ast.Conditional: typecheck_conditional,
+}, unknown_expression)
+
+# The type rules, given the types of the children. They are shared with
+# the type checking mode of compiler.ir_generator.
+
+def declare(node: ast.VariableDeclaration, sym_tab: SymTab) -> None:
+    sym_tab.declare_variable(node.variable)
+    if node.var_type is not None:
+        sym_tab.assign_variable(node.variable, node.var_type)
+
+def assignment_type(node: ast.BinaryOp, t1: Type, t2: Type, sym_tab: SymTab) -> Type:
+    left: ast.Identifier
+    if isinstance(node.left, ast.Identifier):
+        if t1 < t2 or not t1 >= t2:
+            raise TypeCheckError(f"Left and right of '{node.op}' are of different types. {t1} != {t2}", "assignment-type")
+        else:
+            left = node.left  
+    elif isinstance(node.left, ast.VariableDeclaration):
+        if t1 < t2 or not t1 >= t2:
+            raise TypeCheckError(f"Left and right of '{node.op}' are of different types. {t1} != {t2}", "assignment-type")
+        left = node.left.variable
+        node.left.variable.type = t2
+    else:
+        raise TypeCheckError(f"Unsupported type '{t1}' to the left of '{node.op}'.", "assignment-target")
+    
+    sym_tab.assign_variable(left, t2)
+    return t2
+
+def binary_op_type(node: ast.BinaryOp, t1: Type, t2: Type, sym_tab: SymTab) -> Type:
+    operation = sym_tab.read(node.op)
+    if not isinstance(operation, FunType):
+        raise TypeCheckError(f"'{node.op}' is not a binary function.", "not-an-operator")
+    
+    if not t1 <= operation.parameters[0]:
+        raise TypeCheckError(f"Unsupported type '{t1}' left of '{node.op}'. {operation}", "operand-type")
+    if not t2 <= operation.parameters[1]:
+        raise TypeCheckError(f"Unsupported type '{t2}' right of '{node.op}'. {operation}", "operand-type")
+    else:
+        return operation.value
+
+def unary_op_type(node: ast.UnaryOp, t: Type, sym_tab: SymTab) -> Type:
+    operation = sym_tab.read(f"unary_{node.op}")
+    if not isinstance(operation, FunType):
+        raise TypeCheckError(f"'{node.op}' is not a unary function.", "not-an-operator")
+    if t is not operation.parameters[0]:
+        raise TypeCheckError(f"Unsupported type '{t}' for '{node.op}' {str(operation)}.", "operand-type")
+    else:
+        return operation.value
+
+def function_call_type(node: ast.FunctionCall, func_t: Type, param_t: list[Type]) -> Type:
+    if not isinstance(func_t, FunType):
+        raise TypeCheckError(f"Variable '{node.function.name}' is not a function.", "not-a-function")
+    
+    arg_n = len(func_t.parameters)
+    if arg_n != len(param_t):
+        raise TypeCheckError(f"Function '{node.function.name}' received incorrect number of arguments. Expected {arg_n}, but received {len(param_t)}.", "argument-count")
+    
+    for i in range(arg_n):
+        if func_t.parameters[i] < param_t[i] or not func_t.parameters[i] >= param_t[i]:
+            raise TypeCheckError(f"Function '{node.function.name}' argument number {i+1} is incorrect type. Expected '{func_t.parameters[i]}', but received '{param_t[i]}'.", "argument-type")
+    
+    return func_t.value
+
+def check_condition(t1: Type) -> None:
+    """Checked once the condition and the first branch are checked."""
+    if t1 != Bool:
+        raise TypeCheckError(f"Expected condition to be of type 'Bool', but received '{t1}'.", "condition-type")
+
+def conditional_type(node: ast.Conditional, t2: Type, t3: Optional[Type]) -> Type:
+    arg_n = 2 if t3 is None else 3
+    if node.op == 'if':
+        if arg_n == 3:
+            if t2 != t3:
+                raise TypeCheckError(F"Expected 'if-else' expressions to be same type, but received '{t2} != {t3}'.", "branch-type")
+        return t2
+    elif node.op == 'while':
+        if arg_n != 2:
+            raise TypeCheckError(f"Conditional '{node.op}' received incorrect number of arguments. Expected 2, but received {arg_n}.", "argument-count")
+        return Unit
+    else:
+        raise TypeCheckError(f"'{node.op}' is not a conditional.", "unknown-conditional")
+
+def set_type(node: ast.Expression, type: Type) -> None:
+    node.type = type
+
+def typecheck_reporting(node: ast.Expression, sym_tab: SymTab) -> Visit[Type] | Type:
+    """`typecheck_resolve` that reports the errors of a node and gives it
+    the type Error. The errors of nodes with a child of type Error follow
+    from the child's error, so they are not reported."""
+    try:
+        visit = typecheck_resolve(node, sym_tab)
+    except Exception as e:
+        sym_tab.report(node, e)
+        return Error
+    if isinstance(visit, Type):
+        return visit
+    return report_errors(node, visit, sym_tab)
+
+def report_errors(node: ast.Expression, visit: Visit[Type], sym_tab: SymTab) -> Visit[Type]:
+    child_error = False
+    t: Optional[Type] = None
+    try:
+        while True:
+            child = visit.send(t)
+            t = yield child
+            child_error = child_error or t is Error
+    except StopIteration as result:
+        return result.value  # type: ignore[no-any-return]
+    except Exception as e:
+        if not child_error:
+            sym_tab.report(node, e)
+        return Error
+
+def typecheck(node: ast.Expression, sym_tab: Optional[SymTab] = None, diagnostics: Optional[list[Diagnostic]] = None, resolution: Optional[Resolution] = None) -> Type:
+    """Returns the type of `node` and sets the types of the nodes in it.
+
+    Raises the first type error, or with `diagnostics`, appends every error
+    to it and gives the nodes with errors the type Error. `resolution` is
+    what `resolve(node)` gave, when the caller has already resolved it."""
     if sym_tab is None:
         sym_tab = SymTab()
         sym_tab.initialize_top()
-    node.type = typecheck_resolve(node, sym_tab)
-    return node.type
+    if resolution is None:
+        resolution = resolve(node)
+    sym_tab.bindings[:] = [Any] * resolution.count
+    sym_tab.diagnostics = diagnostics
+    if diagnostics is None:
+        return traverse(node, lambda node: typecheck_resolve(node, sym_tab), set_type)
+    try:
+        return traverse(node, lambda node: typecheck_reporting(node, sym_tab), set_type)
+    finally:
+        sym_tab.diagnostics = None
    
\ No newline at end of file
@@ -1,48 +1,69 @@
 from dataclasses import dataclass
+from typing import ClassVar, Iterable, Self
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True, eq=False)
 class Type:
-    """General type class."""
-    def __eq__(self, other: object) -> bool:
-        return isinstance(self, type(other)) and isinstance(other, type(self))
-    
-    def __le__(self, other: object) -> bool:
-        return isinstance(self, type(other))
-    
-    def __lt__(self, other: object) -> bool:
-        return self <= other and self != other
-    
-    def __ge__(self, other: object) -> bool:
-        return isinstance(other, type(self))
-
-    def __gt__(self, other: object) -> bool:
-        return self >= other and self != other
+    """General type class.
+
+    Types are interned: every distinct type is a single object, so types
+    compare and hash by identity. A type is a subtype of itself and of Any;
+    function types are subtypes of each other."""
+    _instances: ClassVar[dict[type, "Type"]] = {}
+
+    def __new__(cls) -> Self:
+        instance = Type._instances.get(cls)
+        if instance is None:
+            instance = Type._instances[cls] = object.__new__(cls)
+        return instance  # type: ignore[return-value]
+
+    def __reduce__(self) -> str | tuple[object, ...]:
+        # Copies and unpickled types are the module level instances.
+        return str(self)
+
+    def __le__(self, other: "Type") -> bool:
+        return type(self) is type(other) or other is Any
+
+    def __lt__(self, other: "Type") -> bool:
+        return self <= other and self is not other
+
+    def __ge__(self, other: "Type") -> bool:
+        return type(self) is type(other) or self is Any
+
+    def __gt__(self, other: "Type") -> bool:
+        return self >= other and self is not other
 
     def __str__(self) -> str:
         return "Any"
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True, eq=False)
 class TypeInt(Type):
     """Type of a 64 bit signed integer."""
     def __str__(self) -> str:
         return "Int"
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True, eq=False)
 class TypeBool(Type):
     """Type of a boolean value."""
     def __str__(self) -> str:
         return "Bool"
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True, eq=False)
 class TypeUnit(Type):
     """Type of an empty value."""
     def __str__(self) -> str:
         return "Unit"
 
+@dataclass(frozen=True, slots=True, eq=False)
+class TypeInvalid(Type):
+    """Type of an expression with a type error."""
+    def __str__(self) -> str:
+        return "Error"
+
 Any = Type()
 Int = TypeInt()
 Bool = TypeBool()
 Unit = TypeUnit()
+Error = TypeInvalid()
 Types = {
     'Any':Any,
     'Int':Int,
@@ -50,12 +71,31 @@ Types = {
     'Unit':Unit
 }
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True, eq=False, init=False)
 class FunType(Type):
-    """Type of a function"""
-    parameters: list[Type]
+    """Type of a function. `FunType(parameters, value)` returns the one
+    instance with that signature."""
+    parameters: tuple[Type, ...]
     value: Type
-    
+    _signatures: ClassVar[dict[tuple[tuple[Type, ...], Type], "FunType"]] = {}
+
+    def __new__(cls, parameters: Iterable[Type], value: Type) -> Self:
+        signature = (tuple(parameters), value)
+        instance = FunType._signatures.get(signature)
+        if instance is None:
+            instance = object.__new__(cls)
+            object.__setattr__(instance, "parameters", signature[0])
+            object.__setattr__(instance, "value", value)
+            FunType._signatures[signature] = instance
+        return instance  # type: ignore[return-value]
+
+    def __init__(self, parameters: Iterable[Type], value: Type):
+        # The fields are set once, by __new__.
+        pass
+
+    def __reduce__(self) -> str | tuple[object, ...]:
+        return (FunType, (self.parameters, self.value))
+
     def __str__(self) -> str:
         string = "("
         for param in self.parameters:
@@ -63,17 +103,3 @@ class FunType(Type):
                 string+=", "
             string += str(param)
         return string + ") => "+ str(self.value)
-
-    def __eq__(self, other: object) -> bool:
-        if not (isinstance(self, type(other)) and isinstance(other, type(self))):
-            return False
-        
-        arg_n = len(self.parameters)
-        if arg_n != len(other.parameters):
-            return False
-        
-        for i in range(arg_n):
-            if self.parameters[i] != other.parameters[i]:
-                return False
-        
-        return self.value == other.value
\ No newline at end of file
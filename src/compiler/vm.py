@@ -0,0 +1,510 @@
+import struct
+import sys
+from array import array
+from dataclasses import dataclass
+from enum import IntEnum
+from typing import Callable, Optional, TextIO
+from compiler import ast
+from compiler.resolver import FREE, Resolution, resolve
+from compiler.traversal import Visit, traverse
+from compiler.types import Bool, Int, Type, Unit
+
+class Op(IntEnum):
+    """Bytecode instructions, with their operands and stack effects.
+    Jump offsets are counted from the instruction after the jump.
+
+    The right operand of a binary instruction is given by its operand:
+    -1 pops it from the stack, other negative operands n read slot -2 - n
+    and the others are constant indices, so `x + 1` is two instructions."""
+    CONST = 0                   # constant index    -> value
+    LOAD = 1                    # slot              -> value
+    STORE = 2                   # slot        value ->
+    DUP = 3                     #             value -> value value
+    POP = 4                     #             value ->
+    POP_N = 5                   # count    values   ->
+    ADD = 6                     # right           a -> a + right
+    SUB = 7
+    MUL = 8
+    DIV = 9
+    MOD = 10
+    EQ = 11
+    NE = 12
+    LT = 13
+    LE = 14
+    GT = 15
+    GE = 16
+    NEG = 17                    #             value -> -value
+    NOT = 18
+    JUMP = 19                   # offset
+    JUMP_IF_FALSE = 20          # offset      value ->
+    JUMP_IF_FALSE_OR_POP = 21   # offset      value -> value, if it jumps
+    JUMP_IF_TRUE_OR_POP = 22    # offset      value -> value, if it jumps
+    CALL = 23                   # builtin, count  arguments -> result
+    HALT = 24
+
+# Right operand of a binary instruction that is popped from the stack.
+STACK = -1
+
+# Operand counts of the instructions.
+operand_counts = {op: 0 for op in Op} | {
+    Op.CONST: 1, Op.LOAD: 1, Op.STORE: 1, Op.POP_N: 1, Op.JUMP: 1,
+    Op.JUMP_IF_FALSE: 1, Op.JUMP_IF_FALSE_OR_POP: 1, Op.JUMP_IF_TRUE_OR_POP: 1, Op.CALL: 2,
+} | {op: 1 for op in Op if Op.ADD <= op <= Op.GE}
+
+binary_ops = {
+    '+': Op.ADD, '-': Op.SUB, '*': Op.MUL, '/': Op.DIV, '%': Op.MOD,
+    '==': Op.EQ, '!=': Op.NE, '<': Op.LT, '<=': Op.LE, '>': Op.GT, '>=': Op.GE,
+}
+unary_ops = {'-': Op.NEG, 'not': Op.NOT}
+builtins = ['print_int', 'print_bool', 'read_int']
+
+MAGIC = b"VMB1"
+HEADER = struct.Struct("<4sqqq")
+
+@dataclass
+class Program:
+    """Bytecode of a program. Unit values are 0, booleans 0 or 1."""
+    code: array[int]
+    constants: array[int]
+    # Number of variable slots.
+    slots: int
+
+    def to_bytes(self) -> bytes:
+        code, constants = array('q', self.code), array('q', self.constants)
+        if sys.byteorder == 'big':
+            code.byteswap()
+            constants.byteswap()
+        header = HEADER.pack(MAGIC, self.slots, len(constants), len(code))
+        return header + constants.tobytes() + code.tobytes()
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "Program":
+        magic, slots, constant_count, code_count = HEADER.unpack_from(data)
+        if magic != MAGIC:
+            raise Exception("Not a bytecode program.")
+        constants, code = array('q'), array('q')
+        start = HEADER.size
+        constants.frombytes(data[start:start + 8 * constant_count])
+        start += 8 * constant_count
+        code.frombytes(data[start:start + 8 * code_count])
+        if sys.byteorder == 'big':
+            code.byteswap()
+            constants.byteswap()
+        return cls(code, constants, slots)
+
+def wrap(value: int) -> int:
+    """`value` as a 64 bit two's complement integer."""
+    return ((value + 2**63) & (2**64 - 1)) - 2**63
+
+def divide(a: int, b: int) -> int:
+    """`a / b` rounded towards zero, as idivq does, wrapped to 64 bits."""
+    if b == 0:
+        raise ZeroDivisionError("Division by zero.")
+    quotient = abs(a) // abs(b)
+    return wrap(-quotient if (a < 0) != (b < 0) else quotient)
+
+def modulo(a: int, b: int) -> int:
+    """The remainder of `divide`, which has the sign of `a`."""
+    return wrap(a - b * divide(a, b))
+
+def compile_program(root: ast.Expression, resolution: Optional[Resolution] = None) -> Program:
+    """Compiles a type checked tree to bytecode. Like the executables made
+    from compiler.ir_generator, the program prints its value at the end if
+    it is an Int or a Bool. `resolution` is what `resolve(root)` gave, when
+    the caller has already resolved it."""
+    if resolution is None:
+        resolution = resolve(root)
+    code = array('q')
+    constants = array('q')
+    constant_indices: dict[int, int] = {}
+    # Slots of the block variables, indexed by binding, and of the other
+    # variables, by name.
+    binding_slots: list[Optional[int]] = [None] * resolution.count
+    free_slots: dict[str, int] = {}
+    slots = 0
+    # Number of values on the stack where the next instruction runs.
+    depth = 0
+    # For each enclosing loop: where it starts, the stack depth there, and
+    # the jumps to patch with its end.
+    loops: list[tuple[int, int, list[int]]] = []
+    # The expression being compiled as a statement, whose value is not
+    # used. Visits that don't leave a value for it return True.
+    discarded: Optional[ast.Expression] = None
+
+    def emit(op: Op, *operands: int) -> int:
+        nonlocal depth
+        code.append(op)
+        code.extend(operands)
+        match op:
+            case Op.CONST | Op.LOAD | Op.DUP:
+                depth += 1
+            case Op.CALL:
+                depth += 1 - operands[1]
+            case Op.STORE | Op.POP | Op.JUMP_IF_FALSE | Op.JUMP_IF_FALSE_OR_POP | Op.JUMP_IF_TRUE_OR_POP:
+                depth -= 1
+            case _ if Op.ADD <= op <= Op.GE and operands[0] == STACK:
+                depth -= 1
+        return len(code)
+
+    def patch(end: int) -> None:
+        """Points the jump ending at `end` to the next instruction."""
+        code[end - 1] = len(code) - end
+
+    def jump_back(start: int) -> None:
+        code.extend((Op.JUMP, 0))
+        code[-1] = start - len(code)
+
+    def constant_index(value: int) -> int:
+        value = wrap(value)
+        if value not in constant_indices:
+            constant_indices[value] = len(constants)
+            constants.append(value)
+        return constant_indices[value]
+
+    def constant(value: int) -> None:
+        emit(Op.CONST, constant_index(value))
+
+    def statement(node: ast.Expression) -> Visit[None]:
+        nonlocal discarded
+        discarded = node
+        if not (yield node):
+            emit(Op.POP)
+
+    def new_slot() -> int:
+        nonlocal slots
+        slots += 1
+        return slots - 1
+
+    def declare(variable: ast.Identifier) -> int:
+        if variable.binding == FREE:
+            if variable.name not in free_slots:
+                free_slots[variable.name] = new_slot()
+            return free_slots[variable.name]
+        slot = binding_slots[variable.binding] = new_slot()
+        return slot
+
+    def slot_of(variable: ast.Identifier) -> int:
+        binding = variable.binding
+        while binding != FREE:
+            slot = binding_slots[binding]
+            if slot is not None:
+                return slot
+            # The initializer of `var x = ...` is compiled before the
+            # declaration, and reads the x it shadows.
+            binding = resolution.shadows[binding]
+        if variable.name not in free_slots:
+            raise Exception(f"{variable.location}: Variable '{variable.name}' is not declared.")
+        return free_slots[variable.name]
+
+    def jump_out(node: ast.Expression, to_start: bool) -> None:
+        nonlocal depth
+        if not loops:
+            raise Exception(f"{node.location}: {node} outside loop.")
+        start, loop_depth, ends = loops[-1]
+        if depth > loop_depth:
+            code.extend((Op.POP_N, depth - loop_depth))
+        if to_start:
+            jump_back(start)
+        else:
+            ends.append(emit(Op.JUMP, 0))
+        # The code after the jump is not run. It is compiled as if the
+        # jump left a value, like other expressions.
+        depth += 1
+
+    def compile_literal(node: ast.Literal) -> None:
+        constant(int(node.value or 0))
+
+    def compile_identifier(node: ast.Identifier) -> None:
+        emit(Op.LOAD, slot_of(node))
+
+    def compile_declaration(node: ast.VariableDeclaration) -> bool:
+        declare(node.variable)
+        if node is discarded:
+            return True
+        constant(0)
+        return False
+
+    def compile_break(node: ast.Break) -> None:
+        jump_out(node, False)
+
+    def compile_continue(node: ast.Continue) -> None:
+        jump_out(node, True)
+
+    def compile_binary_op(node: ast.BinaryOp) -> Visit[bool]:
+        is_statement = node is discarded
+        if node.op == '=':
+            yield node.right
+            if isinstance(node.left, ast.VariableDeclaration):
+                emit(Op.STORE, declare(node.left.variable))
+                if is_statement:
+                    return True
+                constant(0)
+            elif isinstance(node.left, ast.Identifier):
+                if not is_statement:
+                    emit(Op.DUP)
+                emit(Op.STORE, slot_of(node.left))
+                return is_statement
+            else:
+                raise Exception(f"{node.location}: can't assign to {node.left}.")
+        elif node.op in ('and', 'or'):
+            yield node.left
+            jump = Op.JUMP_IF_FALSE_OR_POP if node.op == 'and' else Op.JUMP_IF_TRUE_OR_POP
+            end = emit(jump, 0)
+            yield node.right
+            patch(end)
+        else:
+            yield node.left
+            right = node.right
+            if isinstance(right, ast.Literal):
+                emit(binary_ops[node.op], constant_index(int(right.value or 0)))
+            elif isinstance(right, ast.Identifier):
+                emit(binary_ops[node.op], -2 - slot_of(right))
+            else:
+                yield right
+                emit(binary_ops[node.op], STACK)
+        return False
+
+    def compile_unary_op(node: ast.UnaryOp) -> Visit[None]:
+        yield node.right
+        emit(unary_ops[node.op])
+
+    def compile_conditional(node: ast.Conditional) -> Visit[bool]:
+        nonlocal depth
+        is_statement = node is discarded
+        if node.op == 'while':
+            start = len(code)
+            loop_depth = depth
+            yield node.condition
+            exit = emit(Op.JUMP_IF_FALSE, 0)
+            loops.append((start, loop_depth, [exit]))
+            yield from statement(node.first)
+            jump_back(start)
+            for end in loops.pop()[2]:
+                patch(end)
+            depth = loop_depth
+            if is_statement:
+                return True
+            constant(0)
+        elif node.second is None:
+            yield node.condition
+            end = emit(Op.JUMP_IF_FALSE, 0)
+            yield from statement(node.first)
+            patch(end)
+            if is_statement:
+                return True
+            constant(0)
+        else:
+            yield node.condition
+            otherwise = emit(Op.JUMP_IF_FALSE, 0)
+            yield node.first
+            end = emit(Op.JUMP, 0)
+            patch(otherwise)
+            depth -= 1
+            yield node.second
+            patch(end)
+        return False
+
+    def compile_function_call(node: ast.FunctionCall) -> Visit[None]:
+        if node.function.name not in builtins:
+            raise Exception(f"{node.location}: unknown function '{node.function.name}'.")
+        for param in node.parameters:
+            yield param
+        emit(Op.CALL, builtins.index(node.function.name), len(node.parameters))
+
+    def compile_block(node: ast.Block) -> Visit[bool]:
+        is_statement = node is discarded
+        for expression in node.expressions:
+            yield from statement(expression)
+        if is_statement:
+            yield from statement(node.result)
+            return True
+        yield node.result
+        return False
+
+    def compile_unknown(node: ast.Expression) -> None:
+        raise Exception(f"{node.location}: unknown expression.")
+
+    compilers = ast.Dispatch[Callable[..., Visit[bool] | Visit[None] | bool | None]]({
+        ast.Literal: compile_literal,
+        ast.Identifier: compile_identifier,
+        ast.VariableDeclaration: compile_declaration,
+        ast.Break: compile_break,
+        ast.Continue: compile_continue,
+        ast.BinaryOp: compile_binary_op,
+        ast.UnaryOp: compile_unary_op,
+        ast.Conditional: compile_conditional,
+        ast.FunctionCall: compile_function_call,
+        ast.Block: compile_block,
+    }, compile_unknown)
+
+    traverse(root, lambda node: compilers[type(node)](node))
+    result_type = value_type(root)
+    if result_type is Int:
+        emit(Op.CALL, builtins.index('print_int'), 1)
+    elif result_type is Bool:
+        emit(Op.CALL, builtins.index('print_bool'), 1)
+    emit(Op.HALT)
+    return Program(code, constants, slots)
+
+def value_type(node: ast.Expression) -> Type:
+    """The type of the value `node` leaves on the stack. Declarations and
+    conditionals without an else branch leave Unit, whatever their type."""
+    while isinstance(node, ast.Block):
+        node = node.result
+    match node:
+        case ast.BinaryOp(op='=', left=ast.VariableDeclaration()):
+            return Unit
+        case ast.Conditional(op='if', second=None) | ast.Conditional(op='while'):
+            return Unit
+    return node.type
+
+def disassemble(program: Program) -> list[str]:
+    """The instructions of `program`, one per line, like `12: JUMP -8`."""
+    lines = []
+    pc = 0
+    while pc < len(program.code):
+        op = Op(program.code[pc])
+        operands = program.code[pc + 1:pc + 1 + operand_counts[op]]
+        lines.append(f"{pc}: {' '.join([op.name, *map(str, operands)])}")
+        pc += 1 + len(operands)
+    return lines
+
+def read_int(stdin: TextIO) -> int:
+    """Reads a line like the read_int of compiler.assembler: digits are
+    read, other characters skipped and each '-' negates the number."""
+    line = stdin.readline()
+    if not line:
+        raise Exception("read_int: no input.")
+    value = 0
+    negative = False
+    for char in line.rstrip('\n'):
+        if char == '-':
+            negative = not negative
+        elif '0' <= char <= '9':
+            value = value * 10 + ord(char) - 48
+    return wrap(-value if negative else value)
+
+def run(program: Program, stdin: TextIO = sys.stdin, stdout: TextIO = sys.stdout) -> None:
+    """Runs `program`. The output is written to `stdout` when the program
+    ends or fails."""
+    code = program.code.tolist()
+    constants = program.constants.tolist()
+    slots: list[int] = [0] * program.slots
+    stack: list[int] = []
+    push, pop = stack.append, stack.pop
+    output: list[str] = []
+    low, high = -2**63, 2**63
+    # The instructions as plain ints, which compare faster than Op members.
+    (CONST, LOAD, STORE, DUP, POP, POP_N, ADD, SUB, MUL, DIV, MOD, EQ, NE, LT, LE, GT, GE,
+     NEG, NOT, JUMP, JUMP_IF_FALSE, JUMP_IF_FALSE_OR_POP, JUMP_IF_TRUE_OR_POP, CALL, HALT) = range(len(Op))
+    pc = 0
+    try:
+        while True:
+            op = code[pc]
+            if op == LOAD:
+                push(slots[code[pc + 1]])
+                pc += 2
+            elif op == CONST:
+                push(constants[code[pc + 1]])
+                pc += 2
+            elif op == STORE:
+                slots[code[pc + 1]] = pop()
+                pc += 2
+            elif op == JUMP_IF_FALSE:
+                pc += 2 if pop() else 2 + code[pc + 1]
+            elif op == JUMP:
+                pc += 2 + code[pc + 1]
+            elif op == POP:
+                pop()
+                pc += 1
+            elif ADD <= op <= MOD:
+                right = code[pc + 1]
+                if right == -1:
+                    b = pop()
+                elif right >= 0:
+                    b = constants[right]
+                else:
+                    b = slots[-2 - right]
+                a = stack[-1]
+                if op == ADD:
+                    value = a + b
+                elif op == SUB:
+                    value = a - b
+                elif op == MUL:
+                    value = a * b
+                else:
+                    if b == 0:
+                        raise Exception("Division by zero.")
+                    # Rounded towards zero, as idivq does.
+                    value = abs(a) // abs(b)
+                    if (a < 0) != (b < 0):
+                        value = -value
+                    if op == MOD:
+                        value = a - b * value
+                if not low <= value < high:
+                    value = wrap(value)
+                stack[-1] = value
+                pc += 2
+            elif EQ <= op <= GE:
+                right = code[pc + 1]
+                if right == -1:
+                    b = pop()
+                elif right >= 0:
+                    b = constants[right]
+                else:
+                    b = slots[-2 - right]
+                a = stack[-1]
+                if op == LT:
+                    stack[-1] = a < b
+                elif op == EQ:
+                    stack[-1] = a == b
+                elif op == NE:
+                    stack[-1] = a != b
+                elif op == LE:
+                    stack[-1] = a <= b
+                elif op == GT:
+                    stack[-1] = a > b
+                else:
+                    stack[-1] = a >= b
+                pc += 2
+            elif op == DUP:
+                push(stack[-1])
+                pc += 1
+            elif op == NOT:
+                stack[-1] = not stack[-1]
+                pc += 1
+            elif op == NEG:
+                stack[-1] = wrap(-stack[-1])
+                pc += 1
+            elif op == JUMP_IF_FALSE_OR_POP:
+                if stack[-1]:
+                    pop()
+                    pc += 2
+                else:
+                    pc += 2 + code[pc + 1]
+            elif op == JUMP_IF_TRUE_OR_POP:
+                if stack[-1]:
+                    pc += 2 + code[pc + 1]
+                else:
+                    pop()
+                    pc += 2
+            elif op == POP_N:
+                del stack[len(stack) - code[pc + 1]:]
+                pc += 2
+            elif op == CALL:
+                builtin = code[pc + 1]
+                if builtin == 0:
+                    output.append(f"{stack[-1]}\n")
+                    stack[-1] = 0
+                elif builtin == 1:
+                    output.append("true\n" if stack[-1] else "false\n")
+                    stack[-1] = 0
+                else:
+                    push(read_int(stdin))
+                pc += 3
+            elif op == HALT:
+                return
+            else:
+                raise Exception(f"Unknown instruction {op} at {pc}.")
+    finally:
+        stdout.write("".join(output))
@@ -0,0 +1,67 @@
+from compiler.arena import Arena, NodeKind, parse_arena
+from compiler.interpreter import interpret
+from compiler.ir import IRVar
+from compiler.ir_generator import generate_ir
+from compiler.parser import parse
+from compiler.tokenizer import L, Token, tokenize, tokenize_buffer
+from compiler.type_checker import typecheck
+from compiler.types import Bool, Int, Type, Unit
+import compiler.ast as ast
+
+program = """
+var x: Int = 1;
+var done = false;
+while not done do {
+    x = x * 2;
+    if x > 100 or x == 64 then { done = true; } else { x = x + 1; };
+}
+if done and x != 0 then -x else 123456789012345678901234567890
+"""
+
+def test_arena_round_trip() -> None:
+    tokens = tokenize_buffer(program, "file")
+    arena, root = parse_arena(tokens)
+    expected = parse(tokens)
+    assert arena.to_ast(root) == expected
+    copy, copy_root = Arena.from_ast(expected)
+    assert copy.to_ast(copy_root) == expected
+    assert arena.kind(root) == NodeKind.BLOCK
+    assert str(arena.location(root)) == "file:7:0"
+
+def test_arena_keeps_explicit_locations() -> None:
+    arena, root = parse_arena([Token("a", "identifier", L), Token("+", "operator", L), Token("1", "int_literal", L)])
+    assert arena.to_ast(root) == ast.BinaryOp(L, ast.Identifier(L, "a"), "+", ast.Literal(L, 1))
+    assert arena.sources == [L, L, L]
+
+def test_arena_views_match_dataclasses() -> None:
+    tokens = tokenize_buffer(program)
+    arena, root = parse_arena(tokens)
+    view = arena.view(root)
+    expected = parse(tokens)
+    assert isinstance(view, ast.Block)
+    assert view is arena.view(root)
+    assert view.result is view.result
+    assert str(view) == str(expected)
+    assert interpret(view) == interpret(expected)
+
+def test_arena_typecheck_and_generate_ir() -> None:
+    arena, root = parse_arena(tokenize(program))
+    expected = parse(tokenize(program))
+    assert typecheck(arena.view(root)) == typecheck(expected) == Int
+    assert arena.to_ast(root) == expected
+    root_types: dict[IRVar, Type] = {IRVar(name): Int for name in ['*', '+', 'unary_-']}
+    root_types |= {IRVar(name): Bool for name in ['or', 'and', '==', '!=', '>', 'unary_not']}
+    root_types |= {IRVar('print_int'): Unit, IRVar('print_bool'): Unit}
+    assert generate_ir(root_types, arena.view(root)) == generate_ir(root_types, expected)
+
+def test_arena_views_write_types_and_bindings() -> None:
+    arena, root = parse_arena(tokenize("{ var x = 1; x }"))
+    view = arena.view(root)
+    assert isinstance(view, ast.Block) and isinstance(view.result, ast.Identifier)
+    assert view.type == Unit
+    view.type = Int
+    assert arena.type(root) == Int
+    arena.set_type(root, Bool)
+    assert view.type == Bool
+    view.result.binding = 3
+    assert arena.binding(arena.node_items(root)[-1]) == 3
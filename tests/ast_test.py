@@ -0,0 +1,17 @@
+from typing import Callable
+from compiler.tokenizer import L
+import compiler.ast as ast
+
+def test_dispatch_uses_nearest_base_class_handler() -> None:
+    class LiteralView(ast.Literal):
+        pass
+
+    handlers = ast.Dispatch[Callable[[ast.Expression], str]]({
+        ast.Expression: lambda node: "expression",
+        ast.Literal: lambda node: "literal",
+    }, lambda node: "default")
+    assert handlers[type(ast.Literal(L, 1))](ast.Literal(L, 1)) == "literal"
+    assert handlers[LiteralView](LiteralView(L, 1)) == "literal"
+    assert LiteralView in handlers
+    assert handlers[ast.Identifier](ast.Identifier(L, "a")) == "expression"
+    assert ast.Dispatch[str]({}, "default")[ast.Break] == "default"
@@ -0,0 +1,51 @@
+import io
+import pytest
+from compiler.parser import parse
+from compiler.tokenizer import tokenize
+from compiler.type_checker import typecheck
+from compiler import vm
+
+pytest.importorskip("numpy")
+from compiler.batch import Lane, run_batch
+
+def check(source: str, inputs: list[list[int]]) -> list[Lane]:
+    """Runs `source` in a batch and checks it against the VM."""
+    tree = parse(tokenize(source))
+    typecheck(tree)
+    lanes = run_batch(tree, inputs)
+    program = vm.compile_program(tree)
+    for row, lane in zip(inputs, lanes):
+        output = io.StringIO()
+        error = None
+        try:
+            vm.run(program, io.StringIO("".join(f"{value}\n" for value in row)), output)
+        except Exception as e:
+            error = e.args[0]
+        assert (lane.output, lane.error) == (output.getvalue(), error)
+    return lanes
+
+def test_batch_loops() -> None:
+    source = """
+        var n = read_int();
+        var s = 0;
+        while true do {
+            var x = read_int();
+            if x == 0 then break;
+            if x < 0 then continue;
+            s = s + 100 / x;
+            n = n - 1;
+            if n == 0 then { print_bool(s > 50); break }
+        };
+        s
+    """
+    lanes = check(source, [[2, 1, -3, 4, 9], [5, 0], [1, -1, -1, 3], [3, 2, 0], [1, -5]])
+    assert lanes[0] == Lane("true\n125\n")
+    assert lanes[1] == Lane("0\n")
+    assert lanes[4] == Lane("", "read_int: no input.")
+
+def test_batch_errors_stop_lanes() -> None:
+    lanes = check("var x = read_int(); print_int(-7 % x); print_int(9223372036854775807 + x); 1 / (x - 2)", [[2], [-2], [3]])
+    assert [lane.error for lane in lanes] == ["Division by zero.", None, None]
+    tree = parse(tokenize("var i = read_int(); while i > 0 do i = i + 1"))
+    typecheck(tree)
+    assert run_batch(tree, [[0], [1]], max_iterations=100) == [Lane(""), Lane("", "Too many loop iterations.")]
@@ -0,0 +1,85 @@
+import pytest
+from compiler.incremental import Edit, reparse
+from compiler.parser import parse
+from compiler.tokenizer import tokenize_buffer
+import compiler.ast as ast
+
+def apply(source_code: str, *edits: Edit) -> tuple[str, ast.Expression]:
+    """Reparses source_code after each edit and checks the result against a full parse."""
+    tokens = tokenize_buffer(source_code, "file")
+    tree = parse(tokens)
+    for edit in edits:
+        source_code = source_code[:edit.start] + edit.text + source_code[edit.end:]
+        tree, tokens = reparse(tree, tokens, edit)
+        expected = tokenize_buffer(source_code, "file")
+        assert list(tokens) == list(expected)
+        assert tree == parse(expected)
+    return source_code, tree
+
+def test_reparse_reuses_untouched_statements() -> None:
+    source_code = "var a = 1;\n{ f(a); a = a + 2 }\nwhile a > 0 do { a = a - 1 }"
+    tokens = tokenize_buffer(source_code)
+    tree = parse(tokens)
+    assert isinstance(tree, ast.Block)
+    offset = source_code.index("2")
+    new_tree, _ = reparse(tree, tokens, Edit(offset, offset + 1, "30"))
+    assert isinstance(new_tree, ast.Block)
+    assert new_tree.expressions[0] is tree.expressions[0]
+    assert new_tree.result is tree.result
+    inner = new_tree.expressions[1]
+    assert isinstance(inner, ast.Block)
+    assert inner.expressions[0] is tree.expressions[1].expressions[0] # type: ignore[attr-defined]
+    assert str(inner.result) == "a = a + 30"
+
+def test_reparse_matches_full_parse() -> None:
+    source_code = "var x = 1; { x = x + 1; f(x) } if x then { x } else { 0 }"
+    apply(source_code, Edit(0, 0, "var y = 2;\n"))
+    apply(source_code, Edit(source_code.index("f(x)"), source_code.index("f(x)") + 4, "g(x, 2);"))
+    apply(source_code, Edit(source_code.index(";"), source_code.index(";") + 1, "; x;"))
+    apply(source_code, Edit(source_code.index("{"), source_code.index("{") + 1, "/* { */ {"))
+    apply(source_code, Edit(len(source_code), len(source_code), "; x"))
+
+def test_reparse_sequence_of_keystrokes() -> None:
+    source_code, tree = apply("a; {\n  b\n}; c", *[Edit(8 + n, 8 + n, char) for n, char in enumerate(" + 1;\nd")])
+    assert source_code == "a; {\n  b + 1;\nd\n}; c"
+    assert str(tree) == "{ a; { b + 1; d }; c }"
+
+def test_reparse_moves_locations_after_the_edit() -> None:
+    source_code = "a;\nb;\nc"
+    tokens = tokenize_buffer(source_code, "file")
+    tree = parse(tokens)
+    tree, tokens = reparse(tree, tokens, Edit(0, 0, "x = 1;\n"))
+    assert isinstance(tree, ast.Block)
+    assert [str(expr.location) for expr in tree.expressions] == ["file:0:2", "file:1:0", "file:2:0"]
+    assert str(tree.result.location) == "file:3:0"
+
+def test_reparse_whitespace_edit_keeps_tree() -> None:
+    source_code = "a; b # comment"
+    tokens = tokenize_buffer(source_code)
+    tree = parse(tokens)
+    new_tree, _ = reparse(tree, tokens, Edit(3, 3, "\n\n  "))
+    assert new_tree is tree
+
+def test_reparse_reports_errors_like_full_parse() -> None:
+    source_code = "a; { b; c }"
+    tokens = tokenize_buffer(source_code, "file")
+    tree = parse(tokens)
+    with pytest.raises(Exception) as e:
+        reparse(tree, tokens, Edit(source_code.index("c"), source_code.index("c"), ";"))
+    assert e.value.args[0] == 'file:0:8: expected "(", an integer literal or an identifier'
+
+def test_reparse_edits_long_files_in_place() -> None:
+    source_code = "x = 1;\n" * 5000 + "x"
+    tokens = tokenize_buffer(source_code, "file")
+    tree = parse(tokens)
+    assert isinstance(tree, ast.Block)
+    first = tree.expressions[0]
+    offset = source_code.index("x", len(source_code) // 2)
+    for n, char in enumerate("y;\n"):
+        new_tree, new_tokens = reparse(tree, tokens, Edit(offset + n, offset + n, char))
+        assert new_tree is tree and new_tokens is tokens
+    source_code = source_code[:offset] + "y;\n" + source_code[offset:]
+    assert str(tree) == str(parse(tokenize_buffer(source_code)))
+    assert tree.expressions[0] is first
+    assert str(first.location) == "file:0:2"
+    assert str(tree.result.location) == "file:5001:0"
@@ -1,6 +1,9 @@
 import pytest
-from compiler.interpreter import interpret, SymTab
-from compiler.tokenizer import L
+from compiler.interpreter import compile_closures, interpret, OutOfFuel, Profile, SymTab, Value
+from compiler.traversal import Visit
+from compiler.parser import parse
+from compiler.type_checker import typecheck
+from compiler.tokenizer import L, tokenize
 import compiler.ast as ast
 
 def test_interpreter_int_addition() -> None:
@@ -327,4 +330,139 @@ def test_interpreter_conditional_while() -> None:
     assert(sym_tab.read('b')) == 32
 
 def test_interpreter_unit() -> None:
-    assert(interpret(ast.Identifier(L, "unit"))) == None
\ No newline at end of file
+    assert(interpret(ast.Identifier(L, "unit"))) == None
+
+def test_interpreter_closures_match_visits() -> None:
+    tree = parse(tokenize("var s = 0; { var i = 0; while i < 10 do { var i2 = i * i; if i2 % 2 == 0 and not (i == 4) then s = s + i2; i = i + 1 } }; s"))
+    assert interpret(tree, closures=False) == interpret(tree, closures=True) == 104
+    tree = parse(tokenize("{ var a = 1; a + (unit + a) }"))
+    with pytest.raises(Exception) as visited:
+        interpret(tree, closures=False)
+    with pytest.raises(Exception) as compiled:
+        interpret(tree, closures=True)
+    assert compiled.value.args == visited.value.args
+
+def test_interpreter_closures_fall_back_on_deep_trees() -> None:
+    sym_tab = SymTab()
+    sym_tab.initialize_top()
+    tree = parse(tokenize("1" + " + 1" * 100))
+    assert compile_closures(tree, sym_tab, 50) is None
+    assert compile_closures(tree, sym_tab, 101) is not None
+    assert interpret(parse(tokenize("1" + " + 1" * 5000))) == 5001
+
+def test_interpreter_calls_replaced_operators() -> None:
+    def subtract(a: ast.Expression, b: ast.Expression, sym_tab: SymTab) -> Visit[Value]:
+        left = yield a
+        right = yield b
+        assert isinstance(left, int) and isinstance(right, int)
+        return left - right
+    for closures in (False, True):
+        sym_tab = SymTab()
+        sym_tab.initialize_top()
+        sym_tab.assign('+', subtract)
+        assert interpret(parse(tokenize("{ var x = 5; x + 2 * 3 }")), sym_tab, closures) == -1
+        del sym_tab.stacks['-']
+        with pytest.raises(Exception, match="Function '-' is not declared"):
+            interpret(parse(tokenize("1 - 2")), sym_tab, closures)
+
+def test_interpreter_transpiled() -> None:
+    source = "var s = 0; { var i = 0; while true do { i = i + 1; if i % 3 == 0 then continue; if i > 10 then break; s = s + i * -i / 2 } }; s"
+    tree = parse(tokenize(source))
+    typecheck(tree)
+    assert interpret(tree, transpile=True) == -128
+    tree = parse(tokenize("{ var x = 9223372036854775807; x + 1 }"))
+    typecheck(tree)
+    assert interpret(tree, transpile=True) == -9223372036854775808
+    tree = parse(tokenize("{ var a = 1; a + (unit + a) }"))
+    with pytest.raises(Exception) as transpiled:
+        interpret(tree, transpile=True)
+    with pytest.raises(Exception) as compiled:
+        interpret(tree)
+    assert transpiled.value.args == compiled.value.args
+    sym_tab = SymTab()
+    sym_tab.initialize_top()
+    sym_tab.declare('x')
+    sym_tab.assign('x', 2)
+    tree = parse(tokenize("{ x = x * 3; x / 0 }"))
+    with pytest.raises(Exception, match="Division by zero"):
+        interpret(tree, sym_tab, transpile=True)
+    assert sym_tab.stacks['x'] == [6]
+    nested = "while false do " * 120 + "1"
+    assert interpret(parse(tokenize(nested)), transpile=True) is None
+
+def test_interpreter_transpiled_same_as_closures() -> None:
+    # The type checker types an assignment as its value, but it evaluates
+    # to None, which == and != don't accept.
+    for source in [
+        "var x = 1; (x = 0) != 5",
+        "var x = 1; var y = (x = 2); y == 2",
+        "{ var a = 1; var b = a; var c = 0; while c < 2 do { c = c + 1; a == b; b = (a = 3) } }",
+        "var x = 1; var y = if x > 0 then x = 2 else x = 3; y == 2",
+        "var x = true; (true and (x = false)) == x",
+        "{ var x = x == 1; x }",
+        "var x = 1; { var y = 2; y = x + (x = 5) * y; y + x }",
+        "var x = 1; var y = x < (x = 3); y",
+        "{ var s = 0; var i = 0; while i < 10 do { i = i + 1; s = s + i }; s == 55 }",
+    ]:
+        results = []
+        for transpile in (True, False):
+            tree = parse(tokenize(source))
+            typecheck(tree)
+            sym_tab = SymTab()
+            sym_tab.initialize_top()
+            try:
+                results.append((repr(interpret(tree, sym_tab, transpile=transpile)), sym_tab.stacks.get('x')))
+            except Exception as e:
+                results.append((str(e), sym_tab.stacks.get('x')))
+        assert results[0] == results[1], source
+
+def test_interpreter_break_and_continue() -> None:
+    source = "{ var s = 0; var i = 0; while true do { i = i + 1; if i % 2 == 0 then continue; if i > 7 then { break }; s = s + i }; s }"
+    profiles = []
+    for closures in (True, False):
+        assert interpret(parse(tokenize(source)), closures=closures) == 16
+        with pytest.raises(Exception, match=r":0:0: break outside loop\."):
+            interpret(parse(tokenize("break")), closures=closures)
+        profile = Profile()
+        interpret(parse(tokenize(source)), closures=closures, profile=profile)
+        profiles.append((profile.counts, profile.collapsed()))
+    assert profiles[0] == profiles[1]
+    # When the transpiled code raises, the engines run the loop again.
+    tree = parse(tokenize("var i = 0; while true do { i = i + 1; if i == 3 then break; }; i / 0"))
+    typecheck(tree)
+    with pytest.raises(Exception, match=r":0:65 Division by zero\."):
+        interpret(tree, transpile=True)
+
+def test_interpreter_wraps_like_transpiled() -> None:
+    for source, expected in [
+        ("9223372036854775807 + 1", -9223372036854775808),
+        ("-9223372036854775807 - 2", 9223372036854775807),
+        ("4294967296 * 4294967296 + 3", 3),
+        ("{ var x = -9223372036854775807 - 1; -x }", -9223372036854775808),
+        ("10000000000000000000 / 3", -2815581357903183872),
+        ("9223372036854775807 / 2", 4611686018427387903),
+        ("-7 / 2", -3),
+        ("10000000000000000000 == -8446744073709551616", True),
+    ]:
+        results = []
+        for transpile in (True, False):
+            for closures in (True, False):
+                tree = parse(tokenize(source))
+                typecheck(tree)
+                results.append(interpret(tree, closures=closures, transpile=transpile))
+        assert results == [expected] * 4, source
+
+def test_interpreter_fuel_and_profile() -> None:
+    for closures in (True, False):
+        with pytest.raises(OutOfFuel, match=r"Out of fuel after 100 steps\."):
+            interpret(parse(tokenize("{ var x = 0; while true do { x = x + 1 } }")), closures=closures, fuel=100)
+    source = "{ var s = 0; var i = 0; while i < 10 do { i = i + 1; s = s + i }; s }"
+    profiles = []
+    for closures in (True, False):
+        profile = Profile()
+        assert interpret(parse(tokenize(source)), closures=closures, fuel=1000, profile=profile) == 55
+        profiles.append((profile.counts, profile.collapsed()))
+    assert profiles[0] == profiles[1]
+    counts, collapsed = profiles[0]
+    assert profile.report(1).split() == ["11", f"{100 * 11 / counts.total():.2f}%", ":0:32", "<"]
+    assert collapsed.splitlines()[6:9] == ["while :0:24 1", "while :0:24;< :0:32 11", "while :0:24;< :0:32;i :0:30 11"]
@@ -0,0 +1,61 @@
+import pytest
+from compiler.__main__ import call_compiler
+from compiler.ir import IRVar
+from compiler.ir_generator import generate_ir
+from compiler.parser import parse
+from compiler.tokenizer import tokenize
+from compiler.type_checker import typecheck
+from compiler.types import Bool, Int, Type, Unit
+
+root_types: dict[IRVar, Type] = {IRVar(name): Int for name in ['+', '-', '*', '/', '%', 'unary_-', 'read_int']}
+root_types |= {IRVar(name): Bool for name in ['and', 'or', '==', '!=', '<', '<=', '>', '>=', 'unary_not']}
+root_types |= {IRVar('print_int'): Unit, IRVar('print_bool'): Unit}
+
+def two_pass(source: str) -> list[str]:
+    tree = parse(tokenize(source))
+    typecheck(tree)
+    return [str(i) for i in generate_ir(root_types, tree)]
+
+def fused(source: str) -> list[str]:
+    return [str(i) for i in generate_ir(root_types, parse(tokenize(source)), typecheck=True)]
+
+def test_fused_pass_generates_same_ir() -> None:
+    for source in [
+        "var a = 1; { var a: Int = a + 1; print_int(a) }",
+        "var x: Int = read_int(); if x > 1 and not (x == 3) then x else -x",
+        "{ var n = 10; while n > 0 do { n = n - 1; if n == 5 then break else continue }; n % 2 == 0 or false }",
+        "var b: Bool = true; b = if b then false else true",
+    ]:
+        assert fused(source) == two_pass(source)
+
+def test_fused_pass_sets_types() -> None:
+    tree = parse(tokenize("{ var a = 1 < 2; a }"))
+    generate_ir(root_types, tree, typecheck=True)
+    assert tree.type == Bool
+
+def test_fused_pass_gives_same_errors() -> None:
+    for source in [
+        "var a: Int = true",
+        "if 1 then 2",
+        "break; 1 + true",
+        "{ var a = 1; var a = 2; a + true }",
+        "{ var a = 1; var a = 2 }",
+        "continue",
+        "print_int(1, 2)",
+    ]:
+        with pytest.raises(Exception) as two_pass_error:
+            two_pass(source)
+        with pytest.raises(Exception) as fused_error:
+            fused(source)
+        assert fused_error.value.args == two_pass_error.value.args
+
+def test_compiler_gives_same_errors_fused() -> None:
+    for source in ["1 + true", "var a: Int = true; if 1 then a", "{ var a = 1; var a = 2 }", "continue"]:
+        with pytest.raises(Exception) as two_pass_error:
+            call_compiler(source, "t")
+        with pytest.raises(Exception) as fused_error:
+            call_compiler(source, "t", fused=True)
+        assert type(fused_error.value) is type(two_pass_error.value)
+        assert fused_error.value.args == two_pass_error.value.args
+    with pytest.raises(Exception, match="^t:0:2: Unsupported type 'Bool' right of"):
+        call_compiler("1 + true", "t", fused=True)
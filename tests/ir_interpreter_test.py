@@ -0,0 +1,45 @@
+import io
+import pytest
+from compiler.ir_generator import generate_ir
+from compiler.ir_interpreter import run
+from compiler.parser import parse
+from compiler.tokenizer import L, tokenize
+from compiler.type_checker import typecheck
+from compiler import ir
+from tests.ir_generator_test import root_types
+
+def run_source(source: str, stdin: str = "") -> tuple[str, int]:
+    tree = parse(tokenize(source))
+    typecheck(tree)
+    output = io.StringIO()
+    counts = run(generate_ir(root_types, tree), io.StringIO(stdin), output)
+    return output.getvalue(), counts.total()
+
+def test_ir_interpreter_output() -> None:
+    source = """
+        var n = read_int();
+        var i = 0;
+        while i < n do {
+            if i % 2 == 0 or i == 3 then print_int(-i / 2);
+            i = i + 1
+        };
+        not (i == n) and true
+    """
+    assert run_source(source, "5\n")[0] == "0\n-1\n-1\n-2\nfalse\n"
+    assert run_source("var x = 9223372036854775807; x * 2")[0] == "-2\n"
+    with pytest.raises(Exception, match="Division by zero"):
+        run_source("var x = 0; 1 % x")
+
+def test_ir_interpreter_counts_instructions() -> None:
+    output, executed = run_source("var i = 0; while i < 10 do i = i + 1")
+    assert output == ""
+    longer = run_source("var i = 0; while i < 20 do i = i + 1")[1]
+    # Each iteration runs the same instructions.
+    assert longer - executed == executed - run_source("var i = 0; while i < 0 do i = i + 1")[1]
+    counts = run([
+        ir.LoadIntConst(L, 1, ir.IRVar('x')),
+        ir.Jump(L, ir.Label(L, 'end')),
+        ir.Call(L, ir.IRVar('print_int'), [ir.IRVar('x')], ir.IRVar('y')),
+        ir.Label(L, 'end'),
+    ], io.StringIO(), io.StringIO())
+    assert counts == {'LoadIntConst': 1, 'Jump': 1}
@@ -0,0 +1,69 @@
+import io
+import platform
+import sys
+import pytest
+from compiler.__main__ import call_bytecode_compiler, call_native_compiler
+from compiler.native import encode
+from compiler import vm
+
+pytestmark = pytest.mark.skipif(
+    platform.machine().lower() not in ('x86_64', 'amd64') or sys.platform == 'win32',
+    reason="native execution needs x86-64")
+
+def run(source: str, stdin: str = "") -> tuple[str, str | None]:
+    """Runs `source` in process, and checks it against the VM."""
+    results = []
+    program = call_native_compiler(source, "test")
+    try:
+        for execute in (program.run, lambda i, o: vm.run(call_bytecode_compiler(source, "test"), i, o)):
+            output = io.StringIO()
+            error = None
+            try:
+                execute(io.StringIO(stdin), output)
+            except Exception as e:
+                error = e.args[0]
+            results.append((output.getvalue(), error))
+    finally:
+        program.close()
+    assert results[0] == results[1]
+    return results[0]
+
+def test_native_runs_programs() -> None:
+    source = """
+        var n = read_int();
+        var i = 0;
+        var s = 0;
+        while i < n do {
+            i = i + 1;
+            if i % 2 == 0 then continue;
+            s = s + i * i / 3;
+            print_bool(i > 3 and not (i == 5))
+        };
+        s
+    """
+    assert run(source, "7\n") == ("false\nfalse\nfalse\ntrue\n27\n", None)
+    assert run("var x = 9223372036854775807; x + 1") == ("-9223372036854775808\n", None)
+    assert run("var x = -9223372036854775807 - 1; print_int(x / -1); x % -1") == ("-9223372036854775808\n0\n", None)
+    assert run("-7 / 2 + -7 % 2 * 100") == ("-103\n", None)
+    assert run("print_int(1); var x = 0; 1 / x") == ("1\n", "Division by zero.")
+    assert run("print_int(read_int()); read_int()", "-12\n") == ("-12\n", "read_int: no input.")
+
+def test_native_program_runs_again() -> None:
+    program = call_native_compiler("read_int() * 2", "test")
+    for value in range(3):
+        output = io.StringIO()
+        program.run(io.StringIO(f"{value}\n"), output)
+        assert output.getvalue() == f"{value * 2}\n"
+    program.close()
+    with pytest.raises(Exception, match="closed"):
+        program.run()
+
+def test_native_encodes_like_as() -> None:
+    assert encode("movq -8(%rbp), %rax")[0].hex() == "488b45f8"
+    assert encode("addq $1000, -8(%rbp)")[0].hex() == "488145f8e8030000"
+    assert encode("pushq %r9\ncallq *%rax\nsete %al\nret")[0].hex() == "4151ffd00f94c0c3"
+    code, labels = encode("start:\njmp end\nend:\njne start")
+    assert code.hex() == "e9000000000f85f5ffffff"
+    assert labels == {'start': 0, 'end': 5}
+    with pytest.raises(Exception, match="can't encode 'movq -8\\(%rbp\\), -16\\(%rbp\\)'"):
+        encode("movq -8(%rbp), -16(%rbp)")
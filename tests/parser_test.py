@@ -1,6 +1,6 @@
 import pytest
 from compiler.parser import parse
-from compiler.tokenizer import Token, Source, L
+from compiler.tokenizer import Token, Source, L, tokenize
 import compiler.ast as ast
 import compiler.types as types
 
@@ -1556,4 +1556,52 @@ def test_parse_typed_variable_declaration() -> None:
     )
     with pytest.raises(Exception) as e:
         parse(tokens+[Token("foo", "identifier", L)])
-    assert(e.value.args[0]) == f"{L}: Unknown type 'foo'."
\ No newline at end of file
+    assert(e.value.args[0]) == f"{L}: Unknown type 'foo'."
+
+def test_parse_deeply_nested_expressions() -> None:
+    depth = 20_000
+    expr = parse(tokenize("(" * depth + "1" + ")" * depth))
+    assert isinstance(expr, ast.Literal) and expr.value == 1
+
+    expr = parse(tokenize("-" * depth + "1"))
+    for _ in range(depth):
+        assert isinstance(expr, ast.UnaryOp)
+        expr = expr.right
+    assert isinstance(expr, ast.Literal) and expr.value == 1
+
+    expr = parse(tokenize("{" * depth + "a" + "}" * depth))
+    for _ in range(depth):
+        assert isinstance(expr, ast.Block)
+        expr = expr.result
+    assert isinstance(expr, ast.Identifier) and expr.name == "a"
+
+    expr = parse(tokenize("if a then " * depth + "b"))
+    for _ in range(depth):
+        assert isinstance(expr, ast.Conditional)
+        expr = expr.first
+    assert isinstance(expr, ast.Identifier) and expr.name == "b"
+
+def test_parse_long_operator_chains() -> None:
+    expr = parse(tokenize(" + ".join(["a"] * 20_000)))
+    for _ in range(20_000 - 1):
+        assert isinstance(expr, ast.BinaryOp)
+        assert isinstance(expr.right, ast.Identifier)
+        expr = expr.left
+    assert isinstance(expr, ast.Identifier) and expr.name == "a"
+
+    expr = parse(tokenize(" = ".join(["a"] * 20_000)))
+    for _ in range(20_000 - 1):
+        assert isinstance(expr, ast.BinaryOp)
+        assert isinstance(expr.left, ast.Identifier)
+        expr = expr.right
+    assert isinstance(expr, ast.Identifier) and expr.name == "a"
+
+def test_parse_long_blocks_and_argument_lists() -> None:
+    expr = parse(tokenize("{ " + "a; " * 20_000 + "b }"))
+    assert isinstance(expr, ast.Block)
+    assert len(expr.expressions) == 20_000
+    assert isinstance(expr.result, ast.Identifier) and expr.result.name == "b"
+
+    expr = parse(tokenize("f(" + "a, " * 20_000 + "b)"))
+    assert isinstance(expr, ast.FunctionCall)
+    assert len(expr.parameters) == 20_001
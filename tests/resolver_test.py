@@ -0,0 +1,62 @@
+import pytest
+from compiler.interpreter import interpret
+from compiler.ir import IRVar
+from compiler.ir_generator import generate_ir
+from compiler.parser import parse
+from compiler.resolver import FREE, resolve
+from compiler.tokenizer import tokenize
+from compiler.type_checker import typecheck
+from compiler.types import Bool, Int, Type, Unit
+import compiler.ast as ast
+
+root_types: dict[IRVar, Type] = {IRVar('+'): Int, IRVar('print_int'): Unit, IRVar('print_bool'): Unit}
+
+def identifiers(node: ast.Expression) -> list[ast.Identifier]:
+    match node:
+        case ast.Identifier():
+            return [node]
+        case ast.VariableDeclaration():
+            return [node.variable]
+        case ast.BinaryOp():
+            return identifiers(node.left) + identifiers(node.right)
+        case ast.Block():
+            return [i for expr in node.expressions + [node.result] for i in identifiers(expr)]
+        case ast.FunctionCall():
+            return [i for expr in [node.function, *node.parameters] for i in identifiers(expr)]
+        case _:
+            return []
+
+def test_resolver_binds_block_variables() -> None:
+    tree = parse(tokenize("var a = 1; { var a = a; { a = 2; var a = 3 }; print_int(a) }"))
+    resolution = resolve(tree)
+    bindings = [(i.name, i.binding) for i in identifiers(tree)]
+    assert bindings == [('a', 0), ('a', 1), ('a', 1), ('a', 1), ('a', 2), ('print_int', FREE), ('a', 1)]
+    assert resolution.count == 3
+    assert resolution.shadows == [FREE, 0, 1]
+    assert resolution.redeclarations == set()
+
+def test_resolver_leaves_top_level_declarations_free() -> None:
+    tree = parse(tokenize("var a = 1"))
+    assert resolve(tree).count == 0
+    assert identifiers(tree)[0].binding == FREE
+
+def test_resolved_stages_keep_shadowing() -> None:
+    tree = parse(tokenize("{ var a = 1; { var a = true; a = false }; a + 1 }"))
+    assert typecheck(tree) == Int
+    assert interpret(tree) == 2
+    instructions = [str(i) for i in generate_ir(root_types, tree)]
+    assert instructions[-2:] == ['Call(+, [x2, x6], x7)', 'Call(print_int, [x7], x8)']
+
+def test_resolved_initializer_sees_shadowed_variable_in_ir() -> None:
+    tree = parse(tokenize("{ var a = 1; { var a: Int = a + 1; print_int(a) } }"))
+    assert typecheck(tree) == Unit
+    instructions = [str(i) for i in generate_ir(root_types, tree)]
+    assert instructions[:4] == ['LoadIntConst(1, x1)', 'Copy(x1, x2)', 'LoadIntConst(1, x3)', 'Call(+, [x2, x3], x4)']
+
+def test_resolved_redeclaration_fails_in_ir() -> None:
+    tree = parse(tokenize("{ var a = 1; var a = true; a }"))
+    assert typecheck(tree) == Bool
+    assert interpret(tree) == True
+    with pytest.raises(Exception) as e:
+        generate_ir(root_types, tree)
+    assert(e.value.args[0]) == "Local variable 'a' is already declared."
@@ -0,0 +1,44 @@
+import pytest
+from compiler.symtab import SymTab
+
+def test_symtab_scopes_shadow_and_restore() -> None:
+    sym_tab = SymTab[int]()
+    sym_tab.declare("a")
+    sym_tab.assign("a", 1)
+    sym_tab.enter_scope()
+    sym_tab.declare("a")
+    sym_tab.assign("a", 2)
+    sym_tab.declare("b")
+    sym_tab.assign("b", 3)
+    assert sym_tab.read("a") == 2
+    assert sym_tab.depth() == 1
+    sym_tab.exit_scope()
+    assert sym_tab.read("a") == 1
+    assert sym_tab.lookup("b") is None
+    assert sym_tab.stacks == {"a": [1]}
+
+def test_symtab_assign_updates_innermost_declaration() -> None:
+    sym_tab = SymTab[int]()
+    sym_tab.declare("a")
+    sym_tab.assign("a", 1)
+    sym_tab.enter_scope()
+    sym_tab.assign("a", 2)
+    sym_tab.exit_scope()
+    assert sym_tab.read("a") == 2
+
+def test_symtab_errors() -> None:
+    sym_tab = SymTab[int]()
+    sym_tab.declare("a")
+    with pytest.raises(Exception) as e:
+        sym_tab.declare("a")
+    assert(e.value.args[0]) == "Local variable 'a' is already declared."
+    with pytest.raises(Exception) as e:
+        sym_tab.read("a")
+    assert(e.value.args[0]) == "Variable 'a' has been declared but not defined."
+    with pytest.raises(Exception) as e:
+        sym_tab.assign("b", 1)
+    assert(e.value.args[0]) == "Variable 'b' is not declared."
+    sym_tab.enter_scope()
+    assert not sym_tab.is_local("a")
+    sym_tab.declare("a")
+    assert sym_tab.is_local("a")
@@ -1,4 +1,11 @@
-from compiler.tokenizer import tokenize, Token, L, Source
+import gc
+import io
+import mmap
+import tempfile
+import time
+from typing import Callable
+import pytest
+from compiler.tokenizer import tokenize, tokenize_buffer, tokenize_stream, Token, TokenKind, L, Source, SourceFile
 
 def test_tokenizer_basics() -> None:
     assert tokenize("if  3\nwhile") == [
@@ -107,7 +114,9 @@ def test_tokenizer_one_line_comments() -> None:
     ]
 
 def test_tokenizer_multi_line_comments() -> None:
-    assert tokenize("/*hello") == [Token(text="/", type="operator", source=L),Token(text="*", type="operator", source=L),Token(text="hello",type="identifier",source=L)]
+    with pytest.raises(Exception) as e:
+        tokenize("/*hello")
+    assert(e.value.args[0]) == ':0:0: unterminated comment'
     assert tokenize("hello*/") == [Token(text="hello",type="identifier",source=L),Token(text="*", type="operator", source=L),Token(text="/", type="operator", source=L)]
     assert tokenize("/*hello*/") == []
     assert tokenize("/*hello\nthere*/") == []
@@ -124,4 +133,110 @@ def test_tokenizer_source() -> None:
     assert tokenize("hello\nthere") == [Token(text="hello", type="identifier", source=Source('', 0, 0)),Token(text="there", type="identifier", source=Source('', 1, 0))]
     assert tokenize("#hello\nthere") == [Token(text="there", type="identifier", source=Source('', 1, 0))]
     assert tokenize("/*hello*/\nthere") == [Token(text="there", type="identifier", source=Source('', 1, 0))]
-    assert tokenize("/*hello\nhello*/\nhello there") == [Token(text="hello", type="identifier", source=Source('', 2, 0)), Token(text="there", type="identifier", source=Source('', 2, 6))]
\ No newline at end of file
+    assert tokenize("/*hello\nhello*/\nhello there") == [Token(text="hello", type="identifier", source=Source('', 2, 0)), Token(text="there", type="identifier", source=Source('', 2, 6))]
+
+def test_tokenizer_stream_matches_tokenize() -> None:
+    code = "var a = 1;\n/* comment\nover lines */ while a <= 10 do {\n    a = a + 1 # comment\n}\nprint_int(a) != b"
+    for chunk_size in [1, 2, 3, 7, 1000]:
+        assert list(tokenize_stream(io.StringIO(code), "file", chunk_size)) == tokenize(code, "file")
+        assert list(tokenize_stream(code.encode(), "file", chunk_size)) == tokenize(code, "file")
+
+def test_tokenizer_stream_source() -> None:
+    assert list(tokenize_stream(io.StringIO("/*hello\nhello*/\nhello there"), chunk_size=2)) == [
+        Token(text="hello", type="identifier", source=Source('', 2, 0)),
+        Token(text="there", type="identifier", source=Source('', 2, 6))
+    ]
+    assert list(tokenize_stream(io.StringIO("a /* b\nc\nd */ e"), chunk_size=3)) == [
+        Token(text="a", type="identifier", source=Source('', 0, 0)),
+        Token(text="e", type="identifier", source=Source('', 2, 5))
+    ]
+
+def test_tokenizer_stream_mmap() -> None:
+    with tempfile.TemporaryFile() as f:
+        f.write("x ä= 12\n/* ääää */ y".encode())
+        f.flush()
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+            assert list(tokenize_stream(m, chunk_size=3)) == [
+                Token(text="x", type="identifier", source=Source('', 0, 0)),
+                Token(text="=", type="operator", source=Source('', 0, 3)),
+                Token(text="12", type="int_literal", source=Source('', 0, 5)),
+                Token(text="y", type="identifier", source=Source('', 1, 11)),
+            ]
+
+def test_tokenizer_stream_unterminated_comment() -> None:
+    with pytest.raises(Exception) as e:
+        list(tokenize_stream(io.StringIO("a\n  /*hello\nthere"), chunk_size=4))
+    assert(e.value.args[0]) == ':1:2: unterminated comment'
+
+def test_tokenizer_buffer() -> None:
+    code = "var a = 1;\n/* two\nlines */ if a >= 10 then print_int(a)"
+    buffer = tokenize_buffer(code, "file")
+    assert len(buffer) == 14
+    assert list(buffer) == tokenize(code, "file")
+    assert [buffer[i] for i in range(len(buffer))] == tokenize(code, "file")
+    assert buffer.kind(0) == TokenKind.IDENTIFIER
+    assert buffer.kind(3) == TokenKind.INT_LITERAL
+    assert buffer.kind(7) == TokenKind.OPERATOR
+    assert buffer.text(7) == ">="
+    assert buffer.source(5) == Source("file", 2, 9)
+    assert buffer[-1] == Token(text=")", type="punctuation", source=Source("file", 2, 36))
+    assert buffer.text(0) is buffer.text(0)
+
+def test_tokenizer_lazy_source() -> None:
+    buffer = tokenize_buffer("a\n/* b\n */ c\n  d", "file")
+    assert list(buffer.file.line_starts) == [0, 2, 7, 13]
+    location = buffer.source(2)
+    assert str(location) == "file:3:2"
+    assert location == Source("file", 3, 2)
+    assert location != Source("file", 3, 3)
+    assert str(Source.at(SourceFile("other"), 0)) == "other:0:0"
+
+def test_tokenizer_unterminated_comment() -> None:
+    with pytest.raises(Exception) as e:
+        tokenize("a\nb /* c\n d */ e /* f\n g", "file")
+    assert(e.value.args[0]) == 'file:2:8: unterminated comment'
+    with pytest.raises(Exception) as e:
+        tokenize("/*/")
+    assert(e.value.args[0]) == ':0:0: unterminated comment'
+
+def tokenize_streamed(code: str) -> list[Token]:
+    return list(tokenize_stream(io.StringIO(code)))
+
+def pathological_code(n: int) -> list[str]:
+    return [
+        "/*" + "x\n" * n,
+        "/* " * n,
+        "/*" * n + "*/",
+        "/**/" * n,
+        "a /* b */ c " * (n // 4),
+        "/" * n + "*" * n,
+        "# comment\n" * n,
+        " \t " * n,
+    ]
+
+def tokenize_time(tokenizer: Callable[[str], list[Token]], code: str) -> float:
+    """The shortest of a few runs, which the load of the machine affects
+    least. The garbage collector is paused, as its pauses grow with the
+    number of tokens kept."""
+    times = []
+    gc.disable()
+    try:
+        for _ in range(3):
+            start = time.perf_counter()
+            try:
+                tokenizer(code)
+            except Exception as e:
+                assert "unterminated comment" in e.args[0]
+            times.append(time.perf_counter() - start)
+    finally:
+        gc.enable()
+    return min(times)
+
+def test_tokenizer_comments_take_linear_time() -> None:
+    # An input four times as long takes four times as long to scan in
+    # linear time, and sixteen times in quadratic time.
+    tokenizers: list[Callable[[str], list[Token]]] = [tokenize, tokenize_streamed]
+    for code, longer in zip(pathological_code(5_000), pathological_code(20_000)):
+        for tokenizer in tokenizers:
+            ratio = tokenize_time(tokenizer, longer) / tokenize_time(tokenizer, code)
+            assert ratio < 10, (code[:10], tokenizer.__name__, ratio)
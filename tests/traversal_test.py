@@ -0,0 +1,84 @@
+import pytest
+from compiler.interpreter import interpret
+from compiler.ir import IRVar
+from compiler.ir_generator import generate_ir
+from compiler.parser import parse
+from compiler.tokenizer import L, tokenize_buffer
+from compiler.traversal import Visit, traverse
+from compiler.type_checker import typecheck
+from compiler.types import Int, Unit
+import compiler.ast as ast
+
+def test_traverse_sends_results_and_raises_in_parent() -> None:
+    tree = ast.BinaryOp(L, ast.Literal(L, 1), "+", ast.UnaryOp(L, "-", ast.Literal(L, 2)))
+    exited: list[str] = []
+
+    def enter(node: ast.Expression) -> Visit[int] | int:
+        match node:
+            case ast.Literal():
+                if node.value == 2:
+                    raise Exception("two")
+                return 1
+            case _:
+                return visit(node)
+
+    def visit(node: ast.Expression) -> Visit[int]:
+        match node:
+            case ast.BinaryOp():
+                left = yield node.left
+                try:
+                    return left + (yield node.right)
+                except Exception as e:
+                    return 100
+            case ast.UnaryOp():
+                return -(yield node.right)
+        return 0
+
+    assert traverse(tree, enter, lambda node, value: exited.append(f"{node}={value}")) == 100
+    assert exited == ["1=1", "1 + - 2=100"]
+    with pytest.raises(Exception) as e:
+        traverse(tree.right, enter)
+    assert(e.value.args[0]) == "two"
+
+def test_traverse_raises_exit_errors_in_parent() -> None:
+    tree = ast.BinaryOp(L, ast.Literal(L, 1), "+", ast.UnaryOp(L, "-", ast.Literal(L, 2)))
+    caught: list[str] = []
+
+    def enter(node: ast.Expression) -> Visit[int] | int:
+        if isinstance(node, ast.Literal):
+            return 1
+        return visit(node)
+
+    def visit(node: ast.Expression) -> Visit[int]:
+        if isinstance(node, ast.UnaryOp):
+            return -(yield node.right)
+        assert isinstance(node, ast.BinaryOp)
+        try:
+            yield node.right
+        except Exception as e:
+            caught.append(e.args[0])
+        return 7
+
+    failing: list[ast.Expression] = [tree.right.right] # type: ignore[attr-defined]
+
+    def exit(node: ast.Expression, value: int) -> None:
+        if node in failing:
+            raise Exception(f"exit {node}")
+
+    # A leaf's exit, and the exit of a node with children.
+    assert traverse(tree, enter, exit) == 7
+    failing[0] = tree.right
+    assert traverse(tree, enter, exit) == 7
+    assert caught == ["exit 2", "exit - 2"]
+    with pytest.raises(Exception, match="exit - 2"):
+        traverse(tree.right, enter, exit)
+
+def test_stages_run_deep_trees() -> None:
+    depth = 20_000
+    chain = parse(tokenize_buffer("{ var a = 1; " + "a + " * depth + "a }"))
+    assert typecheck(chain) == Int
+    assert interpret(chain) == depth + 1
+    root_types = {IRVar('+'): Int, IRVar('print_int'): Unit, IRVar('print_bool'): Unit}
+    assert len(generate_ir(root_types, chain)) == depth + 3
+    nested = parse(tokenize_buffer("{" * depth + "true" + "}" * depth))
+    assert interpret(nested) == True
@@ -1,8 +1,9 @@
 import pytest
-from compiler.type_checker import typecheck, SymTab
-from compiler.tokenizer import L
+from compiler.parser import parse
+from compiler.type_checker import Diagnostic, typecheck, SymTab
+from compiler.tokenizer import L, tokenize
 import compiler.ast as ast
-from compiler.types import Any, Unit, Int, Bool, FunType
+from compiler.types import Any, Unit, Int, Bool, Error, FunType
 
 def test_type_checker_literal() -> None:
     assert(typecheck(ast.Literal(L, None))) == Unit
@@ -351,4 +352,25 @@ def test_type_checker_initializes_types() -> None:
     result = typecheck(expr, sym_tab)
     assert(expr.type) == result
     assert(expr.left.type) == result
-    assert(expr.right.type) == result
\ No newline at end of file
+    assert(expr.right.type) == result
+
+def test_type_checker_collects_diagnostics() -> None:
+    tree = parse(tokenize("var a: Int = true; var b = 1 + false; if 1 then b; c; b * 2"))
+    diagnostics: list[Diagnostic] = []
+    assert typecheck(tree, diagnostics=diagnostics) == Error
+    assert [(d.location.column, d.code) for d in diagnostics] == [
+        (11, 'assignment-type'), (29, 'operand-type'), (41, 'condition-type'), (51, 'undeclared')
+    ]
+    assert diagnostics[0].message == "Left and right of '=' are of different types. Int != Bool"
+    assert isinstance(tree, ast.Block)
+    assert [expr.type for expr in tree.expressions] == [Error, Error, Error, Error]
+
+def test_type_checker_diagnostics_skip_errors_caused_by_errors() -> None:
+    source = "{ var a = 1; a = f(a) + true; while a do 1 }"
+    with pytest.raises(Exception) as e:
+        typecheck(parse(tokenize(source)))
+    diagnostics: list[Diagnostic] = []
+    typecheck(parse(tokenize(source)), diagnostics=diagnostics)
+    assert [d.message for d in diagnostics] == [
+        e.value.args[0], "Expected condition to be of type 'Bool', but received 'Int'."
+    ]
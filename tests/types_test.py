@@ -0,0 +1,18 @@
+import copy
+from compiler.types import Any, Bool, FunType, Int, TypeInt, Unit
+
+def test_types_are_interned() -> None:
+    assert FunType([Int, Bool], Unit) is FunType((Int, Bool), Unit)
+    assert FunType((Int,), Unit) is not FunType((Bool,), Unit)
+    assert TypeInt() is Int
+    assert copy.deepcopy(FunType((Int,), Any)) is FunType((Int,), Any)
+    assert {FunType((Int,), Int): 1}[FunType([Int], Int)] == 1
+
+def test_types_subtyping() -> None:
+    assert Int <= Any and not Any <= Int
+    assert Any >= Bool and not Bool >= Any
+    assert Int < Any and not Int < Int
+    assert not Int <= Bool
+    assert FunType((Int,), Int) <= FunType((), Bool)
+    assert FunType((Int,), Int) < FunType((), Bool)
+    assert not FunType((Int,), Int) < FunType((Int,), Int)
@@ -0,0 +1,86 @@
+import io
+import pytest
+from compiler.parser import parse
+from compiler.tokenizer import tokenize
+from compiler.type_checker import typecheck
+from compiler import __main__, ast, resolver, type_checker, vm
+from compiler.interpreter import interpret
+
+def run(source: str, stdin: str = "") -> str:
+    tree = parse(tokenize(source))
+    typecheck(tree)
+    output = io.StringIO()
+    vm.run(vm.compile_program(tree), io.StringIO(stdin), output)
+    return output.getvalue()
+
+def test_vm_loops_and_prints() -> None:
+    source = """
+        var n = read_int();
+        var i = 0;
+        var s = 0;
+        while true do {
+            i = i + 1;
+            if i % 2 == 0 then continue;
+            if i > n then break;
+            s = s + { var x = i; x * x };
+            print_bool(i > 3 and not (i == 5))
+        };
+        s
+    """
+    assert run(source, "7\n") == "false\nfalse\nfalse\ntrue\n84\n"
+    assert run("var x = 1; x = 2") == "2\n"
+    assert run("var x = 1") == ""
+    assert run("{ var x = 1; if x < 2 then x = 3; x }") == "3\n"
+
+def test_vm_integers() -> None:
+    assert run("var x = 9223372036854775807; x + 1") == "-9223372036854775808\n"
+    assert run("-7 / 2") == "-3\n"
+    assert run("-7 % 2") == "-1\n"
+    assert run("read_int()", "--12a3\n") == "123\n"
+    with pytest.raises(Exception, match="Division by zero"):
+        run("var x = 0; 1 / x")
+
+def test_vm_division_like_the_interpreter() -> None:
+    # Division and remainders round towards zero in every engine.
+    for source in [
+        "var x = 0 - 7; x % 2",
+        "var x = 0 - 7; x / 2",
+        "var x = 7; x % -2",
+        "var x = -7; x % -2",
+        "var x = -7; x / -2",
+        "var x = -9223372036854775807 - 1; x / -1",
+        "var x = -9223372036854775807 - 1; x % -1",
+        "var x = -9223372036854775807 - 1; x % 10",
+    ]:
+        expected = run(source)
+        for transpile in (True, False):
+            for closures in (True, False):
+                tree = parse(tokenize(source))
+                typecheck(tree)
+                assert f"{interpret(tree, closures=closures, transpile=transpile)}\n" == expected, source
+
+def test_vm_bytecode_round_trip() -> None:
+    tree = parse(tokenize("var i = 0; while i < 3 do i = i + 1; i"))
+    typecheck(tree)
+    program = vm.compile_program(tree)
+    loaded = vm.Program.from_bytes(program.to_bytes())
+    assert loaded == program
+    assert vm.disassemble(loaded) == vm.disassemble(program)
+    output = io.StringIO()
+    vm.run(loaded, stdout=output)
+    assert output.getvalue() == "3\n"
+    with pytest.raises(Exception, match="Not a bytecode program"):
+        vm.Program.from_bytes(b"\0" * vm.HEADER.size)
+
+def test_bytecode_compiler_resolves_once(monkeypatch: pytest.MonkeyPatch) -> None:
+    calls: list[object] = []
+    def resolve(root: ast.Expression) -> resolver.Resolution:
+        calls.append(root)
+        return resolver.resolve(root)
+    for module in [__main__, type_checker, vm]:
+        monkeypatch.setattr(module, "resolve", resolve)
+    program = __main__.call_bytecode_compiler("var x = 1; { var y = x; y + 1 }", "t")
+    output = io.StringIO()
+    vm.run(program, io.StringIO(), output)
+    assert output.getvalue() == "2\n"
+    assert len(calls) == 1